@@ -0,0 +1,269 @@
+import argparse
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from armazenamento import get_armazenamento, get_armazenamento_assincrono
+
+# --- Agenda de lembretes ---
+# Em vez de percorrer todos os lembretes de todos os utilizadores a cada
+# /check_reminders, cada lembrete fica num "balde" pelo dia em que deve ser
+# avisado (2 dias antes do vencimento). Os baldes são mantidos por
+# salvar_lembrete_db / apagar_lembrete_db, no bloqueio do utilizador junto com
+# a gravação do lembrete, e a verificação diária só lê o balde de hoje (mais
+# os dos vencimentos nos dias 1 e 2, cujo dia de aviso depende do mês). Os
+# envios são feitos em paralelo com um limite de mensagens por segundo, e cada
+# envio fica registado por data, por isso repetir a verificação no mesmo dia
+# não volta a enviar. Os registos dos envios de há mais de DIAS_REGISTO_ENVIOS
+# dias são apagados pela própria verificação.
+#
+# Cada balde é repartido pelo user_id em NUM_PARTES_AGENDA chaves
+# ("agenda_dia_<balde>_<parte>"), cada uma com a sua trava: gravar ou apagar
+# um lembrete reescreve só a parte do utilizador, e utilizadores de partes
+# diferentes não esperam uns pelos outros.
+#
+# Gravar ou apagar um lembrete atualiza sempre a agenda, mesmo antes de ela
+# estar construída, e a reconstrução lê e grava cada parte dentro da trava
+# dessa parte. Um lembrete gravado durante a reconstrução ou já está na
+# leitura da sua parte, ou é indexado depois de a parte ser gravada; nunca
+# fica de fora.
+#
+# Linha de comandos (para construir a agenda a partir dos lembretes existentes):
+#   python agenda_lembretes.py reconstruir
+
+# As chaves da agenda são globais; ficam guardadas sob este "utilizador".
+USUARIO_AGENDA = "sistema"
+
+LEMBRETES_POR_SEGUNDO = float(os.environ.get("LALABANK_LEMBRETES_POR_SEGUNDO", 20))
+CONCORRENCIA_ENVIOS = int(os.environ.get("LALABANK_LEMBRETES_CONCORRENCIA", 8))
+DIAS_REGISTO_ENVIOS = 3
+NUM_PARTES_AGENDA = 16
+# Muda quando a forma das chaves da agenda muda; uma agenda de outra versão é reconstruída.
+VERSAO_AGENDA = 2
+
+def dia_aviso(dia_vencimento, hoje):
+    """Dia do mês em que o lembrete deve ser avisado (2 dias antes do vencimento)."""
+    dia_para_avisar = dia_vencimento - 2
+    if dia_para_avisar <= 0:
+        data_aviso = datetime(hoje.year, hoje.month, dia_vencimento) - timedelta(days=2)
+        dia_para_avisar = data_aviso.day
+    return dia_para_avisar
+
+def _balde(dia_vencimento):
+    # Vencimentos nos dias 1 e 2 são avisados no mês anterior, num dia que depende do mês.
+    return str(dia_vencimento - 2) if dia_vencimento > 2 else f"v{dia_vencimento}"
+
+def _baldes_do_dia(hoje):
+    baldes = [str(hoje.day)]
+    baldes += [_balde(v) for v in (1, 2) if dia_aviso(v, hoje) == hoje.day]
+    return baldes
+
+def _parte(user_id):
+    # crc32 e não hash(): a parte tem de ser a mesma em todos os processos.
+    return zlib.crc32(user_id.encode()) % NUM_PARTES_AGENDA
+
+def _chave_balde(balde, parte):
+    return f"agenda_dia_{balde}_{parte}"
+
+def _bloqueio_parte(parte):
+    # As chaves ficam todas sob USUARIO_AGENDA, mas cada parte tem a sua trava.
+    return get_armazenamento().bloqueio_global(f"{USUARIO_AGENDA}_{parte}")
+
+def _entrada(user_id, lembrete):
+    return {
+        'user_id': user_id, 'timestamp': lembrete.get('timestamp'), 'descricao': lembrete['descricao'],
+        'valor': lembrete['valor'], 'dia_vencimento': lembrete['dia_vencimento']
+    }
+
+def _agenda_construida():
+    return get_armazenamento().ler(USUARIO_AGENDA, "agenda_versao", 0) == VERSAO_AGENDA
+
+# --- Manutenção do índice ---
+
+def indexar_lembrete(user_id, lembrete):
+    armazenamento = get_armazenamento()
+    parte = _parte(user_id)
+    chave = _chave_balde(_balde(lembrete['dia_vencimento']), parte)
+    with _bloqueio_parte(parte):
+        balde = armazenamento.ler(USUARIO_AGENDA, chave, [])
+        # Já lá está se a reconstrução desta parte o leu depois de ser gravado.
+        if any(e['user_id'] == user_id and e['timestamp'] == lembrete.get('timestamp') for e in balde):
+            return
+        balde.append(_entrada(user_id, lembrete))
+        armazenamento.gravar(USUARIO_AGENDA, chave, balde)
+
+def desindexar_lembretes(user_id, lembretes):
+    if not lembretes:
+        return
+    armazenamento = get_armazenamento()
+    parte = _parte(user_id)
+    with _bloqueio_parte(parte):
+        for lembrete in lembretes:
+            chave = _chave_balde(_balde(lembrete['dia_vencimento']), parte)
+            balde = armazenamento.ler(USUARIO_AGENDA, chave, [])
+            restantes = [e for e in balde if not (e['user_id'] == user_id and e['timestamp'] == lembrete.get('timestamp'))]
+            if len(restantes) != len(balde):
+                armazenamento.gravar(USUARIO_AGENDA, chave, restantes)
+
+def reconstruir_agenda():
+    """Constrói todos os baldes a partir dos lembretes guardados, parte a parte; devolve quantos lembretes indexou."""
+    armazenamento = get_armazenamento()
+    nomes = {_balde(v) for v in range(1, 32)}
+    total = 0
+    for parte in range(NUM_PARTES_AGENDA):
+        with _bloqueio_parte(parte):
+            # Utilizadores lidos dentro da trava: quem gravou o primeiro lembrete antes dela está incluído.
+            baldes = {balde: [] for balde in nomes}
+            for user_id in armazenamento.usuarios("lembretes"):
+                if _parte(user_id) != parte:
+                    continue
+                for lembrete in armazenamento.listar(user_id, "lembretes"):
+                    baldes[_balde(lembrete['dia_vencimento'])].append(_entrada(user_id, lembrete))
+            for balde, entradas in baldes.items():
+                armazenamento.gravar(USUARIO_AGENDA, _chave_balde(balde, parte), entradas)
+            total += sum(len(entradas) for entradas in baldes.values())
+    with armazenamento.bloqueio_global(USUARIO_AGENDA):
+        # Chaves da versão 1 (um balde numa só chave)
+        for balde in nomes:
+            armazenamento.apagar(USUARIO_AGENDA, f"agenda_dia_{balde}")
+        armazenamento.apagar(USUARIO_AGENDA, "agenda_construida")
+        armazenamento.gravar(USUARIO_AGENDA, "agenda_versao", VERSAO_AGENDA)
+    return total
+
+# --- Envio ---
+
+class LimiteTaxa:
+    """Limita o número de operações por segundo entre várias threads."""
+
+    def __init__(self, por_segundo):
+        self.intervalo = 1 / por_segundo if por_segundo > 0 else 0
+        self._proximo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self):
+        """Reserva a próxima vaga e devolve quantos segundos faltam para ela."""
+        with self._lock:
+            agora = time.monotonic()
+            espera = self._proximo - agora
+            self._proximo = max(agora, self._proximo) + self.intervalo
+        return max(espera, 0)
+
+    def aguardar(self):
+        espera = self.reservar()
+        if espera > 0:
+            time.sleep(espera)
+
+def mensagem_lembrete(lembrete):
+    return (
+        f"🔔 Lembrete de Pagamento!\n\n"
+        f"Conta: {lembrete['descricao']}\n"
+        f"Valor: R$ {lembrete['valor']:.2f}\n"
+        f"Vence no dia: {lembrete['dia_vencimento']}"
+    )
+
+def lembretes_pendentes(hoje):
+    """[(identificador, entrada), ...] dos lembretes a avisar hoje que ainda não foram enviados."""
+    armazenamento = get_armazenamento()
+    if not _agenda_construida():
+        reconstruir_agenda()
+
+    enviados = set(armazenamento.ler(USUARIO_AGENDA, f"agenda_enviados_{hoje.strftime('%Y-%m-%d')}", []))
+    pendentes = []
+    for balde in _baldes_do_dia(hoje):
+        for entrada in (e for parte in range(NUM_PARTES_AGENDA)
+                        for e in armazenamento.ler(USUARIO_AGENDA, _chave_balde(balde, parte), [])):
+            identificador = f"{entrada['user_id']}|{entrada['timestamp']}"
+            if identificador not in enviados:
+                pendentes.append((identificador, entrada))
+    return pendentes
+
+def marcar_enviados(hoje, identificadores):
+    armazenamento = get_armazenamento()
+    dia = hoje.strftime('%Y-%m-%d')
+    chave_enviados = f"agenda_enviados_{dia}"
+    # Relê a lista para juntar envios feitos por outra execução em simultâneo.
+    with armazenamento.bloqueio_global(USUARIO_AGENDA):
+        enviados = set(armazenamento.ler(USUARIO_AGENDA, chave_enviados, [])) | set(identificadores)
+        armazenamento.gravar(USUARIO_AGENDA, chave_enviados, sorted(enviados))
+        # Os dias com registo, para que limpar_enviados não tenha de adivinhar as chaves.
+        dias = armazenamento.ler(USUARIO_AGENDA, "agenda_enviados_dias", [])
+        if dia not in dias:
+            armazenamento.gravar(USUARIO_AGENDA, "agenda_enviados_dias", dias + [dia])
+
+def limpar_enviados(hoje):
+    """Apaga os registos de envios de há mais de DIAS_REGISTO_ENVIOS dias; devolve quantos dias foram apagados."""
+    armazenamento = get_armazenamento()
+    limite = (hoje - timedelta(days=DIAS_REGISTO_ENVIOS)).strftime('%Y-%m-%d')
+    with armazenamento.bloqueio_global(USUARIO_AGENDA):
+        dias = armazenamento.ler(USUARIO_AGENDA, "agenda_enviados_dias", [])
+        antigos = [dia for dia in dias if dia < limite]
+        if not antigos:
+            return 0
+        for dia in antigos:
+            armazenamento.apagar(USUARIO_AGENDA, f"agenda_enviados_{dia}")
+        armazenamento.gravar(USUARIO_AGENDA, "agenda_enviados_dias", [dia for dia in dias if dia >= limite])
+    return len(antigos)
+
+def executar_agenda(enviar, hoje=None):
+    """
+    Envia os lembretes a avisar hoje que ainda não foram enviados.
+    enviar(user_id, mensagem) deve devolver True se a mensagem foi aceite.
+    Devolve o número de lembretes enviados nesta execução.
+    """
+    hoje = hoje or datetime.now()
+    limpar_enviados(hoje)
+    pendentes = lembretes_pendentes(hoje)
+    if not pendentes:
+        return 0
+
+    limite = LimiteTaxa(LEMBRETES_POR_SEGUNDO)
+
+    def enviar_um(entrada):
+        limite.aguardar()
+        print(f"Enviando lembrete para {entrada['user_id']} sobre '{entrada['descricao']}'")
+        return enviar(entrada['user_id'], mensagem_lembrete(entrada))
+
+    with ThreadPoolExecutor(max_workers=CONCORRENCIA_ENVIOS) as executor:
+        resultados = list(executor.map(enviar_um, [e for _, e in pendentes]))
+
+    novos = [identificador for (identificador, _), ok in zip(pendentes, resultados) if ok]
+    if novos:
+        marcar_enviados(hoje, novos)
+    return len(novos)
+
+async def executar_agenda_assincrona(enviar, hoje=None):
+    """
+    Como executar_agenda, com enviar(user_id, mensagem) assíncrono (assincrono.py):
+    os envios só são limitados por LEMBRETES_POR_SEGUNDO, não por threads.
+    """
+    import asyncio
+    hoje = hoje or datetime.now()
+    armazenamento = get_armazenamento_assincrono()
+    await armazenamento.executar(limpar_enviados, hoje)
+    pendentes = await armazenamento.executar(lembretes_pendentes, hoje)
+    if not pendentes:
+        return 0
+
+    limite = LimiteTaxa(LEMBRETES_POR_SEGUNDO)
+
+    async def enviar_um(entrada):
+        await asyncio.sleep(limite.reservar())
+        print(f"Enviando lembrete para {entrada['user_id']} sobre '{entrada['descricao']}'")
+        return await enviar(entrada['user_id'], mensagem_lembrete(entrada))
+
+    resultados = await asyncio.gather(*(enviar_um(e) for _, e in pendentes))
+    novos = [identificador for (identificador, _), ok in zip(pendentes, resultados) if ok]
+    if novos:
+        await armazenamento.executar(marcar_enviados, hoje, novos)
+    return len(novos)
+
+def main():
+    parser = argparse.ArgumentParser(description="Agenda de lembretes.")
+    parser.add_argument('comando', choices=['reconstruir'])
+    parser.parse_args()
+    print(f"{reconstruir_agenda()} lembretes indexados")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+import argparse
+import calendar
+from datetime import date, timedelta
+from armazenamento import get_armazenamento
+
+# --- Agregados materializados ---
+# Para cada utilizador guardamos agregados em vários níveis, atualizados em cada
+# salvar_transacao_db / apagar_transacao_db:
+#   "agregados_total"           todo o histórico (usado pelo dashboard)
+#   "agregados_ano_<AAAA>"      um por ano
+#   "agregados_<AAAA-MM>"       um por mês
+#   "agregados_dias_<AAAA-MM>"  os dias do mês: {"DD": agregado}
+# Um intervalo de datas é respondido com o menor número de leituras: anos
+# inteiros, depois meses inteiros, e só os meses incompletos vão aos dias
+# (ver agregado_do_intervalo e relatorios.py).
+#
+# Utilizadores antigos (sem "agregados_total") são reconstruídos a partir do
+# histórico na primeira leitura; até lá as atualizações incrementais são ignoradas.
+# Atualizações e reconstruções correm dentro do bloqueio do utilizador
+# (armazenamento.py), por isso não se perdem somas de escritas simultâneas.
+# Os que só têm total e meses (antes de VERSAO_AGREGADOS) continuam a ser
+# atualizados nesses níveis e ganham os dias e anos na primeira leitura de um
+# intervalo.
+#
+# Linha de comandos:
+#   python agregados.py verificar <user_id> [<user_id> ...]
+#   python agregados.py reconstruir <user_id> [<user_id> ...]
+#   (sem user_ids: todos os utilizadores com transações)
+
+TOLERANCIA = 0.005
+VERSAO_AGREGADOS = 2  # 2: agregados diários e anuais
+
+def agregado_vazio():
+    return {
+        'n': 0, 'receitas': 0, 'despesas': 0,
+        'despesas_metodo': {},    # metodo -> despesas
+        'contas': {},             # conta -> {'receitas', 'despesas'} (receitas e despesas no débito)
+        'cartoes': {},            # cartao -> despesas no crédito
+        'categorias': {},         # categoria -> despesas
+        'categorias_metodo': {},  # metodo -> {categoria -> despesas}
+    }
+
+def _somar_em(dicionario, chave, valor):
+    dicionario[chave] = dicionario.get(chave, 0) + valor
+
+def somar_transacao(agregado, t, sinal=1):
+    """Soma (sinal=1) ou subtrai (sinal=-1) uma transação ao agregado, com as regras do dashboard."""
+    tipo, metodo = t.get('tipo'), t.get('metodo')
+    valor = (t.get('valor') or 0) * sinal
+    agregado['n'] += sinal
+
+    if tipo == 'receita':
+        agregado['receitas'] += valor
+    elif tipo == 'despesa':
+        categoria = t.get('categoria') or 'Outros'
+        agregado['despesas'] += valor
+        _somar_em(agregado['categorias'], categoria, valor)
+        if metodo:
+            _somar_em(agregado['despesas_metodo'], metodo, valor)
+            _somar_em(agregado['categorias_metodo'].setdefault(metodo, {}), categoria, valor)
+        if metodo == 'crédito' and t.get('cartao'):
+            _somar_em(agregado['cartoes'], t['cartao'], valor)
+
+    conta = t.get('conta')
+    if conta and (tipo == 'receita' or metodo == 'débito'):
+        saldo = agregado['contas'].setdefault(conta, {'receitas': 0, 'despesas': 0})
+        if tipo == 'receita':
+            saldo['receitas'] += valor
+        elif tipo == 'despesa':
+            saldo['despesas'] += valor
+    return agregado
+
+def copiar_agregado(agregado):
+    copia = dict(agregado)
+    for campo in ('despesas_metodo', 'cartoes', 'categorias'):
+        copia[campo] = dict(agregado.get(campo, {}))
+    copia['contas'] = {c: dict(v) for c, v in agregado.get('contas', {}).items()}
+    copia['categorias_metodo'] = {m: dict(v) for m, v in agregado.get('categorias_metodo', {}).items()}
+    return copia
+
+def somar_agregado(destino, origem):
+    """Soma um agregado a outro (ex.: os meses de um intervalo)."""
+    destino['n'] += origem.get('n', 0)
+    destino['receitas'] += origem.get('receitas', 0)
+    destino['despesas'] += origem.get('despesas', 0)
+    for campo in ('despesas_metodo', 'cartoes', 'categorias'):
+        for chave, valor in origem.get(campo, {}).items():
+            _somar_em(destino[campo], chave, valor)
+    for conta, saldo in origem.get('contas', {}).items():
+        destino_conta = destino['contas'].setdefault(conta, {'receitas': 0, 'despesas': 0})
+        destino_conta['receitas'] += saldo.get('receitas', 0)
+        destino_conta['despesas'] += saldo.get('despesas', 0)
+    for metodo, categorias in origem.get('categorias_metodo', {}).items():
+        destino_metodo = destino['categorias_metodo'].setdefault(metodo, {})
+        for categoria, valor in categorias.items():
+            _somar_em(destino_metodo, categoria, valor)
+    return destino
+
+def _niveis(t):
+    """(mês, ano, dia) da transação; sem timestamp só entra no total e em 'sem_data'."""
+    timestamp = t.get('timestamp') or ''
+    mes = timestamp[:7] or 'sem_data'
+    if mes == 'sem_data':
+        return mes, None, None
+    return mes, mes[:4], timestamp[8:10]
+
+def calcular_agregados(transacoes):
+    """Calcula (total, {ano: agregado}, {mes: agregado}, {mes: {dia: agregado}}) a partir de uma lista de transações."""
+    total, por_ano, por_mes, por_dia = agregado_vazio(), {}, {}, {}
+    for t in transacoes:
+        mes, ano, dia = _niveis(t)
+        somar_transacao(total, t)
+        somar_transacao(por_mes.setdefault(mes, agregado_vazio()), t)
+        if ano is not None:
+            somar_transacao(por_ano.setdefault(ano, agregado_vazio()), t)
+            somar_transacao(por_dia.setdefault(mes, {}).setdefault(dia, agregado_vazio()), t)
+    return total, por_ano, por_mes, por_dia
+
+# --- Persistência ---
+
+def atualizar_agregados(user_id, transacoes, sinal=1):
+    """Aplica transações novas (sinal=1) ou apagadas (sinal=-1) aos agregados guardados."""
+    if not transacoes:
+        return
+    armazenamento = get_armazenamento()
+    with armazenamento.bloqueio(user_id):
+        total = armazenamento.ler(user_id, "agregados_total", None)
+        if total is None:
+            return  # Ainda não materializado: será reconstruído na próxima leitura.
+
+        com_niveis = armazenamento.ler(user_id, "agregados_versao", 1) >= VERSAO_AGREGADOS
+
+        por_ano, por_mes, por_dia, meses_novos = {}, {}, {}, []
+        for t in transacoes:
+            mes, ano, dia = _niveis(t)
+            if mes not in por_mes:
+                por_mes[mes] = armazenamento.ler(user_id, f"agregados_{mes}", None)
+                if por_mes[mes] is None:
+                    por_mes[mes] = agregado_vazio()
+                    meses_novos.append(mes)
+            somar_transacao(por_mes[mes], t, sinal)
+            somar_transacao(total, t, sinal)
+
+            if com_niveis and ano is not None:
+                if ano not in por_ano:
+                    por_ano[ano] = armazenamento.ler(user_id, f"agregados_ano_{ano}", None) or agregado_vazio()
+                if mes not in por_dia:
+                    por_dia[mes] = armazenamento.ler(user_id, f"agregados_dias_{mes}", None) or {}
+                somar_transacao(por_ano[ano], t, sinal)
+                somar_transacao(por_dia[mes].setdefault(dia, agregado_vazio()), t, sinal)
+
+        for mes, agregado in por_mes.items():
+            armazenamento.gravar(user_id, f"agregados_{mes}", agregado)
+        for mes, dias in por_dia.items():
+            armazenamento.gravar(user_id, f"agregados_dias_{mes}", dias)
+        for ano, agregado in por_ano.items():
+            armazenamento.gravar(user_id, f"agregados_ano_{ano}", agregado)
+        if meses_novos:
+            meses = armazenamento.ler(user_id, "agregados_meses", [])
+            armazenamento.gravar(user_id, "agregados_meses", sorted(set(meses) | set(meses_novos)))
+        armazenamento.gravar(user_id, "agregados_total", total)
+
+def reconstruir_agregados(user_id):
+    """Recalcula e grava todos os agregados do utilizador a partir do histórico."""
+    armazenamento = get_armazenamento()
+    with armazenamento.bloqueio(user_id):
+        total, por_ano, por_mes, por_dia = calcular_agregados(armazenamento.listar(user_id, "transacoes"))
+        meses_antigos = armazenamento.ler(user_id, "agregados_meses", [])
+        for mes in meses_antigos:
+            if mes not in por_mes:
+                armazenamento.gravar(user_id, f"agregados_{mes}", agregado_vazio())
+                armazenamento.gravar(user_id, f"agregados_dias_{mes}", {})
+        for ano in {mes[:4] for mes in meses_antigos if mes != 'sem_data'} - set(por_ano):
+            armazenamento.gravar(user_id, f"agregados_ano_{ano}", agregado_vazio())
+        for mes, agregado in por_mes.items():
+            armazenamento.gravar(user_id, f"agregados_{mes}", agregado)
+        for mes, dias in por_dia.items():
+            armazenamento.gravar(user_id, f"agregados_dias_{mes}", dias)
+        for ano, agregado in por_ano.items():
+            armazenamento.gravar(user_id, f"agregados_ano_{ano}", agregado)
+        armazenamento.gravar(user_id, "agregados_meses", sorted(por_mes))
+        armazenamento.gravar(user_id, "agregados_total", total)
+        armazenamento.gravar(user_id, "agregados_versao", VERSAO_AGREGADOS)
+        return total
+
+def get_agregado_total(user_id):
+    total = get_armazenamento().ler(user_id, "agregados_total", None)
+    return total if total is not None else reconstruir_agregados(user_id)
+
+def get_agregado_mes(user_id, mes):
+    if get_armazenamento().ler(user_id, "agregados_total", None) is None:
+        reconstruir_agregados(user_id)
+    return get_armazenamento().ler(user_id, f"agregados_{mes}", None) or agregado_vazio()
+
+# --- Intervalos de datas ---
+
+def _ultimo_dia(d):
+    return d.replace(day=calendar.monthrange(d.year, d.month)[1])
+
+def decompor_intervalo(inicio, fim):
+    """
+    Divide [inicio, fim] (datas, inclusive) nos agregados que o cobrem:
+    ('ano', 'AAAA'), ('mes', 'AAAA-MM') ou ('dias', 'AAAA-MM', primeiro_dia, ultimo_dia).
+    """
+    partes, d = [], inicio
+    while d <= fim:
+        ultimo_dia_mes = _ultimo_dia(d)
+        if d.month == 1 and d.day == 1 and date(d.year, 12, 31) <= fim:
+            partes.append(('ano', f"{d.year:04d}"))
+            d = date(d.year + 1, 1, 1)
+        elif d.day == 1 and ultimo_dia_mes <= fim:
+            partes.append(('mes', f"{d:%Y-%m}"))
+            d = ultimo_dia_mes + timedelta(days=1)
+        else:
+            ate = min(ultimo_dia_mes, fim)
+            partes.append(('dias', f"{d:%Y-%m}", d.day, ate.day))
+            d = ate + timedelta(days=1)
+    return partes
+
+def _garantir_niveis(user_id):
+    armazenamento = get_armazenamento()
+    if (armazenamento.ler(user_id, "agregados_total", None) is None
+            or armazenamento.ler(user_id, "agregados_versao", 1) < VERSAO_AGREGADOS):
+        reconstruir_agregados(user_id)
+
+def _ler_parte(user_id, parte):
+    armazenamento = get_armazenamento()
+    if parte[0] == 'ano':
+        return armazenamento.ler(user_id, f"agregados_ano_{parte[1]}", None) or agregado_vazio()
+    if parte[0] == 'mes':
+        return armazenamento.ler(user_id, f"agregados_{parte[1]}", None) or agregado_vazio()
+    _, mes, primeiro, ultimo = parte
+    resultado = agregado_vazio()
+    for dia, agregado in (armazenamento.ler(user_id, f"agregados_dias_{mes}", None) or {}).items():
+        if primeiro <= int(dia) <= ultimo:
+            somar_agregado(resultado, agregado)
+    return resultado
+
+def agregado_do_intervalo(user_id, inicio, fim):
+    """Agregado das transações com data em [inicio, fim] (datas, inclusive), somando os níveis guardados."""
+    _garantir_niveis(user_id)
+    resultado = agregado_vazio()
+    for parte in decompor_intervalo(inicio, fim):
+        somar_agregado(resultado, _ler_parte(user_id, parte))
+    return resultado
+
+def agregados_por_mes(user_id, inicio, fim):
+    """
+    {'AAAA-MM': agregado} de cada mês de [inicio, fim]; os meses incompletos só contam os dias do intervalo.
+    Os agregados devolvidos são cópias e podem ser alterados.
+    """
+    _garantir_niveis(user_id)
+    por_mes = {}
+    for parte in decompor_intervalo(inicio, fim):
+        if parte[0] == 'ano':
+            for mes in range(1, 13):
+                chave = f"{parte[1]}-{mes:02d}"
+                por_mes[chave] = copiar_agregado(_ler_parte(user_id, ('mes', chave)))
+        else:
+            por_mes[parte[1]] = copiar_agregado(_ler_parte(user_id, parte))
+    return por_mes
+
+# --- Verificação ---
+
+def _diferencas(esperado, guardado, caminho=''):
+    if isinstance(esperado, dict) or isinstance(guardado, dict):
+        esperado, guardado = esperado or {}, guardado or {}
+        for chave in sorted(set(esperado) | set(guardado), key=str):
+            yield from _diferencas(esperado.get(chave, 0), guardado.get(chave, 0), f"{caminho}/{chave}")
+    elif abs((esperado or 0) - (guardado or 0)) > TOLERANCIA:
+        yield caminho, esperado, guardado
+
+def verificar_agregados(user_id):
+    """Compara os agregados guardados com os recalculados; devolve a lista de diferenças."""
+    armazenamento = get_armazenamento()
+    total, por_ano, por_mes, por_dia = calcular_agregados(armazenamento.listar(user_id, "transacoes"))
+    diferencas = list(_diferencas(total, armazenamento.ler(user_id, "agregados_total", None), 'total'))
+    meses = sorted(set(por_mes) | set(armazenamento.ler(user_id, "agregados_meses", [])))
+    for mes in meses:
+        esperado = por_mes.get(mes, agregado_vazio())
+        diferencas.extend(_diferencas(esperado, armazenamento.ler(user_id, f"agregados_{mes}", None), mes))
+    if armazenamento.ler(user_id, "agregados_versao", 1) >= VERSAO_AGREGADOS:
+        for mes in meses:
+            if mes != 'sem_data':
+                esperado = por_dia.get(mes, {})
+                diferencas.extend(_diferencas(esperado, armazenamento.ler(user_id, f"agregados_dias_{mes}", None), f"{mes}/dias"))
+        for ano in sorted(set(por_ano) | {mes[:4] for mes in meses if mes != 'sem_data'}):
+            esperado = por_ano.get(ano, agregado_vazio())
+            diferencas.extend(_diferencas(esperado, armazenamento.ler(user_id, f"agregados_ano_{ano}", None), ano))
+    return diferencas
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica ou reconstrói os agregados mensais do dashboard.")
+    parser.add_argument('comando', choices=['verificar', 'reconstruir'])
+    parser.add_argument('user_ids', nargs='*')
+    args = parser.parse_args()
+
+    user_ids = args.user_ids or sorted(get_armazenamento().usuarios("transacoes"))
+    for user_id in user_ids:
+        if args.comando == 'reconstruir':
+            total = reconstruir_agregados(user_id)
+            print(f"{user_id}: {total['n']} transações agregadas")
+        else:
+            diferencas = verificar_agregados(user_id)
+            print(f"{user_id}: {'OK' if not diferencas else f'{len(diferencas)} diferenças'}")
+            for caminho, esperado, guardado in diferencas:
+                print(f"  {caminho}: esperado {esperado}, guardado {guardado}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+from collections import deque
+from categorizador import automato_do_usuario
+
+# --- Analisador de mensagens de transação ---
+# Um único autómato (Aho–Corasick) por utilizador reconhece, numa só passagem
+# pelo texto, todas as palavras que interessam: as que definem o tipo
+# (despesa/receita), o método, as contas, os cartões e as palavras-chave das
+# categorias. Na mesma passagem é encontrado o primeiro número da mensagem.
+#
+# As regras são as mesmas das verificações "palavra in texto" feitas uma a uma:
+# correspondência por substring e, em cada grupo, ganha a primeira opção na
+# ordem original (ex.: a primeira conta da lista que aparece no texto).
+
+PALAVRAS_DESPESA = ['comprei', 'gastei', 'paguei']
+PALAVRAS_RECEITA = ['recebi', 'ganhei', 'salário']
+PALAVRAS_CREDITO = ['crédito', 'cartao', 'cartão']
+PALAVRAS_DEBITO = ['débito', 'pix', 'swile']
+
+# Categorias fixas para receitas, independentes das categorias do utilizador
+CATEGORIAS_RECEITA = {
+    'Salário': ['salário'],
+    'Outras Receitas': ['recebi', 'ganhei', 'investimentos']
+}
+CATEGORIAS_SO_RECEITA = ('Salário', 'Outras Receitas')
+
+_CARACTERES_NUMERO = frozenset('0123456789.,')
+
+def converter_valor(numero):
+    """
+    Converte um número escrito à brasileira: "1.234,56" -> 1234.56, "12,5" -> 12.5,
+    "2.500" -> 2500.0 (ponto seguido de 3 dígitos é separador de milhares), "10.50" -> 10.5.
+    Com ponto e vírgula no mesmo número, o último dos dois é o separador decimal.
+    """
+    numero = numero.rstrip('.,')
+    if not numero:
+        return None
+    if ',' in numero and '.' in numero:
+        decimal_sep, milhar = (',', '.') if numero.rfind(',') > numero.rfind('.') else ('.', ',')
+        inteiro, _, decimal = numero.replace(milhar, '').rpartition(decimal_sep)
+    elif ',' in numero:
+        inteiro, _, decimal = numero.rpartition(',')
+        inteiro = inteiro.replace(',', '')
+    elif numero.count('.') > 1 or len(numero.rpartition('.')[2]) == 3:
+        inteiro, decimal = numero.replace('.', ''), ''
+    else:
+        inteiro, _, decimal = numero.partition('.')
+    try:
+        return float(f"{inteiro or 0}.{decimal or 0}")
+    except ValueError:
+        return None
+
+
+class AnalisadorMensagens:
+    """
+    grupos: {nome_grupo: [(valor, [palavras]), ...]}, por ordem de prioridade.
+    analisar(texto_lower) devolve ({nome_grupo: valor}, primeiro número do texto ou None).
+    """
+
+    def __init__(self, grupos):
+        self.grupos = list(grupos)
+        self._valores = {g: [valor for valor, _ in opcoes] for g, opcoes in grupos.items()}
+        self._transicoes = [{}]
+        self._falha = [0]
+        self._saidas = [{}]
+        # "" está contida em qualquer texto.
+        self._vazias = {}
+
+        for grupo, opcoes in grupos.items():
+            for prioridade, (_, palavras) in enumerate(opcoes):
+                for palavra in palavras:
+                    if not palavra:
+                        self._vazias[grupo] = min(self._vazias.get(grupo, prioridade), prioridade)
+                        continue
+                    estado = 0
+                    for letra in palavra:
+                        proximo = self._transicoes[estado].get(letra)
+                        if proximo is None:
+                            proximo = len(self._transicoes)
+                            self._transicoes[estado][letra] = proximo
+                            self._transicoes.append({})
+                            self._falha.append(0)
+                            self._saidas.append({})
+                        estado = proximo
+                    saida = self._saidas[estado]
+                    saida[grupo] = min(saida.get(grupo, prioridade), prioridade)
+        self._calcular_falhas()
+        # Só os estados com saída são consultados durante a passagem.
+        self._saidas = [tuple(s.items()) if s else None for s in self._saidas]
+
+    def _calcular_falhas(self):
+        fila = deque(self._transicoes[0].values())
+        while fila:
+            estado = fila.popleft()
+            for letra, proximo in self._transicoes[estado].items():
+                falha = self._falha[estado]
+                while falha and letra not in self._transicoes[falha]:
+                    falha = self._falha[falha]
+                self._falha[proximo] = self._transicoes[falha].get(letra, 0)
+                saida = self._saidas[proximo]
+                for grupo, prioridade in self._saidas[self._falha[proximo]].items():
+                    saida[grupo] = min(saida.get(grupo, prioridade), prioridade)
+                fila.append(proximo)
+
+    def analisar(self, texto_lower):
+        transicoes, falha, saidas = self._transicoes, self._falha, self._saidas
+        melhores = dict(self._vazias)
+        estado = 0
+        inicio_numero = fim_numero = None
+        tem_digito = False
+        for i, letra in enumerate(texto_lower):
+            while estado and letra not in transicoes[estado]:
+                estado = falha[estado]
+            estado = transicoes[estado].get(letra, 0)
+            saida = saidas[estado]
+            if saida is not None:
+                for grupo, prioridade in saida:
+                    if prioridade < melhores.get(grupo, prioridade + 1):
+                        melhores[grupo] = prioridade
+
+            # Primeiro número: sequência de dígitos, pontos e vírgulas com pelo menos um dígito
+            if fim_numero is None:
+                if letra in _CARACTERES_NUMERO:
+                    if inicio_numero is None:
+                        inicio_numero = i
+                    tem_digito = tem_digito or letra.isdigit()
+                elif inicio_numero is not None:
+                    if tem_digito:
+                        fim_numero = i
+                    else:
+                        inicio_numero = None
+
+        if inicio_numero is not None and fim_numero is None and tem_digito:
+            fim_numero = len(texto_lower)
+        valor = converter_valor(texto_lower[inicio_numero:fim_numero]) if fim_numero is not None else None
+        return {g: self._valores[g][p] for g, p in melhores.items()}, valor
+
+
+def construir_analisador(categorias, contas, cartoes):
+    return AnalisadorMensagens({
+        'tipo': [('despesa', PALAVRAS_DESPESA), ('receita', PALAVRAS_RECEITA)],
+        'metodo': [('crédito', PALAVRAS_CREDITO), ('débito', PALAVRAS_DEBITO)],
+        'conta': [(c, [c.lower()]) for c in contas],
+        'cartao': [(c, [c.lower()]) for c in cartoes],
+        'categoria': [(nome, palavras) for nome, palavras in categorias.items() if nome not in CATEGORIAS_SO_RECEITA],
+        'categoria_receita': list(CATEGORIAS_RECEITA.items()),
+    })
+
+# --- Analisadores por utilizador ---
+# Na mesma entrada de cache do classificador (categorizador.automato_do_usuario),
+# válida enquanto a versão da configuração do utilizador for a mesma.
+def get_analisador(user_id, versao, carregar):
+    """Analisador do utilizador; carregar() -> (categorias, contas, cartoes) só é chamada para o construir."""
+    return automato_do_usuario(user_id, versao, 'analisador', lambda: construir_analisador(*carregar()))
+
+def analisar_transacao(texto, analisador):
+    """
+    Devolve (tipo, valor, metodo, cartao, conta, categoria) de uma mensagem de transação.
+    A categoria segue as regras de categorizar_transacao para o tipo encontrado.
+    """
+    encontrados, valor = analisador.analisar(texto.lower())
+    tipo = encontrados.get('tipo', 'desconhecido')
+    metodo, cartao, conta = 'outro', None, None
+
+    if tipo == 'receita':
+        metodo = 'débito'
+        conta = encontrados.get('conta')
+        categoria = encontrados.get('categoria_receita') or 'Outras Receitas'
+    else:
+        if tipo == 'despesa':
+            metodo = encontrados.get('metodo', 'outro')
+            if metodo == 'crédito':
+                cartao = encontrados.get('cartao')
+            elif metodo == 'débito':
+                conta = encontrados.get('conta')
+        categoria = (encontrados.get('categoria') if tipo == 'despesa' else None) or 'Outros'
+
+    # Pagamentos de fatura saem sempre da conta, seja qual for o tipo
+    if encontrados.get('categoria') == 'Pagamentos':
+        metodo = 'débito'
+    return tipo, valor, metodo, cartao, conta, categoria
@@ -0,0 +1,575 @@
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+from metricas import contar_kv
+
+# --- Backends de armazenamento ---
+# O database.py fala só com a interface abaixo, por isso a app pode correr
+# sobre o KV do Replit (padrão) ou sobre um ficheiro SQLite local:
+#   ler / gravar / apagar              -> configurações por utilizador (chave -> valor)
+#   anexar(_varios) / listar / remover -> coleções (transacoes, parceladas, lembretes);
+#                                         remover devolve os itens apagados
+#   iterar                             -> coleção do item mais recente para o mais antigo
+#   compactar / usuarios               -> manutenção
+#   bloqueio(user_id)                  -> secção exclusiva para ler-alterar-gravar
+#                                         as chaves do utilizador (reentrante)
+#   bloqueio_global(nome)              -> o mesmo para chaves partilhadas (a agenda);
+#                                         pode ser tomado dentro de bloqueio(user_id),
+#                                         nunca o contrário
+# O backend é escolhido pela variável de ambiente LALABANK_ARMAZENAMENTO
+# ("replit" ou "sqlite"); o SQLite usa o ficheiro em LALABANK_SQLITE.
+#
+# Para código asyncio (assincrono.py) há o ArmazenamentoAssincrono: as mesmas
+# operações como corrotinas, que correm o backend num conjunto de threads
+# (LALABANK_THREADS_ARMAZENAMENTO, padrão 32), porque tanto o cliente do KV
+# como o sqlite3 bloqueiam.
+
+# Campo que identifica cada item (usado nas remoções) e que define o seu mês.
+CAMPOS_COLECOES = {'transacoes': 'timestamp', 'parceladas': 'data_inicio', 'lembretes': 'timestamp'}
+
+# A partir de quantas remoções pendentes (fora do mês atual, as únicas que a
+# compactação aplica) a compactação é disparada em segundo plano.
+LIMITE_COMPACTACAO = 20
+
+# Travas do KV do Replit, repartidas por user_id: utilizadores diferentes raramente
+# esperam uns pelos outros e a memória não cresce com o número de utilizadores.
+NUM_TRAVAS = 64
+_travas = [threading.RLock() for _ in range(NUM_TRAVAS)]
+# As das chaves partilhadas são outras: são tomadas dentro do bloqueio de um
+# utilizador e, se viessem das mesmas, dois utilizadores cujas travas coincidem
+# com as partilhadas um do outro ficariam à espera um do outro.
+_travas_globais = [threading.RLock() for _ in range(NUM_TRAVAS)]
+
+def _no_intervalo(valor, inicio, fim):
+    valor = valor or ''
+    return (inicio is None or valor >= inicio) and (fim is None or valor < fim)
+
+
+class ArmazenamentoReplit:
+    """
+    KV do Replit. Cada coleção é guardada em segmentos "<colecao>_<AAAA-MM>_<user_id>",
+    um por mês, mais um manifesto pequeno "<colecao>_manifesto_<user_id>" com os meses
+    existentes e as remoções pendentes (tombstones). A chave antiga "<colecao>_<user_id>"
+    continua a ser lida como segmento legado, por isso os dados existentes não precisam
+    de migração.
+
+    O KV não tem escritas condicionais, por isso bloqueio() só exclui as threads deste
+    processo: com vários workers use o backend SQLite.
+    """
+
+    def __init__(self, kv=None):
+        if kv is None:
+            from replit import db as kv
+        self.kv = kv
+        # (user_id, colecao) com uma compactação em segundo plano em curso
+        self._compactacoes = set()
+        self._compactacoes_lock = threading.Lock()
+
+    def _chave(self, user_id, nome):
+        return f"{nome}_{user_id}"
+
+    def _get(self, chave, padrao):
+        # Lê o JSON cru: os tipos "observados" devolvidos por db.get regravam a chave
+        # a cada alteração e não podem ser copiados com segurança para o cache.
+        get_raw = getattr(self.kv, 'get_raw', None)
+        if get_raw is None:
+            contar_kv('leitura')
+            return self.kv.get(chave, padrao)
+        try:
+            bruto = get_raw(chave)
+        except KeyError:
+            contar_kv('leitura')
+            return padrao
+        contar_kv('leitura', len(bruto))
+        return json.loads(bruto)
+
+    def _set(self, chave, valor):
+        # Serializa uma vez e grava o JSON cru, quando o KV o permite, para saber quantos bytes foram escritos.
+        set_raw = getattr(self.kv, 'set_raw', None)
+        if set_raw is None:
+            contar_kv('escrita')
+            self.kv[chave] = valor
+            return
+        bruto = json.dumps(valor)
+        contar_kv('escrita', len(bruto))
+        set_raw(chave, bruto)
+
+    def bloqueio(self, user_id):
+        return _travas[hash(user_id) % NUM_TRAVAS]
+
+    def bloqueio_global(self, nome):
+        return _travas_globais[hash(nome) % NUM_TRAVAS]
+
+    def _mes_do_item(self, colecao, item):
+        valor = item.get(CAMPOS_COLECOES[colecao]) or ''
+        return valor[:7] if len(valor) >= 7 else 'sem_data'
+
+    def _get_manifesto(self, user_id, colecao):
+        manifesto = self._get(self._chave(user_id, f"{colecao}_manifesto"), None)
+        if not manifesto:
+            return {'meses': [], 'removidos': []}
+        return {'meses': list(manifesto.get('meses', [])), 'removidos': list(manifesto.get('removidos', []))}
+
+    def _set_manifesto(self, user_id, colecao, manifesto):
+        self._set(self._chave(user_id, f"{colecao}_manifesto"), manifesto)
+
+    # --- Configurações ---
+    def ler(self, user_id, chave, padrao):
+        return self._get(self._chave(user_id, chave), padrao)
+
+    def gravar(self, user_id, chave, valor):
+        self._set(self._chave(user_id, chave), valor)
+
+    def apagar(self, user_id, chave):
+        contar_kv('escrita')
+        try:
+            del self.kv[self._chave(user_id, chave)]
+        except KeyError:
+            pass
+
+    # --- Coleções ---
+    def anexar(self, user_id, colecao, item):
+        """Acrescenta um item ao segmento do seu mês, sem reescrever o histórico."""
+        self.anexar_varios(user_id, colecao, [item])
+
+    def anexar_varios(self, user_id, colecao, itens):
+        """Acrescenta vários itens com uma escrita por segmento mensal envolvido."""
+        por_mes = {}
+        for item in itens:
+            por_mes.setdefault(self._mes_do_item(colecao, item), []).append(item)
+
+        with self.bloqueio(user_id):
+            for mes, novos in por_mes.items():
+                chave = self._chave(user_id, f"{colecao}_{mes}")
+                segmento = self._get(chave, [])
+                segmento.extend(novos)
+                self._set(chave, segmento)
+
+            manifesto = self._get_manifesto(user_id, colecao)
+            meses_novos = [mes for mes in por_mes if mes not in manifesto['meses']]
+            if meses_novos:
+                manifesto['meses'].extend(meses_novos)
+                self._set_manifesto(user_id, colecao, manifesto)
+
+    def listar(self, user_id, colecao, inicio=None, fim=None):
+        """
+        Devolve os itens da coleção (legado + segmentos), sem os removidos.
+        Com inicio/fim (strings ISO, fim exclusivo) só lê os segmentos dos meses do intervalo.
+        """
+        manifesto = self._get_manifesto(user_id, colecao)
+        removidos = set(manifesto['removidos'])
+        campo = CAMPOS_COLECOES[colecao]
+        filtrar = inicio is not None or fim is not None
+
+        itens = list(self._get(self._chave(user_id, colecao), []))
+        for mes in sorted(manifesto['meses']):
+            if filtrar and mes != 'sem_data' and not _no_intervalo(mes, inicio and inicio[:7], fim):
+                continue
+            itens.extend(self._get(self._chave(user_id, f"{colecao}_{mes}"), []))
+
+        if filtrar:
+            itens = [i for i in itens if _no_intervalo(i.get(campo), inicio, fim)]
+        if not removidos:
+            return itens
+        return [i for i in itens if i.get(campo) not in removidos]
+
+    def iterar(self, user_id, colecao, antes=None, inicio=None, fim=None):
+        """
+        Gera os itens do mais recente para o mais antigo, um segmento mensal de cada vez.
+        antes (exclusivo) serve de cursor; inicio/fim como em listar.
+        """
+        manifesto = self._get_manifesto(user_id, colecao)
+        removidos = set(manifesto['removidos'])
+        campo = CAMPOS_COLECOES[colecao]
+
+        legado = {}
+        for item in self._get(self._chave(user_id, colecao), []):
+            legado.setdefault(self._mes_do_item(colecao, item), []).append(item)
+
+        # 'sem_data' fica por último, como os itens sem campo numa ordenação decrescente.
+        meses = sorted(set(manifesto['meses']) | set(legado), key=lambda m: (m != 'sem_data', m), reverse=True)
+        for mes in meses:
+            if mes != 'sem_data':
+                if not _no_intervalo(mes, inicio and inicio[:7], fim) or (antes is not None and mes > antes[:7]):
+                    continue
+            itens = legado.get(mes, []) + (self._get(self._chave(user_id, f"{colecao}_{mes}"), []) if mes in manifesto['meses'] else [])
+            itens = [
+                i for i in itens
+                if i.get(campo) not in removidos and _no_intervalo(i.get(campo), inicio, fim)
+                and (antes is None or (i.get(campo) or '') < antes)
+            ]
+            itens.sort(key=lambda i: i.get(campo) or '', reverse=True)
+            yield from itens
+
+    def remover(self, user_id, colecao, identificador):
+        """
+        Regista a remoção como tombstone; os segmentos são limpos depois, na compactação.
+        Devolve os itens removidos (lidos só do segmento do mês do item, ou do legado).
+        """
+        campo = CAMPOS_COLECOES[colecao]
+        mes = self._mes_do_item(colecao, {campo: identificador})
+        with self.bloqueio(user_id):
+            manifesto = self._get_manifesto(user_id, colecao)
+            if identificador in manifesto['removidos']:
+                return []
+            removidos = [i for i in self._get(self._chave(user_id, f"{colecao}_{mes}"), []) if i.get(campo) == identificador]
+            if not removidos:
+                removidos = [i for i in self._get(self._chave(user_id, colecao), []) if i.get(campo) == identificador]
+
+            manifesto['removidos'].append(identificador)
+            self._set_manifesto(user_id, colecao, manifesto)
+
+        mes_atual = datetime.now().strftime('%Y-%m')
+        if sum(1 for r in manifesto['removidos'] if (r or '')[:7] != mes_atual) >= LIMITE_COMPACTACAO:
+            self._compactar_em_segundo_plano(user_id, colecao)
+        return removidos
+
+    def _compactar_em_segundo_plano(self, user_id, colecao):
+        """Inicia compactar numa thread, se ainda não houver uma para o mesmo utilizador e coleção."""
+        chave = (user_id, colecao)
+        with self._compactacoes_lock:
+            if chave in self._compactacoes:
+                return
+            self._compactacoes.add(chave)
+
+        def compactar():
+            try:
+                self.compactar(user_id, colecao)
+            finally:
+                with self._compactacoes_lock:
+                    self._compactacoes.discard(chave)
+
+        threading.Thread(target=compactar, daemon=True).start()
+
+    # --- Manutenção ---
+    def compactar(self, user_id, colecao, mes_atual=None):
+        """
+        Reescreve os segmentos fechados que têm itens removidos e descarta os
+        tombstones já aplicados. O segmento do mês atual (ainda a receber itens)
+        e os tombstones que apontam para ele ficam para uma compactação futura.
+        """
+        mes_atual = mes_atual or datetime.now().strftime('%Y-%m')
+        campo = CAMPOS_COLECOES[colecao]
+        with self.bloqueio(user_id):
+            manifesto = self._get_manifesto(user_id, colecao)
+            removidos = set(manifesto['removidos'])
+            if not removidos:
+                return 0
+
+            # Os itens de um mês fechado só podem estar no segmento desse mês ou no legado,
+            # por isso todos os tombstones fora do mês atual ficam aplicados após esta passagem.
+            aplicados = {r for r in removidos if (r or '')[:7] != mes_atual}
+            nomes = [colecao] + [f"{colecao}_{mes}" for mes in manifesto['meses'] if mes != mes_atual]
+            meses_vazios = []
+            for nome in nomes:
+                chave = self._chave(user_id, nome)
+                segmento = self._get(chave, None)
+                if not segmento:
+                    continue
+                mantidos = [i for i in segmento if i.get(campo) not in aplicados]
+                if len(mantidos) == len(segmento):
+                    continue
+                if mantidos or nome == colecao:
+                    self._set(chave, mantidos)
+                else:
+                    del self.kv[chave]
+                    meses_vazios.append(nome[len(colecao) + 1:])
+
+            manifesto['removidos'] = [r for r in manifesto['removidos'] if r not in aplicados]
+            manifesto['meses'] = [m for m in manifesto['meses'] if m not in meses_vazios]
+            self._set_manifesto(user_id, colecao, manifesto)
+            return len(aplicados)
+
+    def usuarios(self, colecao):
+        """Devolve os user_ids que têm dados guardados na coleção (legado ou segmentos)."""
+        return {chave.split("_")[-1] for chave in self.kv.prefix(f"{colecao}_")}
+
+
+class ArmazenamentoSQLite:
+    """
+    Ficheiro SQLite local (modo WAL). Coleções, metas e categorias têm tabelas
+    próprias com índices por utilizador; as restantes configurações ficam numa
+    tabela chave -> valor em JSON. Gravar metas ou categorias deixa também uma
+    linha com o nome da chave em configuracoes, para que uma gravação vazia
+    (tudo apagado) não seja lida como "nunca gravado", como no KV.
+
+    Cada escrita é uma transação BEGIN IMMEDIATE, que fica com a trava de escrita
+    do ficheiro desde o início; bloqueio() abre uma destas transações à volta de
+    várias operações, por isso exclui também os outros processos (workers).
+    """
+
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS configuracoes (
+            user_id TEXT NOT NULL, chave TEXT NOT NULL, valor TEXT,
+            PRIMARY KEY (user_id, chave)
+        );
+        CREATE TABLE IF NOT EXISTS transacoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, timestamp TEXT,
+            tipo TEXT, metodo TEXT, categoria TEXT, valor REAL, dados TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_transacoes_timestamp ON transacoes (user_id, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_transacoes_categoria ON transacoes (user_id, categoria);
+        CREATE TABLE IF NOT EXISTS parceladas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, data_inicio TEXT,
+            cartao TEXT, categoria TEXT, dados TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_parceladas_data ON parceladas (user_id, data_inicio);
+        CREATE TABLE IF NOT EXISTS lembretes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, timestamp TEXT,
+            dia_vencimento INTEGER, dados TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_lembretes_timestamp ON lembretes (user_id, timestamp);
+        CREATE TABLE IF NOT EXISTS metas (
+            user_id TEXT NOT NULL, categoria TEXT NOT NULL, valor REAL,
+            PRIMARY KEY (user_id, categoria)
+        );
+        CREATE TABLE IF NOT EXISTS categorias (
+            user_id TEXT NOT NULL, nome TEXT NOT NULL, palavras TEXT NOT NULL, ordem INTEGER,
+            PRIMARY KEY (user_id, nome)
+        );
+    """
+
+    # Colunas indexáveis de cada coleção, além do user_id e do JSON completo.
+    COLUNAS = {
+        'transacoes': ['timestamp', 'tipo', 'metodo', 'categoria', 'valor'],
+        'parceladas': ['data_inicio', 'cartao', 'categoria'],
+        'lembretes': ['timestamp', 'dia_vencimento'],
+    }
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._local = threading.local()
+        self._conexao().executescript(self.ESQUEMA)
+
+    def _conexao(self):
+        # Uma conexão por thread: o sqlite3 não partilha conexões entre threads por padrão.
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            conexao = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA synchronous=NORMAL")
+            self._local.conexao = conexao
+        return conexao
+
+    @contextmanager
+    def _transacao(self):
+        # Dentro de outra transação desta thread junta-se a ela; só a mais externa faz COMMIT.
+        conexao = self._conexao()
+        profundidade = getattr(self._local, 'profundidade', 0)
+        if profundidade == 0:
+            conexao.execute("BEGIN IMMEDIATE")
+        self._local.profundidade = profundidade + 1
+        try:
+            yield conexao
+        except BaseException:
+            self._local.profundidade = profundidade
+            if profundidade == 0 and conexao.in_transaction:
+                conexao.execute("ROLLBACK")
+            raise
+        self._local.profundidade = profundidade
+        if profundidade == 0:
+            conexao.execute("COMMIT")
+
+    def bloqueio(self, user_id):
+        return self._transacao()
+
+    def bloqueio_global(self, nome):
+        return self._transacao()
+
+    # --- Configurações ---
+    def ler(self, user_id, chave, padrao):
+        conexao = self._conexao()
+        if chave == 'metas':
+            linhas = conexao.execute("SELECT categoria, valor FROM metas WHERE user_id = ?", (user_id,)).fetchall()
+            contar_kv('leitura')
+            return dict(linhas) if linhas or self._gravada(conexao, user_id, chave) else padrao
+        if chave == 'categorias':
+            linhas = conexao.execute(
+                "SELECT nome, palavras FROM categorias WHERE user_id = ? ORDER BY ordem", (user_id,)
+            ).fetchall()
+            contar_kv('leitura', sum(len(palavras) for _, palavras in linhas))
+            if not linhas and not self._gravada(conexao, user_id, chave):
+                return padrao
+            return {nome: json.loads(palavras) for nome, palavras in linhas}
+
+        linha = conexao.execute(
+            "SELECT valor FROM configuracoes WHERE user_id = ? AND chave = ?", (user_id, chave)
+        ).fetchone()
+        contar_kv('leitura', len(linha[0]) if linha else 0)
+        return json.loads(linha[0]) if linha else padrao
+
+    @staticmethod
+    def _gravada(conexao, user_id, chave):
+        """Se as metas ou categorias do utilizador já foram gravadas alguma vez (mesmo vazias)."""
+        return conexao.execute(
+            "SELECT 1 FROM configuracoes WHERE user_id = ? AND chave = ?", (user_id, chave)
+        ).fetchone() is not None
+
+    def gravar(self, user_id, chave, valor):
+        contar_kv('escrita')
+        with self._transacao() as conexao:
+            if chave == 'metas':
+                conexao.execute("DELETE FROM metas WHERE user_id = ?", (user_id,))
+                conexao.executemany(
+                    "INSERT INTO metas (user_id, categoria, valor) VALUES (?, ?, ?)",
+                    [(user_id, c, v) for c, v in valor.items()]
+                )
+            elif chave == 'categorias':
+                conexao.execute("DELETE FROM categorias WHERE user_id = ?", (user_id,))
+                conexao.executemany(
+                    "INSERT INTO categorias (user_id, nome, palavras, ordem) VALUES (?, ?, ?, ?)",
+                    [(user_id, nome, json.dumps(palavras), i) for i, (nome, palavras) in enumerate(valor.items())]
+                )
+            # Para metas e categorias a linha em configuracoes só marca que já foram gravadas.
+            conexao.execute(
+                "INSERT OR REPLACE INTO configuracoes (user_id, chave, valor) VALUES (?, ?, ?)",
+                (user_id, chave, None if chave in ('metas', 'categorias') else json.dumps(valor))
+            )
+
+    def apagar(self, user_id, chave):
+        contar_kv('escrita')
+        with self._transacao() as conexao:
+            if chave in ('metas', 'categorias'):
+                conexao.execute(f"DELETE FROM {chave} WHERE user_id = ?", (user_id,))
+            conexao.execute("DELETE FROM configuracoes WHERE user_id = ? AND chave = ?", (user_id, chave))
+
+    # --- Coleções ---
+    def anexar(self, user_id, colecao, item):
+        self.anexar_varios(user_id, colecao, [item])
+
+    def anexar_varios(self, user_id, colecao, itens):
+        colunas = self.COLUNAS[colecao]
+        linhas = [(user_id, *[item.get(c) for c in colunas], json.dumps(item)) for item in itens]
+        contar_kv('escrita', sum(len(linha[-1]) for linha in linhas))
+        with self._transacao() as conexao:
+            conexao.executemany(
+                f"INSERT INTO {colecao} (user_id, {', '.join(colunas)}, dados) VALUES (?, {', '.join('?' * len(colunas))}, ?)",
+                linhas
+            )
+
+    def listar(self, user_id, colecao, inicio=None, fim=None):
+        """Devolve os itens por ordem de inserção; inicio/fim usam o índice (user_id, campo)."""
+        campo = CAMPOS_COLECOES[colecao]
+        sql, parametros = f"SELECT dados FROM {colecao} WHERE user_id = ?", [user_id]
+        if inicio is not None:
+            sql += f" AND {campo} >= ?"
+            parametros.append(inicio)
+        if fim is not None:
+            sql += f" AND {campo} < ?"
+            parametros.append(fim)
+        linhas = self._conexao().execute(sql + " ORDER BY id", parametros).fetchall()
+        contar_kv('leitura', sum(len(dados) for (dados,) in linhas))
+        return [json.loads(dados) for (dados,) in linhas]
+
+    def iterar(self, user_id, colecao, antes=None, inicio=None, fim=None, lote=200):
+        """Gera os itens do mais recente para o mais antigo, lidos do índice em lotes."""
+        campo = CAMPOS_COLECOES[colecao]
+        sql, parametros = f"SELECT dados FROM {colecao} WHERE user_id = ?", [user_id]
+        for operador, valor in (('<', antes), ('>=', inicio), ('<', fim)):
+            if valor is not None:
+                sql += f" AND {campo} {operador} ?"
+                parametros.append(valor)
+        # Cursor próprio: a conexão da thread pode ser usada por outras consultas entre lotes.
+        cursor = self._conexao().cursor()
+        cursor.execute(sql + f" ORDER BY {campo} DESC, id", parametros)
+        try:
+            while True:
+                linhas = cursor.fetchmany(lote)
+                if not linhas:
+                    return
+                contar_kv('leitura', sum(len(dados) for (dados,) in linhas))
+                for (dados,) in linhas:
+                    yield json.loads(dados)
+        finally:
+            cursor.close()
+
+    def remover(self, user_id, colecao, identificador):
+        """Apaga os itens com o identificador e devolve-os."""
+        campo = CAMPOS_COLECOES[colecao]
+        with self._transacao() as conexao:
+            linhas = conexao.execute(
+                f"SELECT dados FROM {colecao} WHERE user_id = ? AND {campo} = ?", (user_id, identificador)
+            ).fetchall()
+            conexao.execute(f"DELETE FROM {colecao} WHERE user_id = ? AND {campo} = ?", (user_id, identificador))
+        contar_kv('escrita')
+        return [json.loads(dados) for (dados,) in linhas]
+
+    # --- Manutenção ---
+    def compactar(self, user_id, colecao, mes_atual=None):
+        # As remoções já são aplicadas na hora; não há tombstones a compactar.
+        return 0
+
+    def usuarios(self, colecao):
+        return {u for (u,) in self._conexao().execute(f"SELECT DISTINCT user_id FROM {colecao}")}
+
+
+_armazenamento = None
+
+def get_armazenamento():
+    """Devolve o backend configurado, criado no primeiro uso."""
+    global _armazenamento
+    if _armazenamento is None:
+        tipo = os.environ.get("LALABANK_ARMAZENAMENTO", "replit")
+        if tipo == "sqlite":
+            _armazenamento = ArmazenamentoSQLite(os.environ.get("LALABANK_SQLITE", "lalabank.db"))
+        else:
+            _armazenamento = ArmazenamentoReplit()
+    return _armazenamento
+
+def set_armazenamento(armazenamento):
+    """Troca o backend em uso (ex.: um SQLite temporário para testes ou benchmarks)."""
+    global _armazenamento
+    _armazenamento = armazenamento
+
+
+class ArmazenamentoAssincrono:
+    """
+    Adaptador asyncio do backend em uso (get_armazenamento). Os bloqueios são de
+    threads e não podem ficar presos à volta de um await: as secções
+    ler -> alterar -> gravar correm inteiras numa thread, com executar().
+    """
+
+    def __init__(self, threads=32):
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="armazenamento")
+
+    async def executar(self, funcao, *args, **kwargs):
+        """Corre funcao(*args, **kwargs), que pode usar o armazenamento síncrono, numa das threads."""
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(self._executor, partial(funcao, *args, **kwargs))
+
+    async def ler(self, user_id, chave, padrao):
+        return await self.executar(get_armazenamento().ler, user_id, chave, padrao)
+
+    async def gravar(self, user_id, chave, valor):
+        return await self.executar(get_armazenamento().gravar, user_id, chave, valor)
+
+    async def anexar(self, user_id, colecao, item):
+        return await self.executar(get_armazenamento().anexar, user_id, colecao, item)
+
+    async def anexar_varios(self, user_id, colecao, itens):
+        return await self.executar(get_armazenamento().anexar_varios, user_id, colecao, itens)
+
+    async def listar(self, user_id, colecao, inicio=None, fim=None):
+        return await self.executar(get_armazenamento().listar, user_id, colecao, inicio, fim)
+
+    async def remover(self, user_id, colecao, identificador):
+        return await self.executar(get_armazenamento().remover, user_id, colecao, identificador)
+
+    async def usuarios(self, colecao):
+        return await self.executar(get_armazenamento().usuarios, colecao)
+
+
+_armazenamento_assincrono = None
+_armazenamento_assincrono_lock = threading.Lock()
+
+def get_armazenamento_assincrono():
+    global _armazenamento_assincrono
+    with _armazenamento_assincrono_lock:
+        if _armazenamento_assincrono is None:
+            _armazenamento_assincrono = ArmazenamentoAssincrono(int(os.environ.get("LALABANK_THREADS_ARMAZENAMENTO", 32)))
+    return _armazenamento_assincrono
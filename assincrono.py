@@ -0,0 +1,224 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from main import app as app_flask, lotes_do_payload, responder_lote, set_estatisticas_fila
+from armazenamento import get_armazenamento_assincrono
+from agenda_lembretes import executar_agenda_assincrona
+from fila import FilaAssincrona
+from whatsapp import get_cliente_assincrono
+from metricas import pedido, cronometro
+
+# --- App ASGI (asyncio) ---
+# A mesma app do main.py, para servidores ASGI (uvicorn). Só a espera pela
+# Graph API é assíncrona: o envio das respostas e dos lembretes não ocupa uma
+# thread por mensagem, por isso um processo aguenta milhares de envios em
+# curso. O resto continua síncrono:
+#   POST /webhook        lotes_do_payload, como no Flask, e uma FilaAssincrona
+#                        (fila.py) no lugar da fila de threads. O
+#                        processamento de cada lote (responder_lote: análise,
+#                        categorização e armazenamento) é o do Flask, corrido
+#                        nas threads do ArmazenamentoAssincrono, por isso os
+#                        lotes processados em simultâneo estão limitados a
+#                        essas threads; só as respostas saem pelo
+#                        ClienteWhatsAppAssincrono (whatsapp.py)
+#   GET /webhook         verificação da Meta
+#   /check_reminders     executar_agenda_assincrona (agenda_lembretes.py):
+#                        leituras da agenda em threads, envios assíncronos
+#   /queue_stats         estatísticas da fila assíncrona (também no /metrics)
+# As outras rotas (dashboard, API, configurações) são as do Flask, corridas
+# num conjunto de threads (LALABANK_THREADS, padrão 8) pela PonteWSGI.
+#
+# Uso: LALABANK_ASGI=1 python servidor.py   (gunicorn com workers do uvicorn)
+#      python assincrono.py                 (só o uvicorn, um processo)
+
+async def _ler_corpo(receive, destino=None):
+    """Lê o corpo do pedido; com destino (um ficheiro), escreve-o lá em vez de o devolver."""
+    partes = []
+    while True:
+        mensagem = await receive()
+        if mensagem['type'] == 'http.disconnect':
+            break
+        if destino is not None:
+            destino.write(mensagem.get('body', b''))
+        else:
+            partes.append(mensagem.get('body', b''))
+        if not mensagem.get('more_body'):
+            break
+    return b''.join(partes)
+
+async def _responder(send, status, corpo, tipo='text/html; charset=utf-8'):
+    corpo = corpo.encode() if isinstance(corpo, str) else corpo
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', tipo.encode()), (b'content-length', str(len(corpo)).encode())]})
+    await send({'type': 'http.response.body', 'body': corpo})
+
+
+class PonteWSGI:
+    """Serve uma app WSGI (o Flask) a partir do ASGI, num conjunto de threads; o corpo da resposta vai aos bocados."""
+
+    def __init__(self, app_wsgi, threads=8):
+        self.app_wsgi = app_wsgi
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    @staticmethod
+    def _environ(scope, corpo):
+        servidor = scope.get('server') or ('localhost', 80)
+        cliente = scope.get('client') or ('', 0)
+        raiz = scope.get('root_path', '')
+        caminho = scope['path'][len(raiz):] if scope['path'].startswith(raiz) else scope['path']
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': raiz.encode('utf-8').decode('latin-1'),
+            'PATH_INFO': caminho.encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': servidor[0], 'SERVER_PORT': str(servidor[1]),
+            'REMOTE_ADDR': cliente[0], 'REMOTE_PORT': str(cliente[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'wsgi.version': (1, 0), 'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': corpo, 'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+        }
+        for nome, valor in scope.get('headers', []):
+            nome, valor = nome.decode('latin-1').upper().replace('-', '_'), valor.decode('latin-1')
+            if nome in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[nome] = valor
+            else:
+                nome = f"HTTP_{nome}"
+                environ[nome] = f"{environ[nome]},{valor}" if nome in environ else valor
+        return environ
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        # Uploads grandes (importação de extratos) passam para disco a partir de 1 MB.
+        with tempfile.SpooledTemporaryFile(max_size=1 << 20) as corpo:
+            await _ler_corpo(receive, corpo)
+            corpo.seek(0)
+            environ = self._environ(scope, corpo)
+
+            def enviar(mensagem):
+                # A thread espera que cada bocado seja enviado: um cliente lento não acumula a resposta em memória.
+                asyncio.run_coroutine_threadsafe(send(mensagem), loop).result()
+
+            def correr():
+                inicio = {}
+
+                def start_response(status, headers, exc_info=None):
+                    inicio['mensagem'] = {
+                        'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                        'headers': [(nome.lower().encode('latin-1'), valor.encode('latin-1')) for nome, valor in headers],
+                    }
+                    return lambda dados: enviar_corpo(dados)
+
+                def enviar_corpo(dados, mais=True):
+                    if 'mensagem' in inicio:
+                        enviar(inicio.pop('mensagem'))
+                    if dados or not mais:
+                        enviar({'type': 'http.response.body', 'body': dados, 'more_body': mais})
+
+                resultado = self.app_wsgi(environ, start_response)
+                try:
+                    for dados in resultado:
+                        enviar_corpo(dados)
+                finally:
+                    if hasattr(resultado, 'close'):
+                        resultado.close()
+                enviar_corpo(b'', mais=False)
+
+            await loop.run_in_executor(self._executor, correr)
+
+
+# --- Processamento das mensagens ---
+
+def _responder_lote(phone_number, mensagens):
+    with pedido('processar_lote'):
+        return responder_lote(phone_number, mensagens)
+
+async def processar_lote_assincrono(phone_number, mensagens):
+    """Como main.processar_lote: o processamento corre numa thread e as respostas são enviadas sem bloquear."""
+    respostas = await get_armazenamento_assincrono().executar(_responder_lote, phone_number, mensagens)
+    with cronometro('enviar_respostas'):
+        if len(respostas) == 1:
+            await get_cliente_assincrono().enviar(phone_number, respostas[0])
+        elif respostas:
+            await get_cliente_assincrono().enviar_varias(phone_number, respostas)
+
+_fila = None
+
+def get_fila_assincrona():
+    global _fila
+    if _fila is None:
+        _fila = FilaAssincrona(processar_lote_assincrono)
+    return _fila
+
+set_estatisticas_fila(lambda: get_fila_assincrona().estatisticas())
+
+async def esvaziar():
+    """Processa as mensagens pendentes e fecha a sessão HTTP (no fim do processo)."""
+    if _fila is not None:
+        await _fila.aguardar()
+    await get_cliente_assincrono().fechar()
+
+
+# --- Rotas ---
+
+async def webhook(scope, receive, send):
+    if scope['method'] == 'POST':
+        corpo = await _ler_corpo(receive)
+        try:
+            data = json.loads(corpo)
+        except ValueError:
+            return await _responder(send, 400, "Bad Request")
+        # pedido() é por thread: à volta de código sem await, que não cede o loop a outros pedidos.
+        with pedido('webhook'):
+            # Responde 200 de imediato; cada utilizador tem um lote na fila, processado por ordem
+            fila = get_fila_assincrona()
+            for phone_number, mensagens in lotes_do_payload(data).items():
+                fila.enfileirar(phone_number, mensagens)
+        return await _responder(send, 200, "EVENT_RECEIVED")
+
+    from utilis import VERIFY_TOKEN
+    parametros = parse_qs(scope.get('query_string', b'').decode())
+    if parametros.get('hub.verify_token', [None])[0] == VERIFY_TOKEN:
+        return await _responder(send, 200, parametros.get('hub.challenge', [''])[0])
+    return await _responder(send, 403, 'Invalid verification token')
+
+async def check_reminders(scope, receive, send):
+    await executar_agenda_assincrona(get_cliente_assincrono().enviar)
+    return await _responder(send, 200, "Verificação de lembretes concluída.")
+
+async def queue_stats(scope, receive, send):
+    return await _responder(send, 200, json.dumps(get_fila_assincrona().estatisticas()), 'application/json')
+
+ROTAS = {
+    ('/webhook', 'GET'): webhook, ('/webhook', 'POST'): webhook,
+    ('/check_reminders', 'GET'): check_reminders,
+    ('/queue_stats', 'GET'): queue_stats,
+}
+
+_flask = PonteWSGI(app_flask, int(os.environ.get("LALABANK_THREADS", 8)))
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            mensagem = await receive()
+            if mensagem['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif mensagem['type'] == 'lifespan.shutdown':
+                await esvaziar()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+    rota = ROTAS.get((scope['path'], scope.get('method')))
+    if rota is not None:
+        return await rota(scope, receive, send)
+    return await _flask(scope, receive, send)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('LALABANK_PORTA', 8080)))
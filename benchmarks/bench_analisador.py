@@ -0,0 +1,137 @@
+"""
+Microbenchmark: extração dos dados de uma mensagem com verificações
+"palavra in texto" uma a uma + categorização separada (implementação antiga)
+vs. analisador de uma só passagem (analisador.py).
+
+Também compara os resultados das duas implementações no mesmo corpus e
+agrupa as diferenças por motivo. Só o valor pode mudar, por duas razões
+intencionais:
+  - separador de milhares: valores escritos à brasileira ("1.234,56",
+    "2.500"), que a implementação antiga não lia ou lia como 2,5;
+  - pontuação antes do número: a implementação antiga só olhava para a
+    primeira sequência de dígitos, pontos e vírgulas, e "Oi, gastei 10" ficava
+    sem valor por causa da vírgula; o analisador salta sequências sem dígitos.
+Qualquer outra diferença faz o benchmark falhar.
+
+Uso: python benchmarks/bench_analisador.py [--mensagens 20000] [--categorias-extra 0]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from analisador import construir_analisador, analisar_transacao, CATEGORIAS_RECEITA
+from bench_categorizacao import CATEGORIAS_PADRAO, IGNORAR
+from gerador_dados import mensagens_realistas, _categorias_extra
+
+CONTAS = {'contas': ['Swile', 'Itaú', 'Nubank', 'Inter'], 'cartoes': ['Mercado Pago', 'Nubank', 'Itaú']}
+
+def categorizar_antigo(descricao, tipo, categorias):
+    descricao_lower = descricao.lower()
+    if tipo == 'receita':
+        for categoria, palavras in CATEGORIAS_RECEITA.items():
+            if any(p in descricao_lower for p in palavras):
+                return categoria
+        return 'Outras Receitas'
+    elif tipo == 'despesa':
+        for categoria, palavras in categorias.items():
+            if categoria in IGNORAR:
+                continue
+            if any(p in descricao_lower for p in palavras):
+                return categoria
+    return 'Outros'
+
+def extrair_antigo(texto, categorias, contas_conhecidas):
+    """Cópia de extrair_dados_transacao_normal + categorizar_transacao antes do analisador."""
+    tipo, valor, metodo, cartao, conta = 'desconhecido', None, 'outro', None, None
+    texto_lower = texto.lower()
+    if any(p in texto_lower for p in ['comprei', 'gastei', 'paguei']): tipo = 'despesa'
+    elif any(p in texto_lower for p in ['recebi', 'ganhei', 'salário']): tipo = 'receita'
+    match_valor = re.search(r'[\d,.]+', texto)
+    if match_valor and match_valor.group(0) not in ['.', ',']:
+        try:
+            valor = float(match_valor.group(0).replace(',', '.'))
+        except ValueError:
+            valor = None
+    if tipo == 'receita':
+        metodo = 'débito'
+        for c in contas_conhecidas['contas']:
+            if c.lower() in texto_lower:
+                conta = c
+                break
+    elif tipo == 'despesa':
+        if 'crédito' in texto_lower or 'cartao' in texto_lower or 'cartão' in texto_lower:
+            metodo = 'crédito'
+            for c in contas_conhecidas['cartoes']:
+                if c.lower() in texto_lower:
+                    cartao = c
+                    break
+        elif 'débito' in texto_lower or 'pix' in texto_lower or 'swile' in texto_lower:
+            metodo = 'débito'
+            for c in contas_conhecidas['contas']:
+                if c.lower() in texto_lower:
+                    conta = c
+                    break
+    if categorizar_antigo(texto, 'despesa', categorias) == 'Pagamentos': metodo = 'débito'
+    return tipo, valor, metodo, cartao, conta, categorizar_antigo(texto, tipo, categorias)
+
+def motivo(mensagem, antigo, novo):
+    """Motivo de uma diferença entre as duas implementações, ou None se não for uma das intencionais."""
+    if antigo[:1] + antigo[2:] != novo[:1] + novo[2:]:
+        return None
+    primeira = re.search(r'[\d,.]+', mensagem)
+    if primeira and not re.search(r'\d', primeira.group(0)):
+        return 'pontuação antes do número'
+    if re.search(r'\d[.,]\d{3}', mensagem):
+        return 'separador de milhares'
+    return None
+
+def corpus(rng, quantidade):
+    mensagens = mensagens_realistas(rng, quantidade)
+    extras = [
+        "Gastei 1.234,56 no mercado com cartão Nubank", "paguei a fatura do cartão itaú 2.500",
+        "recebi salário 5.300,00 no Itaú", "comprei remédio na farmacia 23,90 no pix",
+        "gastei , 50 reais uber", "ganhei 100", "paguei netflix 55.90 no crédito mercado pago",
+        "Oi, gastei 10 no mercado", "... recebi 200",
+    ]
+    return mensagens + [rng.choice(extras) for _ in range(quantidade // 10)]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mensagens", type=int, default=20000)
+    parser.add_argument("--categorias-extra", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    categorias = dict(CATEGORIAS_PADRAO)
+    categorias.update(_categorias_extra(rng, args.categorias_extra))
+    mensagens = corpus(rng, args.mensagens)
+    analisador = construir_analisador(categorias, CONTAS['contas'], CONTAS['cartoes'])
+
+    diferentes = [
+        (m, antigo, novo) for m in mensagens
+        if (antigo := extrair_antigo(m, categorias, CONTAS)) != (novo := analisar_transacao(m, analisador))
+    ]
+    por_motivo = {}
+    for m, antigo, novo in diferentes:
+        por_motivo.setdefault(motivo(m, antigo, novo), {})[m] = (antigo, novo)
+    for nome, exemplos in por_motivo.items():
+        print(f"{nome or 'INESPERADA'}: {len(exemplos)} mensagens distintas")
+        for m, (antigo, novo) in list(exemplos.items())[:3]:
+            print(f"  {m!r}\n    antigo: {antigo}\n    novo:   {novo}")
+
+    t_antigo = min(timeit.repeat(lambda: [extrair_antigo(m, categorias, CONTAS) for m in mensagens], number=1, repeat=3))
+    t_novo = min(timeit.repeat(lambda: [analisar_transacao(m, analisador) for m in mensagens], number=1, repeat=3))
+    n = len(mensagens)
+    print(f"{n} mensagens, {len(categorias)} categorias, {len(diferentes)} resultados diferentes")
+    print(f"antigo:     {t_antigo / n * 1e6:7.2f} µs/mensagem")
+    print(f"analisador: {t_novo / n * 1e6:7.2f} µs/mensagem  ({t_antigo / t_novo:.2f}x)")
+    assert None not in por_motivo, "diferenças inesperadas entre as duas implementações"
+
+if __name__ == '__main__':
+    main()
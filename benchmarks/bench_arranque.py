@@ -0,0 +1,97 @@
+"""
+Benchmark do arranque a frio: em cada repetição um processo Python novo
+importa o main.py e responde ao primeiro GET /webhook (verificação da Meta) e
+ao primeiro POST /webhook com uma mensagem, pelo cliente de testes do Flask.
+Mede também o tempo até a resposta ao utilizador chegar à Graph API falsa
+(processamento na fila + primeiro envio), e lista os módulos pesados que já
+estavam carregados depois de cada passo. No fim de cada processo compila os
+templates (como os workers do servidor.py) e confirma que o dashboard foi
+compilado e ficou no cache em disco (LALABANK_CACHE_TEMPLATES).
+
+Uso: python benchmarks/bench_arranque.py [--repeticoes 10]
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos cujo carregamento interessa acompanhar
+PESADOS = ['flask', 'jinja2', 'requests', 'numpy', 'dashboard_calculations', 'relatorios', 'importacao', 'extrato']
+
+PAYLOAD = {'entry': [{'changes': [{'value': {'messages': [
+    {'id': 'wamid.arranque', 'from': '5511999990000', 'type': 'text', 'text': {'body': 'gastei 25 no mercado'}}
+]}}]}]}
+
+def filho():
+    """Corre no processo novo; escreve os tempos em JSON no stdout."""
+    resultado, carregados = {}, {}
+    inicio_processo = inicio = time.perf_counter()
+    import main
+    resultado['importar_main'] = time.perf_counter() - inicio
+    carregados['importar_main'] = [m for m in PESADOS if m in sys.modules]
+    cliente = main.app.test_client()
+
+    inicio = time.perf_counter()
+    resposta = cliente.get('/webhook', query_string={'hub.verify_token': 'teste', 'hub.challenge': '42'})
+    resultado['get_webhook'] = time.perf_counter() - inicio
+    assert resposta.status_code == 200 and resposta.data == b'42', resposta.status_code
+
+    inicio = time.perf_counter()
+    resposta = cliente.post('/webhook', json=PAYLOAD)
+    resultado['post_webhook'] = time.perf_counter() - inicio
+    assert resposta.status_code == 200, resposta.status_code
+    carregados['post_webhook'] = [m for m in PESADOS if m in sys.modules]
+
+    main.get_fila(main.processar_lote).aguardar()
+    resultado['primeira_resposta_enviada'] = time.perf_counter() - inicio
+    resultado['total'] = time.perf_counter() - inicio_processo
+    carregados['primeira_resposta_enviada'] = [m for m in PESADOS if m in sys.modules]
+    compilados = main.precompilar_templates()
+    assert 'dashboard.html' in compilados, compilados
+    print(json.dumps({'tempos': resultado, 'carregados': carregados}))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeticoes', type=int, default=10)
+    args = parser.parse_args()
+
+    from fake_graph_api import ServidorGraphFalso
+    servidor = ServidorGraphFalso(latencia_ms=0).iniciar()
+    pasta = tempfile.mkdtemp()
+    ambiente = dict(os.environ, WHATSAPP_API_URL=servidor.url_base, LALABANK_ARMAZENAMENTO='sqlite',
+                    LALABANK_CACHE_TEMPLATES=pasta)
+
+    medicoes = []
+    for i in range(args.repeticoes):
+        # Base nova em cada processo, como num arranque a frio
+        ambiente['LALABANK_SQLITE'] = os.path.join(pasta, f'arranque_{i}.db')
+        saida = subprocess.run([sys.executable, os.path.abspath(__file__), '--filho'], env=ambiente, cwd=RAIZ,
+                               capture_output=True, text=True, check=True).stdout
+        medicoes.append(json.loads(saida.strip().splitlines()[-1]))
+    servidor.shutdown()
+    assert len(servidor.recebidas) >= args.repeticoes, "as respostas não chegaram à Graph API falsa"
+    assert glob.glob(os.path.join(pasta, 'lalabank_*.jinja')), "nenhum template compilado no cache em disco"
+
+    print(f"{args.repeticoes} arranques a frio")
+    print(f"{'passo':<28} {'mediana ms':>11} {'mín ms':>8} {'máx ms':>8}")
+    for passo in medicoes[0]['tempos']:
+        valores = [m['tempos'][passo] * 1000 for m in medicoes]
+        print(f"{passo:<28} {statistics.median(valores):>11.1f} {min(valores):>8.1f} {max(valores):>8.1f}")
+    print("módulos carregados:")
+    for passo, modulos in medicoes[0]['carregados'].items():
+        print(f"  depois de {passo}: {', '.join(modulos)}")
+
+if __name__ == '__main__':
+    if '--filho' in sys.argv:
+        filho()
+    else:
+        main()
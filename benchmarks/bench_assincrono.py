@@ -0,0 +1,125 @@
+"""
+Compara a app Flask (gunicorn gthread) com a app ASGI (assincrono.py, gunicorn
+com workers do uvicorn), ambas num só processo, com a Graph API falsa a
+responder com latência:
+  - webhooks: N mensagens de utilizadores diferentes, com C pedidos em
+    simultâneo; mede a latência do webhook e o tempo até todas as respostas
+    terem sido enviadas à Graph API (a fila vazia em /queue_stats);
+  - lembretes: L lembretes a avisar hoje, enviados por /check_reminders sem
+    limite de mensagens por segundo.
+
+Uso: python benchmarks/bench_assincrono.py [--mensagens 2000] [--simultaneos 500]
+     [--lembretes 500] [--latencia-ms 100] [--apps flask,asgi]
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_graph_api import ServidorGraphFalso
+from carga_servidor import arrancar, percentil
+from armazenamento import ArmazenamentoSQLite, set_armazenamento
+
+def payload(i):
+    return {'entry': [{'changes': [{'value': {'messages': [
+        {'id': f'wamid.bench.{i}', 'from': f'5511{i:08d}', 'type': 'text', 'text': {'body': f'gastei {i % 90 + 10} no mercado'}}
+    ]}}]}]}
+
+def preparar_lembretes(quantos):
+    """Grava lembretes que vencem de forma a serem avisados hoje; devolve quantos foram gravados."""
+    from agenda_lembretes import _balde, _baldes_do_dia, reconstruir_agenda
+    from database import salvar_lembrete_db
+    from registos import Lembrete
+    hoje = datetime.now()
+    dias = [v for v in range(1, 29) if _balde(v) in _baldes_do_dia(hoje)]
+    if not dias:
+        return 0
+    for i in range(quantos):
+        salvar_lembrete_db(f"5521{i:08d}", Lembrete(f"conta {i}", 50.0, dias[0], f"2024-01-01T00:00:00.{i:06d}"))
+    reconstruir_agenda()
+    return quantos
+
+async def medir_webhooks(porta, mensagens, simultaneos):
+    import aiohttp
+    latencias = []
+    semaforo = asyncio.Semaphore(simultaneos)
+    url = f"http://127.0.0.1:{porta}"
+    conector = aiohttp.TCPConnector(limit=simultaneos)
+    async with aiohttp.ClientSession(connector=conector, timeout=aiohttp.ClientTimeout(total=120)) as sessao:
+        async def um(i):
+            async with semaforo:
+                inicio = time.perf_counter()
+                async with sessao.post(f"{url}/webhook", json=payload(i)) as resposta:
+                    await resposta.read()
+                    assert resposta.status == 200, resposta.status
+                latencias.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(um(i) for i in range(mensagens)))
+        aceites = time.perf_counter() - inicio
+        # Até a fila ter processado (e respondido) tudo; uma conexão nova por consulta,
+        # porque as do pool podem ter sido fechadas pelo servidor entretanto.
+        while True:
+            async with aiohttp.request('GET', f"{url}/queue_stats", connector=aiohttp.TCPConnector(force_close=True)) as resposta:
+                estatisticas = json.loads(await resposta.read())
+            if estatisticas['processadas'] >= mensagens and estatisticas['profundidade'] == 0:
+                break
+            await asyncio.sleep(0.05)
+        respondidas = time.perf_counter() - inicio
+    return sorted(latencias), aceites, respondidas
+
+async def medir_lembretes(porta):
+    import aiohttp
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=600)) as sessao:
+        inicio = time.perf_counter()
+        async with sessao.get(f"http://127.0.0.1:{porta}/check_reminders") as resposta:
+            await resposta.read()
+            assert resposta.status == 200, resposta.status
+        return time.perf_counter() - inicio
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mensagens', type=int, default=2000)
+    parser.add_argument('--simultaneos', type=int, default=500)
+    parser.add_argument('--lembretes', type=int, default=500)
+    parser.add_argument('--latencia-ms', type=float, default=100)
+    parser.add_argument('--apps', default='flask,asgi')
+    parser.add_argument('--porta', type=int, default=8182)
+    args = parser.parse_args()
+
+    graph = ServidorGraphFalso(latencia_ms=args.latencia_ms).iniciar()
+    pasta = tempfile.mkdtemp()
+    print(f"{args.mensagens} mensagens ({args.simultaneos} em simultâneo), {args.lembretes} lembretes, "
+          f"Graph API com {args.latencia_ms:.0f} ms")
+    print(f"{'app':<6} {'webhooks/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'respostas s':>12} {'lembretes s':>12} {'enviadas':>9}")
+    for i, nome in enumerate(args.apps.split(',')):
+        caminho = os.path.join(pasta, f'{i}_{nome}.db')
+        set_armazenamento(ArmazenamentoSQLite(caminho))
+        lembretes = preparar_lembretes(args.lembretes)
+        ambiente = dict(os.environ, LALABANK_ARMAZENAMENTO='sqlite', LALABANK_SQLITE=caminho,
+                        WHATSAPP_API_URL=graph.url_base, LALABANK_LEMBRETES_POR_SEGUNDO='0',
+                        LALABANK_ASGI='1' if nome == 'asgi' else '0')
+        recebidas_antes = len(graph.recebidas)
+        processo = arrancar(1, args.porta, ambiente)
+        try:
+            latencias, aceites, respondidas = asyncio.run(medir_webhooks(args.porta, args.mensagens, args.simultaneos))
+            segundos_lembretes = asyncio.run(medir_lembretes(args.porta)) if lembretes else 0
+        finally:
+            processo.send_signal(signal.SIGTERM)
+            processo.wait(timeout=60)
+        print(f"{nome:<6} {args.mensagens / aceites:>10.0f} {percentil(latencias, 0.5) * 1000:>8.1f} "
+              f"{percentil(latencias, 0.99) * 1000:>8.1f} {respondidas:>12.2f} {segundos_lembretes:>12.2f} "
+              f"{len(graph.recebidas) - recebidas_antes:>9}")
+    graph.shutdown()
+
+if __name__ == '__main__':
+    main()
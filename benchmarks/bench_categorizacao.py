@@ -0,0 +1,82 @@
+"""
+Microbenchmark: categorização por ciclo de substrings (implementação antiga)
+vs. classificador Aho–Corasick de categorizador.py.
+
+Uso: python benchmarks/bench_categorizacao.py [--palavras N]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from categorizador import ClassificadorPalavras
+
+CATEGORIAS_PADRAO = {
+    'Pagamentos': ['cartão de crédito', 'fatura', 'pagamento fatura'],
+    'Compras': ['mercado pago', 'mercado livre', 'compras a vista', 'compras parceladas', 'computec'],
+    'Assinaturas': ['assinatura', 'apple', 'netflix'], 'Investimentos': ['poupança', 'investi'],
+    'Cuidados Pessoais': ['barbearia'], 'Educação': ['educação', 'curso', 'livro', 'puc'],
+    'Saúde': ['farmacia', 'médico', 'remédio'],
+    'Alimentação': ['ifood', 'marmitex', 'mercado', 'restaurante', 'dualcoffe', 'café', 'pizza', 'lanche'],
+    'Transporte': ['carro', 'combustivel', 'combustível', 'uber', '99', 'gasolina', 'transporte'],
+    'Salário': ['salário'], 'Outras Receitas': ['recebi', 'ganhei'], 'Outros': []
+}
+IGNORAR = ('Salário', 'Outras Receitas')
+
+MENSAGENS = [
+    "gastei 45,90 no ifood com cartão nubank",
+    "paguei 120 de gasolina no débito itaú",
+    "comprei um livro de 59,90 no pix",
+    "gastei 32 reais na barbearia",
+    "paguei a fatura do cartão de crédito 1500",
+    "gastei 18 com uber",
+    "comprei remédio na farmacia 27,50",
+    "gastei 9,90 na assinatura netflix",
+    "paguei 250 reais na loja de roupas",
+    "gastei 12 num café com a equipa",
+]
+
+def categorizar_ciclo(categorias, descricao_lower):
+    for categoria, palavras in categorias.items():
+        if categoria not in IGNORAR:
+            if any(palavra in descricao_lower for palavra in palavras):
+                return categoria
+    return None
+
+def gerar_categorias(num_palavras, semente=42):
+    rng = random.Random(semente)
+    categorias = dict(CATEGORIAS_PADRAO)
+    letras = 'abcdefghijklmnopqrstuvwxyz'
+    for i in range(num_palavras // 20):
+        categorias[f'Personalizada {i}'] = [''.join(rng.choice(letras) for _ in range(rng.randint(4, 10))) for _ in range(20)]
+    return categorias
+
+def medir(categorias, repeticoes):
+    classificador = ClassificadorPalavras(categorias, IGNORAR)
+    textos = [m.lower() for m in MENSAGENS]
+    for texto in textos:
+        assert classificador.classificar(texto) == categorizar_ciclo(categorias, texto), texto
+
+    t_ciclo = timeit.timeit(lambda: [categorizar_ciclo(categorias, t) for t in textos], number=repeticoes)
+    t_automato = timeit.timeit(lambda: [classificador.classificar(t) for t in textos], number=repeticoes)
+    t_construcao = timeit.timeit(lambda: ClassificadorPalavras(categorias, IGNORAR), number=10) / 10
+    n = repeticoes * len(textos)
+    return t_ciclo / n * 1e6, t_automato / n * 1e6, t_construcao * 1e3
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeticoes', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'palavras':>9} {'ciclo (µs)':>11} {'autómato (µs)':>14} {'construção (ms)':>16}")
+    for num_palavras in (0, 200, 1000, 5000):
+        categorias = gerar_categorias(num_palavras)
+        total = sum(len(p) for p in categorias.values())
+        ciclo, automato, construcao = medir(categorias, args.repeticoes)
+        print(f"{total:>9} {ciclo:>11.2f} {automato:>14.2f} {construcao:>16.2f}")
+
+if __name__ == '__main__':
+    main()
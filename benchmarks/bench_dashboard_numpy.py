@@ -0,0 +1,71 @@
+"""
+Benchmark do dashboard: o caminho normal (dashboard_calculations, sobre os
+agregados materializados) vs. o caminho colunar de dashboard_numpy.py, que
+recalcula tudo a partir do histórico. Os dois correm sobre o mesmo utilizador
+gerado num KV em memória e o benchmark confirma que devolvem o mesmo
+dicionário: todas as chaves, com os números comparados com tolerância de
+arredondamento.
+
+Uso: python benchmarks/bench_dashboard_numpy.py [--tamanhos 10000,100000,1000000]
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kv_memoria import KVMemoria
+from gerador_dados import gerar_usuario
+from armazenamento import ArmazenamentoReplit, set_armazenamento
+from dashboard_numpy import calcular_dados_dashboard_numpy, numpy_disponivel
+import dashboard_calculations
+
+def diferencas(a, b, caminho='dados'):
+    """Diferenças entre dois dicionários do dashboard; os números são comparados com tolerância."""
+    if isinstance(a, dict) and isinstance(b, dict):
+        if a.keys() != b.keys():
+            return [f"{caminho}: chaves diferentes {sorted(map(str, a.keys() ^ b.keys()))}"]
+        return [d for chave in a for d in diferencas(a[chave], b[chave], f"{caminho}[{chave!r}]")]
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        if len(a) != len(b):
+            return [f"{caminho}: {len(a)} != {len(b)} elementos"]
+        return [d for i, (x, y) in enumerate(zip(a, b)) for d in diferencas(x, y, f"{caminho}[{i}]")]
+    numeros = (int, float)
+    if isinstance(a, numeros) and isinstance(b, numeros) and not isinstance(a, bool) and not isinstance(b, bool):
+        return [] if math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6) else [f"{caminho}: {a!r} != {b!r}"]
+    return [] if a == b else [f"{caminho}: {a!r} != {b!r}"]
+
+def medir(funcao, repeticoes):
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tamanhos', default='10000,100000,1000000')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    if not numpy_disponivel():
+        sys.exit("NumPy não está instalado.")
+    dashboard_calculations.USAR_NUMPY = False
+
+    print(f"{'transações':>11} {'agregados (ms)':>15} {'numpy (ms)':>11}")
+    for tamanho in (int(t) for t in args.tamanhos.split(',')):
+        set_armazenamento(ArmazenamentoReplit(KVMemoria()))
+        user_id = f"dashboard_{tamanho}"
+        gerar_usuario(user_id, transacoes=tamanho, parceladas=200, meses=72)
+        t_agregados, normal = medir(lambda: dashboard_calculations.calcular_dados_dashboard(user_id), args.repeticoes)
+        t_numpy, colunar = medir(lambda: calcular_dados_dashboard_numpy(user_id), args.repeticoes)
+        erros = diferencas(normal, colunar)
+        assert not erros, "\n".join(erros[:20])
+        print(f"{tamanho:>11} {t_agregados * 1e3:>15.1f} {t_numpy * 1e3:>11.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark de envio de mensagens contra a Graph API falsa:
+requests.post por mensagem, em série (implementação antiga) vs. ClienteWhatsApp
+(pool keep-alive + envio concorrente entre números).
+
+Uso: python benchmarks/bench_envio.py [--numeros 50] [--partes 2] [--latencia-ms 30]
+"""
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_graph_api import ServidorGraphFalso
+from whatsapp import ClienteWhatsApp
+
+def enviar_em_serie(url, envios):
+    for phone_number, mensagens in envios:
+        for message in mensagens:
+            data = {"messaging_product": "whatsapp", "to": phone_number, "text": {"body": message}}
+            requests.post(url, json=data, headers={"Authorization": "Bearer x"}).raise_for_status()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--numeros", type=int, default=50)
+    parser.add_argument("--partes", type=int, default=2)
+    parser.add_argument("--latencia-ms", type=float, default=30)
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="fração de respostas 429/503 (só no cliente novo)")
+    args = parser.parse_args()
+
+    envios = [(f"5511{i:08d}", [f"parte {p + 1}" for p in range(args.partes)]) for i in range(args.numeros)]
+    total = args.numeros * args.partes
+
+    servidor = ServidorGraphFalso(latencia_ms=args.latencia_ms).iniciar()
+    inicio = time.perf_counter()
+    enviar_em_serie(f"{servidor.url_base}/123/messages", envios)
+    t_serie = time.perf_counter() - inicio
+    servidor.shutdown()
+
+    servidor = ServidorGraphFalso(latencia_ms=args.latencia_ms, taxa_429=args.taxa_erro / 2,
+                                  taxa_5xx=args.taxa_erro / 2, semente=1).iniciar()
+    cliente = ClienteWhatsApp("x", "123", url_base=servidor.url_base, concorrencia=args.concorrencia, backoff=0.01)
+    inicio = time.perf_counter()
+    resultados = cliente.enviar_lote(envios)
+    t_cliente = time.perf_counter() - inicio
+    servidor.shutdown()
+
+    # Ordem por número preservada?
+    por_numero = {}
+    for phone_number, body in servidor.recebidas:
+        por_numero.setdefault(phone_number, []).append(body)
+    ordem_ok = all(por_numero.get(p) == m for p, m in envios)
+
+    print(f"mensagens: {total}, latência simulada: {args.latencia_ms} ms")
+    print(f"em série (requests.post): {t_serie:.2f} s  ({total / t_serie:.0f} msg/s)")
+    print(f"ClienteWhatsApp:          {t_cliente:.2f} s  ({total / t_cliente:.0f} msg/s), "
+          f"entregues {sum(resultados)}/{len(resultados)} números, ordem preservada: {ordem_ok}, "
+          f"conexões usadas: {len(servidor.conexoes)}")
+
+if __name__ == "__main__":
+    main()
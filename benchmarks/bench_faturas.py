@@ -0,0 +1,84 @@
+"""
+Benchmark do histórico de faturas (faturas.py): para cada utilizador gerado,
+pede as faturas dos últimos N meses três vezes:
+  - "sempre calculado": todas as faturas a partir das transações e parcelas,
+    como antes dos resumos guardados;
+  - "primeira leitura": calcula e guarda os resumos dos meses fechados;
+  - "leituras seguintes": só a fatura aberta é calculada.
+Confirma também que os resumos guardados são iguais ao cálculo completo.
+
+Uso: python benchmarks/bench_faturas.py [--usuarios 10] [--transacoes 5000] [--meses 24]
+     [--armazenamento memoria|sqlite]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kv_memoria import KVMemoria
+from gerador_dados import gerar_usuario
+from armazenamento import ArmazenamentoReplit, ArmazenamentoSQLite, set_armazenamento
+
+def sempre_calculado(user_id, primeiro, ultimo):
+    from database import get_cartoes_conhecidos, get_regras_cartoes_db, get_compras_parceladas_db
+    from faturas import calcular_faturas
+    from parcelas import get_plano_parcelas, DIA_FECHAMENTO_PADRAO
+    regras = get_regras_cartoes_db(user_id)
+    dias = {cartao: regras.get(cartao, DIA_FECHAMENTO_PADRAO) for cartao in get_cartoes_conhecidos(user_id)}
+    plano = get_plano_parcelas(user_id, get_compras_parceladas_db(user_id), regras)
+    return {indice: calcular_faturas(user_id, indice, dias, plano) for indice in range(primeiro, ultimo + 1)}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--usuarios', type=int, default=10)
+    parser.add_argument('--transacoes', type=int, default=5000)
+    parser.add_argument('--meses', type=int, default=24)
+    parser.add_argument('--armazenamento', choices=['memoria', 'sqlite'], default='memoria')
+    args = parser.parse_args()
+
+    if args.armazenamento == 'sqlite':
+        set_armazenamento(ArmazenamentoSQLite(os.path.join(tempfile.mkdtemp(), 'faturas.db')))
+    else:
+        set_armazenamento(ArmazenamentoReplit(KVMemoria()))
+    from faturas import faturas_dos_meses
+    from parcelas import indice_mes
+
+    usuarios = [f"5500{i:08d}" for i in range(args.usuarios)]
+    for i, user_id in enumerate(usuarios):
+        gerar_usuario(user_id, semente=i, transacoes=args.transacoes, meses=args.meses)
+    ultimo = indice_mes(datetime.now())
+    primeiro = ultimo - args.meses + 1
+
+    tempos = {'sempre calculado': [], 'primeira leitura': [], 'leituras seguintes': []}
+    for user_id in usuarios:
+        inicio = time.perf_counter()
+        completo = sempre_calculado(user_id, primeiro, ultimo)
+        tempos['sempre calculado'].append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        faturas_dos_meses(user_id, primeiro, ultimo)
+        tempos['primeira leitura'].append(time.perf_counter() - inicio)
+
+        for _ in range(5):
+            inicio = time.perf_counter()
+            guardadas = faturas_dos_meses(user_id, primeiro, ultimo)
+            tempos['leituras seguintes'].append(time.perf_counter() - inicio)
+
+        for (indice, calculadas), por_cartao in zip(completo.items(), guardadas.values()):
+            for cartao, resumo in calculadas.items():
+                assert abs(por_cartao[cartao]['total'] - resumo['total']) < 1e-6, (user_id, indice, cartao)
+
+    print(f"{args.usuarios} utilizadores x {args.transacoes} transações, {args.meses} meses, "
+          f"armazenamento {args.armazenamento}")
+    print(f"{'':<20} {'mediana ms':>11} {'máx ms':>8}")
+    for nome, valores in tempos.items():
+        print(f"{nome:<20} {statistics.median(valores) * 1000:>11.2f} {max(valores) * 1000:>8.2f}")
+
+if __name__ == '__main__':
+    main()
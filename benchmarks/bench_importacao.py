@@ -0,0 +1,115 @@
+"""
+Benchmark da importação e exportação em massa (importacao.py): um extrato
+bancário em CSV (";", dd/mm/aaaa, "1.234,56") e o mesmo histórico em JSONL,
+importados para um armazenamento em memória (KVMemoria) ou SQLite, e depois
+exportados de volta. Reporta linhas por segundo e o pico de memória
+(tracemalloc, numa passagem separada para não afetar os tempos), que não deve
+crescer com o tamanho do ficheiro. Antes, confirma que duas importações com
+lançamentos no mesmo dia (só com data) geram timestamps diferentes e que
+apagar um não apaga o outro, e que uma linha JSONL com campos de outro tipo é
+reportada em vez de interromper a importação.
+
+Uso: python benchmarks/bench_importacao.py [--linhas 100000] [--armazenamento sqlite]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kv_memoria import KVMemoria
+from gerador_dados import gerar_transacoes, DESCRICOES_DESPESA
+from armazenamento import ArmazenamentoReplit, ArmazenamentoSQLite, set_armazenamento
+
+CATEGORIAS = {c: [] for c in ['Alimentação', 'Transporte', 'Compras', 'Saúde', 'Salário', 'Outras Receitas', 'Outros']}
+
+def escrever_csv_banco(caminho, linhas, rng):
+    with open(caminho, 'w', encoding='utf-8') as f:
+        f.write("Data;Histórico;Valor\n")
+        for t in gerar_transacoes(rng, linhas, CATEGORIAS, meses=36):
+            data = f"{t['timestamp'][8:10]}/{t['timestamp'][5:7]}/{t['timestamp'][:4]}"
+            valor = f"{t['valor']:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.')
+            sinal = '-' if t['tipo'] == 'despesa' else ''
+            descricao = rng.choice(DESCRICOES_DESPESA) if t['tipo'] == 'despesa' else t['descricao']
+            f.write(f"{data};{descricao.upper()};{sinal}{valor}\n")
+
+def escrever_jsonl(caminho, linhas, rng):
+    with open(caminho, 'w', encoding='utf-8') as f:
+        for t in gerar_transacoes(rng, linhas, CATEGORIAS, meses=36):
+            f.write(json.dumps(t, ensure_ascii=False) + '\n')
+
+def medir(funcao, *args):
+    """Devolve (resultado, segundos, pico de memória em MB); funcao(*args, passagem) corre duas vezes."""
+    inicio = time.perf_counter()
+    resultado = funcao(*args, 'tempo')
+    segundos = time.perf_counter() - inicio
+    tracemalloc.start()
+    funcao(*args, 'memoria')
+    pico = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return resultado, segundos, pico
+
+def importar(caminho, formato, passagem):
+    from importacao import importar_transacoes
+    with open(caminho, encoding='utf-8', newline='') as f:
+        return importar_transacoes(f"import_{formato}_{passagem}", f, formato, conta='Itaú')
+
+def exportar(user_id, formato, passagem):
+    from importacao import exportar_transacoes
+    return sum(bocado.count('\n') for bocado in exportar_transacoes(user_id, formato))
+
+def verificar_mesmo_dia():
+    from database import apagar_transacao_db, get_transacoes_db
+    from importacao import importar_transacoes
+    user_id = "import_mesmo_dia"
+    for descricao in ('MERCADO', 'FARMACIA'):
+        resumo = importar_transacoes(user_id, ["Data;Histórico;Valor", f"05/01/2024;{descricao};-10,00"], 'csv')
+        assert resumo['importadas'] == 1, resumo
+    timestamps = [t.timestamp for t in get_transacoes_db(user_id)]
+    assert len(set(timestamps)) == 2 and all(ts.startswith('2024-01-05T00:') for ts in timestamps), timestamps
+    apagar_transacao_db(user_id, timestamps[0])
+    assert [t.timestamp for t in get_transacoes_db(user_id)] == timestamps[1:]
+
+    linhas = [json.dumps(dict({'valor': 1, 'timestamp': '2024-01-06'}, **campos))
+              for campos in ({'descricao': 5}, {'tipo': 1}, {'descricao': 'ok'})]
+    resumo = importar_transacoes(user_id, linhas, 'jsonl')
+    assert resumo['importadas'] == 1 and [n for n, _ in resumo['erros']] == [1, 2], resumo
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--linhas', type=int, default=100000)
+    parser.add_argument('--armazenamento', choices=['memoria', 'sqlite'], default='memoria')
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp()
+    if args.armazenamento == 'sqlite':
+        set_armazenamento(ArmazenamentoSQLite(os.path.join(pasta, 'bench.db')))
+    else:
+        set_armazenamento(ArmazenamentoReplit(KVMemoria()))
+
+    verificar_mesmo_dia()
+    rng = random.Random(0)
+    ficheiros = {'csv': os.path.join(pasta, 'extrato.csv'), 'jsonl': os.path.join(pasta, 'extrato.jsonl')}
+    escrever_csv_banco(ficheiros['csv'], args.linhas, rng)
+    escrever_jsonl(ficheiros['jsonl'], args.linhas, rng)
+
+    print(f"{args.linhas} linhas, armazenamento {args.armazenamento}")
+    print(f"{'operação':<18} {'segundos':>9} {'linhas/s':>10} {'pico MB':>8}")
+    for formato, caminho in ficheiros.items():
+        resumo, segundos, pico = medir(importar, caminho, formato)
+        assert resumo['importadas'] == args.linhas and not resumo['erros'], resumo['erros'][:5]
+        print(f"{'importar ' + formato:<18} {segundos:>9.2f} {args.linhas / segundos:>10.0f} {pico:>8.1f}")
+
+        for saida in ('csv', 'jsonl'):
+            linhas, segundos, pico = medir(exportar, f"import_{formato}_tempo", saida)
+            assert linhas == args.linhas + (saida == 'csv')
+            print(f"{'exportar ' + saida:<18} {segundos:>9.2f} {args.linhas / segundos:>10.0f} {pico:>8.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark de memória: transações em memória como dicionários (lidos do JSON e
+copiados com dict(t, is_deletable=True), como o dashboard fazia) vs. registos
+com __slots__ de registos.py. Mede a memória retida pela lista carregada
+(tracemalloc) e o tempo de carregamento, para utilizadores grandes.
+
+Uso: python benchmarks/bench_registos.py [--tamanhos 10000,100000,500000]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from registos import Transacao
+from gerador_dados import gerar_transacoes
+
+CATEGORIAS = {c: [] for c in ['Alimentação', 'Transporte', 'Compras', 'Saúde', 'Educação', 'Assinaturas',
+                              'Salário', 'Outras Receitas', 'Outros']}
+
+def como_dicionarios(bruto):
+    return [dict(t, is_deletable=True) for t in json.loads(bruto)]
+
+def como_registos(bruto):
+    return [Transacao.de_dict(t) for t in json.loads(bruto)]
+
+def medir(carregar, bruto):
+    """Devolve (memória retida em bytes, tempo de carregamento em segundos)."""
+    gc.collect()
+    tracemalloc.start()
+    resultado = carregar(bruto)
+    retida = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del resultado
+    gc.collect()
+
+    # Medido antes de o resultado ser libertado, para não contar a libertação.
+    inicio = time.perf_counter()
+    resultado = carregar(bruto)
+    duracao = time.perf_counter() - inicio
+    del resultado
+    return retida, duracao
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tamanhos', default='10000,100000,500000')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'transações':>11} {'dicts MB':>9} {'registos MB':>12} {'redução':>8} "
+          f"{'B/transação':>17} {'dicts ms':>9} {'registos ms':>12}")
+    for tamanho in (int(t) for t in args.tamanhos.split(',')):
+        # Como vem do armazenamento: uma string JSON por segmento; aqui, uma só.
+        bruto = json.dumps(gerar_transacoes(rng, tamanho, CATEGORIAS, meses=60))
+        amostra = json.loads(bruto)[:1000]
+        assert [Transacao.de_dict(t).para_dict() for t in amostra] == [
+            {c: t.get(c) for c in Transacao.CAMPOS} for t in amostra]
+
+        mem_dicts, t_dicts = medir(como_dicionarios, bruto)
+        mem_registos, t_registos = medir(como_registos, bruto)
+        print(f"{tamanho:>11} {mem_dicts / 2**20:>9.1f} {mem_registos / 2**20:>12.1f} "
+              f"{1 - mem_registos / mem_dicts:>7.0%} {mem_dicts / tamanho:>8.0f} -> {mem_registos / tamanho:>5.0f} "
+              f"{t_dicts * 1e3:>9.1f} {t_registos * 1e3:>12.1f}")
+
+if __name__ == '__main__':
+    main()
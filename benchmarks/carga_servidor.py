@@ -0,0 +1,135 @@
+"""
+Teste de carga do servidor de produção (servidor.py): gera utilizadores num
+SQLite temporário, arranca o servidor com 1, 2, 4... workers e, para cada
+configuração, dispara pedidos HTTP concorrentes (relatório anual, página do
+extrato e dashboard, misturados) durante alguns segundos. Reporta pedidos por
+segundo e latências, que devem crescer com os workers até ao número de CPUs.
+Termina com erro se algum pedido falhar (estado diferente de 200 ou conexão
+perdida).
+
+Os caches partilhados ficam num ficheiro próprio (LALABANK_CACHE=sqlite).
+
+Uso: python benchmarks/carga_servidor.py [--workers 1,2,4] [--clientes 16] [--segundos 10]
+     [--usuarios 20] [--transacoes 2000] [--rotas relatorio,extrato,dashboard]
+"""
+import argparse
+import http.client
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from gerador_dados import gerar_usuario
+from armazenamento import ArmazenamentoSQLite, set_armazenamento
+
+ROTAS = {
+    'relatorio': lambda user_id, ano: f"/api/relatorio/{user_id}?periodo={ano}",
+    'extrato': lambda user_id, ano: f"/api/transacoes/{user_id}",
+    'dashboard': lambda user_id, ano: f"/dashboard/{user_id}",
+}
+
+def percentil(ordenados, p):
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))] if ordenados else 0
+
+def arrancar(workers, porta, ambiente):
+    ambiente = dict(ambiente, LALABANK_WORKERS=str(workers), LALABANK_PORTA=str(porta))
+    processo = subprocess.Popen([sys.executable, os.path.join(RAIZ, 'servidor.py')], env=ambiente, cwd=RAIZ,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        try:
+            conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=2)
+            conexao.request('GET', '/queue_stats')
+            conexao.getresponse().read()
+            return processo
+        except OSError:
+            time.sleep(0.2)
+    processo.kill()
+    raise RuntimeError("o servidor não arrancou")
+
+def carga(porta, caminhos, clientes, segundos):
+    """Cada cliente repete pedidos numa conexão keep-alive; devolve (latências, erros)."""
+    latencias, erros = [], [0]
+    lock = threading.Lock()
+    fim = time.monotonic() + segundos
+
+    def cliente(semente):
+        rng = random.Random(semente)
+        conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+        minhas = []
+        while time.monotonic() < fim:
+            inicio = time.perf_counter()
+            try:
+                conexao.request('GET', rng.choice(caminhos))
+                resposta = conexao.getresponse()
+                resposta.read()
+                ok = resposta.status == 200
+            except (OSError, http.client.HTTPException):
+                conexao.close()
+                conexao = http.client.HTTPConnection('127.0.0.1', porta, timeout=30)
+                ok = False
+            if ok:
+                minhas.append(time.perf_counter() - inicio)
+            else:
+                with lock:
+                    erros[0] += 1
+        with lock:
+            latencias.extend(minhas)
+
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sorted(latencias), erros[0]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--clientes', type=int, default=16)
+    parser.add_argument('--segundos', type=float, default=10)
+    parser.add_argument('--usuarios', type=int, default=20)
+    parser.add_argument('--transacoes', type=int, default=2000)
+    parser.add_argument('--rotas', default='relatorio,extrato,dashboard')
+    parser.add_argument('--porta', type=int, default=8181)
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp()
+    caminho = os.path.join(pasta, 'carga.db')
+    set_armazenamento(ArmazenamentoSQLite(caminho))
+    usuarios = [f"5500{i:08d}" for i in range(args.usuarios)]
+    for user_id in usuarios:
+        gerar_usuario(user_id, transacoes=args.transacoes)
+    ano = time.localtime().tm_year
+    caminhos = [ROTAS[rota](u, a) for rota in args.rotas.split(',') for u in usuarios for a in (ano, ano - 1)]
+
+    print(f"{os.cpu_count()} CPUs, {len(usuarios)} utilizadores x {args.transacoes} transações, "
+          f"{args.clientes} clientes, rotas: {args.rotas}")
+    print(f"{'workers':>7} {'pedidos/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'erros':>6}")
+    falhas = {}
+    for workers in [int(w) for w in args.workers.split(',')]:
+        ambiente = dict(os.environ, LALABANK_ARMAZENAMENTO='sqlite', LALABANK_SQLITE=caminho,
+                        LALABANK_CACHE='sqlite', LALABANK_CACHE_SQLITE=os.path.join(pasta, f'cache_{workers}.db'))
+        processo = arrancar(workers, args.porta, ambiente)
+        try:
+            latencias, erros = carga(args.porta, caminhos, args.clientes, args.segundos)
+        finally:
+            processo.send_signal(signal.SIGTERM)
+            processo.wait(timeout=60)
+        print(f"{workers:>7} {len(latencias) / args.segundos:>10.0f} {percentil(latencias, 0.5) * 1000:>8.1f} "
+              f"{percentil(latencias, 0.95) * 1000:>8.1f} {percentil(latencias, 0.99) * 1000:>8.1f} {erros:>6}")
+        if erros:
+            falhas[workers] = erros
+    if falhas:
+        sys.exit(f"pedidos falhados (workers: erros): {falhas}")
+
+if __name__ == '__main__':
+    main()
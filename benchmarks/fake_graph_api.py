@@ -0,0 +1,96 @@
+"""
+Servidor falso da Graph API do WhatsApp, para testes locais e benchmarks de envio.
+
+Aceita POST /<versão>/<phone_number_id>/messages e responde como a Meta,
+com latência e taxas de erro configuráveis. As mensagens recebidas ficam em
+servidor.recebidas (por ordem de chegada).
+
+Uso isolado:  python benchmarks/fake_graph_api.py --porta 8099 --latencia-ms 50
+e depois:     WHATSAPP_API_URL=http://127.0.0.1:8099/v18.0 python main.py
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, como a API real
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, status, corpo, headers=None):
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        for nome, valor in (headers or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_POST(self):
+        servidor = self.server
+        corpo = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with servidor.lock:
+            servidor.conexoes.add(self.client_address)
+        if servidor.latencia:
+            time.sleep(servidor.latencia)
+
+        sorteio = servidor.rng.random()
+        if sorteio < servidor.taxa_429:
+            return self._responder(429, {"error": {"message": "rate limited"}}, {"Retry-After": "0"})
+        if sorteio < servidor.taxa_429 + servidor.taxa_5xx:
+            return self._responder(503, {"error": {"message": "unavailable"}})
+
+        with servidor.lock:
+            servidor.recebidas.append((corpo.get("to"), corpo.get("text", {}).get("body")))
+        self._responder(200, {"messaging_product": "whatsapp", "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}]})
+
+
+class ServidorGraphFalso(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # milhares de conexões simultâneas nos benchmarks do cliente assíncrono
+
+    def __init__(self, porta=0, latencia_ms=0, taxa_429=0.0, taxa_5xx=0.0, semente=None):
+        super().__init__(("127.0.0.1", porta), _Handler)
+        self.latencia = latencia_ms / 1000
+        self.taxa_429, self.taxa_5xx = taxa_429, taxa_5xx
+        self.rng = random.Random(semente)
+        self.lock = threading.Lock()
+        self.recebidas = []
+        self.conexoes = set()
+
+    def handle_error(self, request, client_address):
+        # Clientes que fecham as conexões keep-alive no fim não são erros.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def url_base(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v18.0"
+
+    def iniciar(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--porta", type=int, default=8099)
+    parser.add_argument("--latencia-ms", type=float, default=0)
+    parser.add_argument("--taxa-429", type=float, default=0.0)
+    parser.add_argument("--taxa-5xx", type=float, default=0.0)
+    args = parser.parse_args()
+    servidor = ServidorGraphFalso(args.porta, args.latencia_ms, args.taxa_429, args.taxa_5xx)
+    print(f"Graph API falsa em {servidor.url_base}")
+    servidor.serve_forever()
+
+if __name__ == "__main__":
+    main()
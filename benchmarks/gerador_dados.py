@@ -0,0 +1,134 @@
+"""
+Gerador de utilizadores sintéticos para benchmarks.
+
+Os dados são gravados pelas funções do database.py (transações em lote,
+parceladas, lembretes, categorias e metas), por isso agregados, agenda de
+lembretes e índices ficam como em produção. Com a mesma semente o resultado
+é sempre o mesmo.
+
+Uso isolado (grava num SQLite):
+    LALABANK_ARMAZENAMENTO=sqlite LALABANK_SQLITE=/tmp/bench.db \
+        python benchmarks/gerador_dados.py --usuarios 20 --transacoes 5000
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import (
+    salvar_transacoes_db, salvar_compra_parcelada_db, salvar_lembrete_db,
+    get_categorias, set_user_data, salvar_meta_db
+)
+
+CONTAS = ['Swile', 'Itaú', 'Nubank', 'Inter']
+CARTOES = ['Mercado Pago', 'Nubank', 'Itaú']
+DESCRICOES_DESPESA = [
+    'ifood', 'mercado', 'uber', 'gasolina', 'farmacia', 'netflix', 'restaurante', 'curso de inglês',
+    'barbearia', 'pizza', 'mercado livre', 'assinatura apple', 'café', 'livro', 'padaria', 'presente',
+]
+DESCRICOES_RECEITA = ['salário', 'recebi pix', 'ganhei bônus', 'reembolso']
+LEMBRETES = ['aluguel', 'luz', 'água', 'internet', 'condomínio', 'academia', 'celular', 'seguro']
+
+
+def _categorias_extra(rng, quantidade):
+    """Categorias adicionais com palavras-chave inventadas, como as que os utilizadores criam."""
+    silabas = ['ba', 'ce', 'di', 'fo', 'gu', 'la', 'me', 'ni', 'po', 'ru', 'sa', 'te', 'vi', 'zo']
+    return {
+        f"Extra{i}": [''.join(rng.choice(silabas) for _ in range(3)) for _ in range(rng.randint(2, 8))]
+        for i in range(quantidade)
+    }
+
+def gerar_transacoes(rng, quantidade, categorias, meses=24, fim=None):
+    fim = fim or datetime.now()
+    inicio = fim - timedelta(days=30 * meses)
+    segundos = int((fim - inicio).total_seconds())
+    nomes_categorias = [c for c in categorias if c not in ('Salário', 'Outras Receitas')]
+    transacoes = []
+    for _ in range(quantidade):
+        timestamp = (inicio + timedelta(seconds=rng.randrange(segundos))).isoformat()
+        if rng.random() < 0.15:
+            transacoes.append({
+                "tipo": "receita", "descricao": rng.choice(DESCRICOES_RECEITA), "valor": round(rng.uniform(100, 8000), 2),
+                "categoria": rng.choice(['Salário', 'Outras Receitas']), "metodo": "débito", "cartao": None,
+                "conta": rng.choice(CONTAS), "timestamp": timestamp
+            })
+        else:
+            credito = rng.random() < 0.5
+            transacoes.append({
+                "tipo": "despesa", "descricao": rng.choice(DESCRICOES_DESPESA), "valor": round(rng.uniform(5, 600), 2),
+                "categoria": rng.choice(nomes_categorias), "metodo": "crédito" if credito else "débito",
+                "cartao": rng.choice(CARTOES) if credito else None,
+                "conta": None if credito else rng.choice(CONTAS), "timestamp": timestamp
+            })
+    transacoes.sort(key=lambda t: t['timestamp'])
+    return transacoes
+
+def gerar_usuario(user_id, semente=0, transacoes=1000, parceladas=20, lembretes=5, categorias_extra=0, meses=24):
+    """Cria um utilizador completo no armazenamento em uso; devolve o número de itens gravados."""
+    rng = random.Random(f"{semente}-{user_id}")
+
+    categorias = get_categorias(user_id)
+    if categorias_extra:
+        # As extra ficam antes de 'Outros', que continua a ser a última
+        outros = categorias.pop('Outros', [])
+        categorias.update(_categorias_extra(rng, categorias_extra))
+        categorias['Outros'] = outros
+        set_user_data(user_id, "categorias", categorias)
+
+    salvar_transacoes_db(user_id, gerar_transacoes(rng, transacoes, categorias, meses))
+
+    agora = datetime.now()
+    for _ in range(parceladas):
+        salvar_compra_parcelada_db(user_id, {
+            "descricao": rng.choice(DESCRICOES_DESPESA), "valor_total": round(rng.uniform(100, 6000), 2),
+            "num_parcelas": rng.choice([2, 3, 4, 6, 10, 12, 18, 24]), "cartao": rng.choice(CARTOES),
+            "categoria": "Compras", "data_inicio": (agora - timedelta(days=rng.randint(0, 30 * meses))).isoformat()
+        })
+    for i in range(lembretes):
+        salvar_lembrete_db(user_id, {
+            "descricao": rng.choice(LEMBRETES), "valor": round(rng.uniform(50, 2500), 2),
+            "dia_vencimento": rng.randint(1, 31), "timestamp": (agora - timedelta(minutes=i)).isoformat()
+        })
+    for categoria in rng.sample(['Alimentação', 'Transporte', 'Compras', 'Saúde'], 2):
+        salvar_meta_db(user_id, categoria, float(rng.choice([300, 500, 1000])))
+    return transacoes + parceladas + lembretes
+
+def mensagens_realistas(rng, quantidade):
+    """Mensagens como as que chegam pelo WhatsApp: maioria despesas, algumas receitas e comandos."""
+    mensagens = []
+    for _ in range(quantidade):
+        sorteio = rng.random()
+        valor = f"{rng.uniform(3, 900):.2f}".replace('.', rng.choice(['.', ',']))
+        if sorteio < 0.45:
+            mensagens.append(f"gastei {valor} no {rng.choice(DESCRICOES_DESPESA)} no débito {rng.choice(CONTAS).lower()}")
+        elif sorteio < 0.8:
+            mensagens.append(f"paguei {valor} {rng.choice(DESCRICOES_DESPESA)} no cartão {rng.choice(CARTOES).lower()}")
+        elif sorteio < 0.93:
+            mensagens.append(f"recebi {valor} de {rng.choice(DESCRICOES_RECEITA)} na conta {rng.choice(CONTAS).lower()}")
+        elif sorteio < 0.97:
+            mensagens.append(f"meta {rng.choice(['alimentação', 'transporte', 'compras'])} {rng.randint(100, 2000)}")
+        else:
+            mensagens.append(
+                f"parcelado: {rng.choice(DESCRICOES_DESPESA)}\nvalor: {valor}\n"
+                f"parcelas: {rng.choice([2, 3, 6, 12])}\ncartão: {rng.choice(CARTOES).lower()}"
+            )
+    return mensagens
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera utilizadores sintéticos no armazenamento configurado.")
+    parser.add_argument('--usuarios', type=int, default=10)
+    parser.add_argument('--transacoes', type=int, default=1000)
+    parser.add_argument('--parceladas', type=int, default=20)
+    parser.add_argument('--lembretes', type=int, default=5)
+    parser.add_argument('--categorias-extra', type=int, default=0)
+    parser.add_argument('--semente', type=int, default=0)
+    args = parser.parse_args()
+    for i in range(args.usuarios):
+        gerar_usuario(f"5500{i:08d}", args.semente, args.transacoes, args.parceladas, args.lembretes, args.categorias_extra)
+    print(f"{args.usuarios} utilizadores gerados")
+
+if __name__ == '__main__':
+    main()
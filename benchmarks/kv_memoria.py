@@ -0,0 +1,62 @@
+"""
+Substituto em memória do replit.db para benchmarks e testes locais.
+
+Guarda cada valor serializado em JSON, como o KV real, por isso ler e gravar
+têm o custo de (de)serialização e os valores lidos são cópias independentes.
+Conta leituras, escritas e bytes transferidos.
+
+Uso: ArmazenamentoReplit(KVMemoria())
+"""
+import json
+import threading
+
+
+class KVMemoria:
+    def __init__(self):
+        self._dados = {}
+        self._lock = threading.Lock()
+        self.leituras = 0
+        self.escritas = 0
+        self.bytes_lidos = 0
+        self.bytes_escritos = 0
+
+    def get_raw(self, chave):
+        with self._lock:
+            valor = self._dados[chave]
+            self.leituras += 1
+            self.bytes_lidos += len(valor)
+        return valor
+
+    def __getitem__(self, chave):
+        return json.loads(self.get_raw(chave))
+
+    def get(self, chave, padrao=None):
+        try:
+            return self[chave]
+        except KeyError:
+            return padrao
+
+    def __setitem__(self, chave, valor):
+        self.set_raw(chave, json.dumps(valor))
+
+    def set_raw(self, chave, dados):
+        with self._lock:
+            self._dados[chave] = dados
+            self.escritas += 1
+            self.bytes_escritos += len(dados)
+
+    def __delitem__(self, chave):
+        with self._lock:
+            del self._dados[chave]
+
+    def __contains__(self, chave):
+        return chave in self._dados
+
+    def keys(self):
+        return list(self._dados)
+
+    def prefix(self, prefixo):
+        return tuple(k for k in list(self._dados) if k.startswith(prefixo))
+
+    def tamanho_total(self):
+        return sum(len(v) for v in self._dados.values())
@@ -0,0 +1,165 @@
+"""
+Teste de carga de concorrência: vários workers (threads e, com SQLite,
+processos) escrevem ao mesmo tempo para os mesmos utilizadores e no fim
+verifica-se que nenhuma escrita se perdeu:
+  - transações gravadas e agregados (n e somas) batem com o número de gravações;
+  - metas e contas novas (ler -> alterar -> gravar) estão todas lá;
+  - a versão do utilizador foi incrementada uma vez por gravação;
+  - cada id de mensagem foi aceite por um único worker na deduplicação;
+  - os baldes da agenda têm todos os lembretes.
+
+Com --sem-bloqueio o bloqueio dos backends é desligado, para mostrar que o
+teste deteta escritas perdidas.
+
+Uso: python benchmarks/stress_concorrencia.py [--armazenamento sqlite] [--processos 4]
+     [--threads 8] [--operacoes 200] [--usuarios 2] [--sem-bloqueio]
+"""
+import argparse
+import contextlib
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from kv_memoria import KVMemoria
+import armazenamento as modulo_armazenamento
+from armazenamento import ArmazenamentoReplit, ArmazenamentoSQLite, set_armazenamento, get_armazenamento
+
+def criar_armazenamento(tipo, caminho, kv=None):
+    if tipo == 'sqlite':
+        return ArmazenamentoSQLite(caminho)
+    return ArmazenamentoReplit(kv)
+
+def desligar_bloqueio():
+    sem_bloqueio = lambda self, user_id: contextlib.nullcontext()
+    modulo_armazenamento.ArmazenamentoReplit.bloqueio = sem_bloqueio
+    # No SQLite, cada escrita continua a ser uma transação, mas ler e gravar deixam de estar juntos.
+    modulo_armazenamento.ArmazenamentoSQLite.bloqueio = sem_bloqueio
+
+def operacoes(worker, thread, n, usuarios):
+    """Escritas de uma thread: cada operação i grava uma transação, uma meta e uma conta com nomes únicos."""
+    from database import salvar_transacao_db, salvar_meta_db, adicionar_conta_db, salvar_lembrete_db
+    from deduplicacao import Deduplicador
+    from registos import Transacao, Lembrete
+
+    deduplicador = Deduplicador()
+    aceites = 0
+    for i in range(n):
+        user_id = usuarios[i % len(usuarios)]
+        sufixo = f"{worker}x{thread}x{i}"
+        timestamp = f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}T10:00:00.{worker:02d}{thread:02d}{i % 100:02d}"
+        salvar_transacao_db(user_id, Transacao('despesa', f"teste {sufixo}", 1.0, 'Outros', 'débito', None, 'Itaú', timestamp))
+        salvar_meta_db(user_id, f"Meta{sufixo}", i)
+        adicionar_conta_db(user_id, f"conta{sufixo}")
+        if i % 10 == 0:
+            salvar_lembrete_db(user_id, Lembrete(f"lembrete {sufixo}", 1.0, i % 28 + 1, timestamp))
+        # Os mesmos ids chegam a todos os workers, como um reenvio da Meta entregue a processos diferentes.
+        aceites += len(deduplicador.registrar_persistente_varios(user_id, [f"wamid.{user_id}.{i}"]))
+    return aceites
+
+def worker(tipo, caminho, indice, threads, n, usuarios, sem_bloqueio, kv=None):
+    if sem_bloqueio:
+        desligar_bloqueio()
+    if tipo == 'sqlite':
+        # Cada processo abre o seu armazenamento; o backend do processo pai não é herdado em uso.
+        set_armazenamento(criar_armazenamento(tipo, caminho, kv))
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return sum(executor.map(lambda t: operacoes(indice, t, n, usuarios), range(threads)))
+
+def verificar(usuarios, escritas_por_usuario, lembretes_por_usuario):
+    from agenda_lembretes import USUARIO_AGENDA, NUM_PARTES_AGENDA, _chave_balde
+    armazenamento = get_armazenamento()
+    falhas = []
+    for user_id in usuarios:
+        esperado = escritas_por_usuario[user_id]
+        transacoes = armazenamento.listar(user_id, "transacoes")
+        total = armazenamento.ler(user_id, "agregados_total", None)
+        metas = armazenamento.ler(user_id, "metas", {})
+        contas = armazenamento.ler(user_id, "contas", {'contas': []})['contas']
+        lembretes = armazenamento.listar(user_id, "lembretes")
+        versao = armazenamento.ler(user_id, "versao", 0)
+        valores = {
+            'transacoes': (len(transacoes), esperado),
+            'agregado n': (total['n'], esperado),
+            'agregado despesas': (round(total['despesas']), esperado),
+            'metas': (len([m for m in metas if m.startswith('Meta')]), esperado),
+            'contas': (len([c for c in contas if c.startswith('Conta')]), esperado),
+            'lembretes': (len(lembretes), lembretes_por_usuario[user_id]),
+            # transação + meta + conta por operação, mais um lembrete a cada 10
+            'versao': (versao, 3 * esperado + lembretes_por_usuario[user_id]),
+        }
+        for nome, (obtido, certo) in valores.items():
+            if obtido != certo:
+                falhas.append(f"{user_id} {nome}: {obtido} em vez de {certo}")
+    na_agenda = sum(
+        len(armazenamento.ler(USUARIO_AGENDA, _chave_balde(b, parte), []))
+        for b in [str(d) for d in range(1, 30)] + ['v1', 'v2'] for parte in range(NUM_PARTES_AGENDA)
+    )
+    if na_agenda != sum(lembretes_por_usuario.values()):
+        falhas.append(f"agenda: {na_agenda} em vez de {sum(lembretes_por_usuario.values())}")
+    return falhas
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--armazenamento', choices=['memoria', 'sqlite'], default='memoria')
+    parser.add_argument('--processos', type=int, default=1, help="só com sqlite")
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--operacoes', type=int, default=200, help="por thread")
+    parser.add_argument('--usuarios', type=int, default=2)
+    parser.add_argument('--sem-bloqueio', action='store_true')
+    args = parser.parse_args()
+    if args.armazenamento == 'memoria' and args.processos > 1:
+        parser.error("o KV em memória não é partilhado entre processos; use --armazenamento sqlite")
+
+    # Trocas de thread muito mais frequentes, para que as janelas de corrida apareçam.
+    sys.setswitchinterval(1e-5)
+    caminho = os.path.join(tempfile.mkdtemp(), 'stress.db')
+    kv = KVMemoria() if args.armazenamento == 'memoria' else None
+    set_armazenamento(criar_armazenamento(args.armazenamento, caminho, kv))
+    if args.sem_bloqueio:
+        desligar_bloqueio()
+
+    from agregados import reconstruir_agregados
+    from agenda_lembretes import reconstruir_agenda
+    usuarios = [f"stress{u}" for u in range(args.usuarios)]
+    for user_id in usuarios:
+        reconstruir_agregados(user_id)  # materializa os agregados, para que sejam atualizados em cada escrita
+    reconstruir_agenda()
+
+    inicio = time.perf_counter()
+    parametros = (args.threads, args.operacoes, usuarios, args.sem_bloqueio)
+    if args.processos > 1:
+        with multiprocessing.get_context('fork').Pool(args.processos) as pool:
+            aceites = sum(pool.starmap(worker, [(args.armazenamento, caminho, p, *parametros) for p in range(args.processos)]))
+    else:
+        aceites = worker(args.armazenamento, caminho, 0, *parametros, kv=kv)
+    segundos = time.perf_counter() - inicio
+
+    escritas = args.processos * args.threads * args.operacoes
+    escritas_por_usuario = {u: 0 for u in usuarios}
+    lembretes_por_usuario = {u: 0 for u in usuarios}
+    for i in range(args.operacoes):
+        escritas_por_usuario[usuarios[i % len(usuarios)]] += args.processos * args.threads
+        if i % 10 == 0:
+            lembretes_por_usuario[usuarios[i % len(usuarios)]] += args.processos * args.threads
+
+    falhas = verificar(usuarios, escritas_por_usuario, lembretes_por_usuario)
+    ids = args.operacoes  # cada worker regista os mesmos ids: wamid.<user>.<i>
+    if aceites != ids:
+        falhas.append(f"deduplicação: {aceites} ids aceites em vez de {ids}")
+
+    print(f"{args.armazenamento}, {args.processos} processo(s) x {args.threads} threads, "
+          f"{escritas} operações em {segundos:.2f}s ({escritas / segundos:.0f}/s)"
+          f"{', sem bloqueio' if args.sem_bloqueio else ''}")
+    for falha in falhas:
+        print("  PERDIDA", falha)
+    print("ok" if not falhas else f"{len(falhas)} verificações falharam")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == '__main__':
+    main()
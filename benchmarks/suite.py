@@ -0,0 +1,186 @@
+"""
+Suite de benchmarks dos caminhos críticos: mensagens, categorização, dashboard,
+relatórios por período, previsão e histórico de faturas e envio de lembretes.
+
+Os utilizadores são gerados por gerador_dados.py num armazenamento em memória
+(KVMemoria, no lugar do replit.db) ou num SQLite temporário, e as mensagens
+são enviadas para a Graph API falsa (fake_graph_api.py). Para cada cenário são
+reportados latência (p50/p95/p99), débito e pico de memória (tracemalloc,
+numa passagem separada para não afetar os tempos).
+
+Uso:
+    python benchmarks/suite.py [--usuarios 20] [--transacoes 2000] [--saida atual.json]
+    python benchmarks/suite.py --saida nova.json --comparar atual.json [--tolerancia 0.2]
+Com --comparar, o processo termina com código 1 se algum p50 piorar mais do
+que a tolerância.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_graph_api import ServidorGraphFalso
+from kv_memoria import KVMemoria
+from gerador_dados import gerar_usuario, mensagens_realistas, DESCRICOES_DESPESA
+from armazenamento import ArmazenamentoReplit, ArmazenamentoSQLite, set_armazenamento, get_armazenamento
+from agenda_lembretes import USUARIO_AGENDA
+
+def percentil(ordenados, p):
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))] if ordenados else 0
+
+def medir(funcao, chamadas, amostra_memoria):
+    """Corre funcao(*args) para cada args; devolve as métricas do cenário."""
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        latencias = []
+        inicio = time.perf_counter()
+        for args in chamadas:
+            t = time.perf_counter()
+            funcao(*args)
+            latencias.append(time.perf_counter() - t)
+        total = time.perf_counter() - inicio
+
+        tracemalloc.start()
+        for args in chamadas[:amostra_memoria]:
+            funcao(*args)
+        pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    latencias.sort()
+    return {
+        'n': len(latencias), 'media_ms': total / len(latencias) * 1000,
+        'p50_ms': percentil(latencias, 0.5) * 1000, 'p95_ms': percentil(latencias, 0.95) * 1000,
+        'p99_ms': percentil(latencias, 0.99) * 1000, 'por_segundo': len(latencias) / total,
+        'pico_memoria_kb': pico / 1024,
+    }
+
+def preparar(args):
+    if args.armazenamento == 'sqlite':
+        set_armazenamento(ArmazenamentoSQLite(os.path.join(tempfile.mkdtemp(), 'bench.db')))
+    else:
+        set_armazenamento(ArmazenamentoReplit(KVMemoria()))
+
+    servidor = ServidorGraphFalso(latencia_ms=args.latencia_ms, semente=args.semente).iniciar()
+    os.environ['WHATSAPP_API_URL'] = servidor.url_base
+
+    usuarios = [f"5500{i:08d}" for i in range(args.usuarios)]
+    inicio = time.perf_counter()
+    for user_id in usuarios:
+        gerar_usuario(user_id, args.semente, args.transacoes, args.parceladas, args.lembretes, args.categorias_extra)
+    print(f"{len(usuarios)} utilizadores gerados em {time.perf_counter() - inicio:.1f}s "
+          f"({args.transacoes} transações, {args.parceladas} parceladas, {args.lembretes} lembretes cada)")
+    return usuarios, servidor
+
+def cenarios(args, usuarios):
+    # Importados depois de configurar o armazenamento e o URL da API falsa
+    from utilis import processar_mensagem, categorizar_transacao, send_whatsapp_message, verificar_e_enviar_lembretes
+    from dashboard_calculations import calcular_dados_dashboard, _calcular_previsao_faturas
+    from database import get_compras_parceladas_db, get_regras_cartoes_db, get_contas_conhecidas
+    from parcelas import get_plano_parcelas
+    from relatorios import calcular_relatorio, intervalo_periodo
+    from faturas import historico_faturas
+
+    rng = random.Random(args.semente)
+    mensagens = mensagens_realistas(rng, args.mensagens)
+    por_usuario = [(rng.choice(usuarios), m) for m in mensagens]
+
+    def processar_e_responder(user_id, texto):
+        resposta = processar_mensagem(user_id, texto)
+        for parte in (resposta if isinstance(resposta, tuple) else [resposta]):
+            send_whatsapp_message(user_id, parte)
+
+    def previsao(user_id):
+        plano = get_plano_parcelas(user_id, get_compras_parceladas_db(user_id), get_regras_cartoes_db(user_id))
+        return _calcular_previsao_faturas(plano, get_contas_conhecidas(user_id))
+
+    def relatorio_anual(user_id):
+        return calcular_relatorio(user_id, *intervalo_periodo(str(datetime.now().year - 1)), serie=True)
+
+    def faturas_do_ano(user_id):
+        # Depois da primeira chamada por utilizador, os meses fechados são lidos dos resumos guardados
+        hoje = datetime.now()
+        return historico_faturas(user_id, hoje.year, hoje.month, 12)
+
+    def lembretes():
+        # Apaga o registo de envios de hoje para que cada repetição envie tudo outra vez
+        get_armazenamento().gravar(USUARIO_AGENDA, f"agenda_enviados_{time.strftime('%Y-%m-%d')}", [])
+        verificar_e_enviar_lembretes()
+
+    descricoes = [(rng.choice(DESCRICOES_DESPESA) + ' ' + rng.choice(['hoje', 'no centro', '']), 'despesa', rng.choice(usuarios))
+                  for _ in range(args.mensagens)]
+    return {
+        'categorizar_transacao': (categorizar_transacao, descricoes),
+        'processar_mensagem': (processar_mensagem, por_usuario),
+        'processar_e_responder': (processar_e_responder, por_usuario[:max(1, args.mensagens // 5)]),
+        'calcular_dados_dashboard': (calcular_dados_dashboard, [(u,) for u in usuarios] * args.repeticoes),
+        'relatorio_anual': (relatorio_anual, [(u,) for u in usuarios] * args.repeticoes),
+        'previsao_faturas': (previsao, [(u,) for u in usuarios] * args.repeticoes),
+        'historico_faturas': (faturas_do_ano, [(u,) for u in usuarios] * args.repeticoes),
+        'verificar_e_enviar_lembretes': (lembretes, [()] * args.repeticoes),
+    }
+
+def comparar(atual, anterior, tolerancia):
+    """Mostra a variação do p50 por cenário; devolve os cenários que pioraram além da tolerância."""
+    piores = []
+    print(f"\n{'cenário':<30} {'p50 antes':>10} {'p50 agora':>10} {'variação':>9}")
+    for nome, metricas in atual.items():
+        if nome not in anterior:
+            continue
+        antes, agora = anterior[nome]['p50_ms'], metricas['p50_ms']
+        variacao = (agora - antes) / antes if antes else 0
+        marca = '  <-- regressão' if variacao > tolerancia else ''
+        print(f"{nome:<30} {antes:>10.3f} {agora:>10.3f} {variacao:>+8.0%}{marca}")
+        if variacao > tolerancia:
+            piores.append(nome)
+    return piores
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--usuarios', type=int, default=20)
+    parser.add_argument('--transacoes', type=int, default=2000)
+    parser.add_argument('--parceladas', type=int, default=30)
+    parser.add_argument('--lembretes', type=int, default=10)
+    parser.add_argument('--categorias-extra', type=int, default=0)
+    parser.add_argument('--mensagens', type=int, default=500)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--armazenamento', choices=['memoria', 'sqlite'], default='memoria')
+    parser.add_argument('--latencia-ms', type=float, default=5)
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--cenarios', help='lista separada por vírgulas (padrão: todos)')
+    parser.add_argument('--amostra-memoria', type=int, default=20)
+    parser.add_argument('--saida', help='grava os resultados em JSON')
+    parser.add_argument('--comparar', help='JSON de uma execução anterior')
+    parser.add_argument('--tolerancia', type=float, default=0.2)
+    args = parser.parse_args()
+
+    usuarios, _ = preparar(args)
+    todos = cenarios(args, usuarios)
+    escolhidos = args.cenarios.split(',') if args.cenarios else list(todos)
+
+    resultados = {}
+    print(f"\n{'cenário':<30} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>9} {'pico KB':>9}")
+    for nome in escolhidos:
+        funcao, chamadas = todos[nome]
+        m = resultados[nome] = medir(funcao, chamadas, args.amostra_memoria)
+        print(f"{nome:<30} {m['n']:>6} {m['p50_ms']:>9.3f} {m['p95_ms']:>9.3f} {m['p99_ms']:>9.3f} "
+              f"{m['por_segundo']:>9.1f} {m['pico_memoria_kb']:>9.1f}")
+
+    if args.saida:
+        with open(args.saida, 'w') as f:
+            json.dump({'parametros': vars(args), 'resultados': resultados}, f, indent=2, ensure_ascii=False)
+    if args.comparar:
+        with open(args.comparar) as f:
+            anterior = json.load(f)['resultados']
+        if comparar(resultados, anterior, args.tolerancia):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import copy
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+class CacheLRU:
+    """
+    Cache em memória com expiração (TTL) e descarte do item menos usado (LRU).
+    Guarda contadores de acertos, falhas e descartes para monitorização.
+    """
+
+    def __init__(self, capacidade=1024, ttl=60):
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.descartes = 0
+
+    def get(self, chave, padrao=None):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._itens[chave]
+                self.falhas += 1
+                return padrao
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return item[1]
+
+    def set(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = (time.monotonic() + self.ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.capacidade:
+                self._itens.popitem(last=False)
+                self.descartes += 1
+
+    def invalidar(self, chave):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            return {'acertos': self.acertos, 'falhas': self.falhas,
+                    'descartes': self.descartes, 'tamanho': len(self._itens)}
+
+
+class CacheSQLite:
+    """
+    Cache partilhado entre processos (os workers do servidor.py) num ficheiro
+    SQLite local, com a mesma interface do CacheLRU. Os valores são guardados
+    com pickle e cada cache tem o seu espaço no ficheiro. A capacidade é
+    aproximada: de LIMPEZA_A_CADA em LIMPEZA_A_CADA escritas saem os expirados
+    e, se ainda houver excesso, os que expiram primeiro. Os contadores de
+    acertos e falhas são deste processo.
+    """
+
+    LIMPEZA_A_CADA = 100
+
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS cache (
+            espaco TEXT NOT NULL, chave TEXT NOT NULL, expira REAL NOT NULL, valor BLOB NOT NULL,
+            PRIMARY KEY (espaco, chave)
+        );
+        CREATE INDEX IF NOT EXISTS idx_cache_expira ON cache (espaco, expira);
+    """
+
+    def __init__(self, caminho, espaco, capacidade=1024, ttl=60):
+        self.caminho = caminho
+        self.espaco = espaco
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._escritas = 0
+        self.acertos = 0
+        self.falhas = 0
+        self.descartes = 0
+        self._conexao().executescript(self.ESQUEMA)
+
+    def _conexao(self):
+        # Uma conexão por thread; o conteúdo pode perder-se sem prejuízo, por isso sem fsync.
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            conexao = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA synchronous=OFF")
+            self._local.conexao = conexao
+        return conexao
+
+    def get(self, chave, padrao=None):
+        linha = self._conexao().execute(
+            "SELECT expira, valor FROM cache WHERE espaco = ? AND chave = ?", (self.espaco, repr(chave))
+        ).fetchone()
+        acerto = linha is not None and linha[0] >= time.time()
+        with self._lock:
+            if acerto:
+                self.acertos += 1
+            else:
+                self.falhas += 1
+        return pickle.loads(linha[1]) if acerto else padrao
+
+    def set(self, chave, valor):
+        dados = pickle.dumps(valor, pickle.HIGHEST_PROTOCOL)
+        self._conexao().execute(
+            "INSERT OR REPLACE INTO cache (espaco, chave, expira, valor) VALUES (?, ?, ?, ?)",
+            (self.espaco, repr(chave), time.time() + self.ttl, dados)
+        )
+        with self._lock:
+            self._escritas += 1
+            limpar = self._escritas % self.LIMPEZA_A_CADA == 0
+        if limpar:
+            self._descartar()
+
+    def _descartar(self):
+        conexao = self._conexao()
+        conexao.execute("DELETE FROM cache WHERE espaco = ? AND expira < ?", (self.espaco, time.time()))
+        excesso = self._tamanho() - self.capacidade
+        if excesso > 0:
+            conexao.execute(
+                "DELETE FROM cache WHERE rowid IN "
+                "(SELECT rowid FROM cache WHERE espaco = ? ORDER BY expira LIMIT ?)", (self.espaco, excesso)
+            )
+            with self._lock:
+                self.descartes += excesso
+
+    def _tamanho(self):
+        return self._conexao().execute("SELECT COUNT(*) FROM cache WHERE espaco = ?", (self.espaco,)).fetchone()[0]
+
+    def invalidar(self, chave):
+        self._conexao().execute("DELETE FROM cache WHERE espaco = ? AND chave = ?", (self.espaco, repr(chave)))
+
+    def limpar(self):
+        self._conexao().execute("DELETE FROM cache WHERE espaco = ?", (self.espaco,))
+
+    def estatisticas(self):
+        tamanho = self._tamanho()
+        with self._lock:
+            return {'acertos': self.acertos, 'falhas': self.falhas,
+                    'descartes': self.descartes, 'tamanho': tamanho}
+
+
+# --- Escolha do cache ---
+# Por padrão cada processo tem os seus caches em memória. Com vários processos
+# (servidor.py), LALABANK_CACHE=sqlite põe as configurações e os dashboards num
+# CacheSQLite partilhado, no ficheiro LALABANK_CACHE_SQLITE: o que um worker
+# calcula ou grava fica visível aos outros. Os caches que só guardam objetos
+# derivados de dados validados na leitura (classificadores, planos de
+# parcelas) continuam em memória.
+def criar_cache(espaco, capacidade, ttl):
+    if os.environ.get("LALABANK_CACHE", "memoria") == "sqlite":
+        caminho = os.environ.get("LALABANK_CACHE_SQLITE", "lalabank_cache.db")
+        return CacheSQLite(caminho, espaco, capacidade, ttl)
+    return CacheLRU(capacidade, ttl)
+
+
+# --- Cache das configurações por utilizador ---
+# Categorias, contas, regras dos cartões e metas são lidas várias vezes em cada
+# mensagem; com o cache cada uma custa no máximo uma ida ao armazenamento.
+# O database.py atualiza o cache sempre que grava uma destas chaves.
+# versao_configuracao é lida em cada mensagem para validar os classificadores
+# em cache (ver database.get_versao_configuracao).
+CHAVES_CONFIGURACAO = {'categorias', 'contas', 'regras_cartoes', 'metas', 'versao_configuracao'}
+
+_cache_configuracoes = criar_cache('configuracoes', capacidade=2048, ttl=300)
+_AUSENTE = object()
+
+def ler_configuracao(user_id, chave, carregar, bloqueio):
+    """
+    Devolve uma cópia do valor em cache, chamando carregar() só em caso de falha.
+    Numa falha o valor é lido e guardado dentro de bloqueio() (o bloqueio do
+    utilizador, onde o database.py também grava e atualiza o cache): uma
+    escrita simultânea não fica tapada por um valor lido antes dela.
+    """
+    valor = _cache_configuracoes.get((user_id, chave), _AUSENTE)
+    if valor is _AUSENTE:
+        with bloqueio():
+            valor = carregar()
+            _cache_configuracoes.set((user_id, chave), valor)
+    # Cópia para que quem altera o resultado antes de gravar não mexa no cache.
+    return copy.deepcopy(valor)
+
+def gravar_configuracao(user_id, chave, valor):
+    _cache_configuracoes.set((user_id, chave), copy.deepcopy(valor))
+
+def invalidar_configuracoes(user_id):
+    for chave in CHAVES_CONFIGURACAO:
+        _cache_configuracoes.invalidar((user_id, chave))
+
+def estatisticas_cache():
+    return _cache_configuracoes.estatisticas()
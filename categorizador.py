@@ -0,0 +1,97 @@
+from collections import deque
+from cache import CacheLRU
+
+# --- Classificador por palavras-chave (Aho–Corasick) ---
+# Substitui o ciclo "para cada categoria, para cada palavra, palavra in texto"
+# por um autómato construído uma vez a partir das categorias do utilizador:
+# o texto é percorrido uma única vez, seja qual for o número de palavras-chave.
+# A semântica é a mesma do ciclo: correspondência por substring e, se várias
+# categorias tiverem palavras no texto, ganha a primeira na ordem do dicionário.
+
+_SEM_CATEGORIA = float('inf')
+
+class ClassificadorPalavras:
+    def __init__(self, categorias, ignorar=()):
+        self.nomes = []
+        self._transicoes = [{}]
+        self._falha = [0]
+        self._prioridade = [_SEM_CATEGORIA]
+        # "" está contida em qualquer texto, tal como no ciclo original.
+        self._prioridade_vazia = _SEM_CATEGORIA
+
+        for nome, palavras in categorias.items():
+            if nome in ignorar:
+                continue
+            prioridade = len(self.nomes)
+            self.nomes.append(nome)
+            for palavra in palavras:
+                if not palavra:
+                    self._prioridade_vazia = min(self._prioridade_vazia, prioridade)
+                    continue
+                estado = 0
+                for letra in palavra:
+                    proximo = self._transicoes[estado].get(letra)
+                    if proximo is None:
+                        proximo = len(self._transicoes)
+                        self._transicoes[estado][letra] = proximo
+                        self._transicoes.append({})
+                        self._falha.append(0)
+                        self._prioridade.append(_SEM_CATEGORIA)
+                    estado = proximo
+                self._prioridade[estado] = min(self._prioridade[estado], prioridade)
+        self._calcular_falhas()
+
+    def _calcular_falhas(self):
+        # Percurso em largura: cada estado herda a melhor prioridade do seu estado de falha,
+        # para que palavras contidas no fim de outras também sejam reconhecidas.
+        fila = deque(self._transicoes[0].values())
+        while fila:
+            estado = fila.popleft()
+            for letra, proximo in self._transicoes[estado].items():
+                falha = self._falha[estado]
+                while falha and letra not in self._transicoes[falha]:
+                    falha = self._falha[falha]
+                self._falha[proximo] = self._transicoes[falha].get(letra, 0)
+                self._prioridade[proximo] = min(self._prioridade[proximo], self._prioridade[self._falha[proximo]])
+                fila.append(proximo)
+
+    def classificar(self, texto_lower):
+        """Devolve a categoria de maior prioridade com alguma palavra no texto, ou None."""
+        transicoes, falha, prioridade = self._transicoes, self._falha, self._prioridade
+        melhor = self._prioridade_vazia
+        estado = 0
+        for letra in texto_lower:
+            while estado and letra not in transicoes[estado]:
+                estado = falha[estado]
+            estado = transicoes[estado].get(letra, 0)
+            if prioridade[estado] < melhor:
+                melhor = prioridade[estado]
+                if melhor == 0:
+                    break
+        return None if melhor == _SEM_CATEGORIA else self.nomes[melhor]
+
+
+# --- Autómatos por utilizador ---
+# Um só cache para os autómatos construídos a partir da configuração de cada
+# utilizador: o classificador das categorias (aqui) e o analisador de
+# mensagens (analisador.py). A entrada guarda a versão da configuração
+# (database.get_versao_configuracao), que muda a cada gravação das categorias
+# ou das contas; enquanto for a mesma, a configuração nem chega a ser lida.
+_automatos = CacheLRU(capacidade=1024, ttl=3600)
+
+def automato_do_usuario(user_id, versao, nome, construir):
+    """Autómato `nome` do utilizador na versão indicada; construir() só é chamada quando ainda não existe."""
+    guardado = _automatos.get(user_id)
+    if guardado is None or guardado[0] != versao:
+        guardado = (versao, {})
+        _automatos.set(user_id, guardado)
+    automato = guardado[1].get(nome)
+    if automato is None:
+        automato = guardado[1][nome] = construir()
+    return automato
+
+def get_classificador(user_id, versao, carregar_categorias, ignorar=()):
+    """Classificador das categorias do utilizador; carregar_categorias() só é chamada quando é preciso construí-lo."""
+    return automato_do_usuario(
+        user_id, versao, ('classificador', tuple(ignorar)), lambda: ClassificadorPalavras(carregar_categorias(), ignorar)
+    )
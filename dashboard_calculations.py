@@ -1,83 +1,52 @@
+import os
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
 from database import (
-    get_transacoes_db, get_compras_parceladas_db, get_metas_db, 
+    get_compras_parceladas_db, get_metas_db, 
     get_contas_conhecidas, get_categorias, get_regras_cartoes_db,
     get_cartoes_conhecidos, get_lembretes_db
 )
+from agregados import get_agregado_total, copiar_agregado, somar_transacao
+from parcelas import get_plano_parcelas
+from extrato import iterar_extrato, pagina_extrato, TAMANHO_PAGINA
+from metricas import cronometro, cronometrado
+
+# Caminho colunar opcional (dashboard_numpy.py) que recalcula tudo a partir do
+# histórico com NumPy, em vez de usar os agregados materializados.
+USAR_NUMPY = os.environ.get("LALABANK_DASHBOARD_NUMPY") == "1"
 
 # --- Funções Auxiliares de Cálculo ---
 
-def _calcular_parcelas_do_mes(compras_parceladas, regras_cartoes):
+def _calcular_parcelas_do_mes(plano_parcelas):
     """Gera transações virtuais para as parcelas que vencem no mês atual."""
     hoje = datetime.now()
-    parcelas_do_mes = []
-    for compra in compras_parceladas:
-        data_inicio = datetime.fromisoformat(compra['data_inicio'])
-        valor_parcela = compra['valor_total'] / compra['num_parcelas']
-
-        for i in range(compra['num_parcelas']):
-            dia_compra = data_inicio.day
-            cartao = compra.get("cartao", "").lower()
-            dia_fechamento = regras_cartoes.get(compra.get("cartao", ""), 30)
-            mes_inicio_fatura = 0 if dia_compra <= dia_fechamento else 1
-            data_parcela_fatura = data_inicio + relativedelta(months=i + mes_inicio_fatura)
-
-            if data_parcela_fatura.year == hoje.year and data_parcela_fatura.month == hoje.month:
-                parcelas_do_mes.append({
-                    "tipo": "despesa", "descricao": f"{compra['descricao']} ({i+1}/{compra['num_parcelas']})",
-                    "valor": valor_parcela, "categoria": compra['categoria'],
-                    "metodo": "crédito", "cartao": compra['cartao'],
-                    "conta": None, "timestamp": (data_inicio + relativedelta(months=i)).isoformat()
-                })
-                break
-    return parcelas_do_mes
-
-def _calcular_saldos_por_conta(transacoes_completas, contas_conhecidas):
-    """Calcula os saldos (receitas vs despesas de débito) para cada conta."""
+    return plano_parcelas.parcelas_do_mes(hoje.year, hoje.month)
+
+def _calcular_saldos_por_conta(agregado, contas_conhecidas):
+    """Calcula os saldos (receitas vs despesas de débito) para cada conta a partir do agregado."""
     saldos_por_conta = {}
-    todas_as_contas = contas_conhecidas.get('contas', [])
-    for conta in todas_as_contas:
-        saldos_por_conta[conta] = {'receitas': 0, 'despesas': 0, 'saldo': 0}
-
-    for t in transacoes_completas:
-        if t.get('tipo') == 'receita' or t.get('metodo') == 'débito':
-            conta = t.get('conta')
-            if conta in saldos_por_conta:
-                if t.get('tipo') == 'receita':
-                    saldos_por_conta[conta]['receitas'] += t.get('valor', 0)
-                elif t.get('tipo') == 'despesa':
-                    saldos_por_conta[conta]['despesas'] += t.get('valor', 0)
-
-    for conta in saldos_por_conta:
-        saldos_por_conta[conta]['saldo'] = saldos_por_conta[conta]['receitas'] - saldos_por_conta[conta]['despesas']
+    for conta in contas_conhecidas.get('contas', []):
+        dados = agregado['contas'].get(conta, {})
+        receitas, despesas = dados.get('receitas', 0), dados.get('despesas', 0)
+        saldos_por_conta[conta] = {'receitas': receitas, 'despesas': despesas, 'saldo': receitas - despesas}
     return saldos_por_conta
 
-def _calcular_previsao_faturas(compras_parceladas, contas_conhecidas, regras_cartoes):
+def _calcular_previsao_faturas(plano_parcelas, contas_conhecidas):
     """Calcula a previsão de faturas para os próximos 12 meses."""
     hoje = datetime.now()
-    meses_previsao_nomes = [(hoje + relativedelta(months=i)).strftime('%b/%y') for i in range(12)]
-    previsao_faturas = {cartao: {m: 0 for m in meses_previsao_nomes} for cartao in contas_conhecidas.get('cartoes', [])}
-
-    for compra in compras_parceladas:
-        cartao, data_inicio, valor_parcela, num_parcelas = compra['cartao'], datetime.fromisoformat(compra['data_inicio']), compra['valor_total'] / compra['num_parcelas'], compra['num_parcelas']
-        dia_fechamento = regras_cartoes.get(cartao, 30)
-        mes_inicio_fatura = 0 if data_inicio.day <= dia_fechamento else 1
-
-        for i in range(num_parcelas):
-            data_fatura = data_inicio + relativedelta(months=i + mes_inicio_fatura)
-            mes_ano_fatura = data_fatura.strftime('%b/%y')
-            if mes_ano_fatura in meses_previsao_nomes:
-                 previsao_faturas[cartao][mes_ano_fatura] += valor_parcela
-    return previsao_faturas, meses_previsao_nomes
-
-def _calcular_progresso_metas(transacoes_completas, metas):
-    """Calcula o progresso das metas de orçamento."""
-    gastos_por_categoria = {}
-    for t in transacoes_completas:
-        if t.get('tipo') == 'despesa':
-            cat = t.get('categoria', 'Outros')
-            gastos_por_categoria[cat] = gastos_por_categoria.get(cat, 0) + t.get('valor', 0)
+    return plano_parcelas.previsao_faturas(contas_conhecidas.get('cartoes', []), hoje.year, hoje.month, 12)
+
+def _calcular_gastos_por_categoria(categorias_metodo):
+    """Gastos por categoria no débito, no crédito e nos dois juntos, para os gráficos."""
+    debito = dict(categorias_metodo.get('débito', {}))
+    credito = dict(categorias_metodo.get('crédito', {}))
+    total = dict(debito)
+    for categoria, valor in credito.items():
+        total[categoria] = total.get(categoria, 0) + valor
+    return {'debito': debito, 'credito': credito, 'total': total}
+
+def _calcular_progresso_metas(agregado, metas):
+    """Calcula o progresso das metas de orçamento a partir dos gastos por categoria do agregado."""
+    gastos_por_categoria = agregado['categorias']
 
     progresso_metas = {}
     for categoria, valor_meta in metas.items():
@@ -88,19 +57,14 @@ def _calcular_progresso_metas(transacoes_completas, metas):
 
 # --- Função Principal ---
 
-def calcular_dados_dashboard(user_id):
+@cronometrado('dashboard_carregar')
+def _carregar_dados_usuario(user_id):
     """
-    Função central que busca todos os dados e chama as funções auxiliares
-    para fazer os cálculos do dashboard.
+    Busca os dados do banco de dados: parceladas e lembretes já vêm como registos (registos.py).
+    As transações não são carregadas: o extrato é lido por páginas (extrato.py).
     """
-    # 1. Busca os dados brutos do banco de dados e converte para tipos padrão do Python
-    transacoes_normais = [dict(t) for t in get_transacoes_db(user_id)]
-    # Adiciona a flag para permitir a exclusão
-    for t in transacoes_normais:
-        t['is_deletable'] = True
-
-    compras_parceladas = [dict(p) for p in get_compras_parceladas_db(user_id)]
-    lembretes = [dict(l) for l in get_lembretes_db(user_id)]
+    compras_parceladas = get_compras_parceladas_db(user_id)
+    lembretes = get_lembretes_db(user_id)
     metas = dict(get_metas_db(user_id))
     regras_cartoes = dict(get_regras_cartoes_db(user_id))
     
@@ -113,38 +77,61 @@ def calcular_dados_dashboard(user_id):
     categorias_data = get_categorias(user_id)
     categorias_usuario = {k: list(v) for k, v in categorias_data.items()}
 
-    # 2. Gera e combina transações
-    parcelas_do_mes = _calcular_parcelas_do_mes(compras_parceladas, regras_cartoes)
-    # Adiciona a flag para impedir a exclusão de parcelas
+    return {
+        'compras_parceladas': compras_parceladas,
+        'lembretes': lembretes, 'metas': metas, 'regras_cartoes': regras_cartoes,
+        'contas_conhecidas': contas_conhecidas, 'categorias_usuario': categorias_usuario
+    }
+
+@cronometrado('dashboard_total')
+def calcular_dados_dashboard(user_id):
+    """
+    Função central que busca todos os dados e chama as funções auxiliares
+    para fazer os cálculos do dashboard.
+    """
+    if USAR_NUMPY:
+        from dashboard_numpy import numpy_disponivel, calcular_dados_dashboard_numpy
+        if numpy_disponivel():
+            return calcular_dados_dashboard_numpy(user_id)
+
+    # 1. Busca os dados brutos do banco de dados
+    dados = _carregar_dados_usuario(user_id)
+    compras_parceladas = dados['compras_parceladas']
+    lembretes, metas, regras_cartoes = dados['lembretes'], dados['metas'], dados['regras_cartoes']
+    contas_conhecidas, categorias_usuario = dados['contas_conhecidas'], dados['categorias_usuario']
+
+    # 2. Parcelas do mês e primeira página do extrato; o resto é pedido pela página em /api/transacoes
+    with cronometro('dashboard_parcelas'):
+        plano_parcelas = get_plano_parcelas(user_id, compras_parceladas, regras_cartoes)
+        parcelas_do_mes = _calcular_parcelas_do_mes(plano_parcelas)
+    with cronometro('dashboard_extrato'):
+        *transacoes_pagina, proximo_cursor = pagina_extrato(iterar_extrato(user_id, plano=plano_parcelas), TAMANHO_PAGINA)
+
+    # 3. Cálculos de totais: agregado materializado do histórico + parcelas do mês
+    with cronometro('dashboard_agregado'):
+        agregado = copiar_agregado(get_agregado_total(user_id))
     for p in parcelas_do_mes:
-        p['is_deletable'] = False
-        
-    transacoes_completas = sorted(transacoes_normais + parcelas_do_mes, key=lambda t: t['timestamp'], reverse=True)
+        somar_transacao(agregado, p)
 
-    # 3. Cálculos de totais
-    total_receitas = sum(t['valor'] for t in transacoes_completas if t.get('tipo') == 'receita')
-    total_despesas = sum(t['valor'] for t in transacoes_completas if t.get('tipo') == 'despesa')
+    total_receitas = agregado['receitas']
+    total_despesas = agregado['despesas']
     balanco = total_receitas - total_despesas
-    despesas_debito = [t for t in transacoes_completas if t.get('metodo') == 'débito' and t.get('tipo') == 'despesa']
-    despesas_credito = [t for t in transacoes_completas if t.get('metodo') == 'crédito' and t.get('tipo') == 'despesa']
-    total_gastos_debito = sum(t['valor'] for t in despesas_debito)
-    total_gastos_credito = sum(t['valor'] for t in despesas_credito)
+    total_gastos_debito = agregado['despesas_metodo'].get('débito', 0)
+    total_gastos_credito = agregado['despesas_metodo'].get('crédito', 0)
 
     # 4. Cálculos modulares
-    saldos_por_conta = _calcular_saldos_por_conta(transacoes_completas, contas_conhecidas)
-    faturas_atuais = {}
-    for t in despesas_credito:
-        cartao = t.get("cartao")
-        if cartao:
-            faturas_atuais[cartao] = faturas_atuais.get(cartao, 0) + t.get('valor', 0)
-    previsao_faturas, meses_previsao_nomes = _calcular_previsao_faturas(compras_parceladas, contas_conhecidas, regras_cartoes)
-    progresso_metas = _calcular_progresso_metas(transacoes_completas, metas)
+    saldos_por_conta = _calcular_saldos_por_conta(agregado, contas_conhecidas)
+    faturas_atuais = dict(agregado['cartoes'])
+    with cronometro('dashboard_previsao_faturas'):
+        previsao_faturas, meses_previsao_nomes = _calcular_previsao_faturas(plano_parcelas, contas_conhecidas)
+    progresso_metas = _calcular_progresso_metas(agregado, metas)
+    gastos_por_categoria = _calcular_gastos_por_categoria(agregado['categorias_metodo'])
 
     # 5. Retorna um único dicionário com todos os dados prontos para o template
     return {
-        'user_id': user_id, 'transacoes': transacoes_completas, 'total_receitas': total_receitas,
-        'total_despesas': total_despesas, 'balanco': balanco, 'despesas_debito': despesas_debito,
-        'despesas_credito': despesas_credito, 'total_gastos_debito': total_gastos_debito,
+        'user_id': user_id, 'transacoes': transacoes_pagina, 'proximo_cursor': proximo_cursor,
+        'total_receitas': total_receitas, 'total_despesas': total_despesas, 'balanco': balanco,
+        'gastos_por_categoria': gastos_por_categoria, 'total_gastos_debito': total_gastos_debito,
         'total_gastos_credito': total_gastos_credito, 'saldos_por_conta': saldos_por_conta,
         'faturas': faturas_atuais, 'previsao_faturas': previsao_faturas, 'meses_previsao': meses_previsao_nomes,
         'progresso_metas': progresso_metas, 'categorias_disponiveis': categorias_usuario,
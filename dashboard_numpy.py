@@ -0,0 +1,179 @@
+from datetime import datetime
+from parcelas import nome_mes, somar_meses, DIA_FECHAMENTO_PADRAO
+from extrato import pagina_extrato, TAMANHO_PAGINA
+from registos import Transacao
+
+# --- Caminho colunar (NumPy) do dashboard ---
+# Converte as transações do utilizador em colunas (valor em float64; tipo,
+# método, conta, cartão e categoria em códigos inteiros; timestamp em
+# datetime64) e calcula totais, saldos, gastos por categoria e a previsão de
+# faturas com somas agrupadas (np.bincount / np.add.at). Devolve o mesmo
+# dicionário que dashboard_calculations.calcular_dados_dashboard.
+#
+# O NumPy é opcional: sem ele, numpy_disponivel() devolve False e o dashboard
+# continua a usar o caminho normal.
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def numpy_disponivel():
+    return np is not None
+
+def _codificar(valores):
+    """Devolve (códigos inteiros, lista de valores distintos) por ordem de aparição."""
+    distintos = list(dict.fromkeys(valores))
+    mapa = {v: i for i, v in enumerate(distintos)}
+    codigos = np.fromiter(map(mapa.__getitem__, valores), dtype=np.int64, count=len(valores))
+    return codigos, distintos
+
+def _codigo(distintos, valor):
+    return distintos.index(valor) if valor in distintos else -1
+
+def _somar_por_codigo(codigos, valores, mascara, tamanho):
+    return np.bincount(codigos[mascara], weights=valores[mascara], minlength=tamanho)
+
+
+class TransacoesColunares:
+    def __init__(self, transacoes):
+        n = len(transacoes)
+        self.valor = np.fromiter(((t.valor or 0) for t in transacoes), dtype=np.float64, count=n)
+        self.tipo, self.tipos = _codificar([t.tipo for t in transacoes])
+        self.metodo, self.metodos = _codificar([t.metodo for t in transacoes])
+        self.conta, self.contas = _codificar([t.conta for t in transacoes])
+        self.cartao, self.cartoes = _codificar([t.cartao for t in transacoes])
+        self.categoria, self.categorias = _codificar([t.categoria or 'Outros' for t in transacoes])
+        self.timestamp = np.array([t.timestamp for t in transacoes], dtype='datetime64[us]')
+
+    def mascara(self, campo, valor):
+        codigo = _codigo(getattr(self, campo + 's'), valor)
+        return getattr(self, campo) == codigo
+
+    def ordem_decrescente(self):
+        # Estável, como sorted(..., reverse=True): empates mantêm a ordem original.
+        return np.argsort(-self.timestamp.astype(np.int64), kind='stable')
+
+
+class ParcelasColunares:
+    def __init__(self, compras_parceladas, regras_cartoes):
+        compras = [c for c in compras_parceladas if c.num_parcelas > 0]
+        self.compras = compras
+        datas = np.array([c.inicio for c in compras], dtype='datetime64[us]')
+        meses = datas.astype('datetime64[M]')
+        dias = (datas.astype('datetime64[D]') - meses.astype('datetime64[D]')).astype(np.int64) + 1
+        fechamento = np.array([regras_cartoes.get(c.cartao or '', DIA_FECHAMENTO_PADRAO) for c in compras], dtype=np.int64)
+        # Índice do mês da primeira fatura, em meses desde 1970-01.
+        self.inicio = meses.astype(np.int64) + (dias > fechamento)
+        self.num_parcelas = np.array([c.num_parcelas for c in compras], dtype=np.int64)
+        self.valor_parcela = np.array([c.valor_total for c in compras], dtype=np.float64) / np.maximum(self.num_parcelas, 1)
+        self.cartao, self.cartoes = _codificar([c.cartao for c in compras])
+
+    @staticmethod
+    def _indice(ano, mes):
+        return (ano - 1970) * 12 + mes - 1
+
+    def parcelas_do_mes(self, ano, mes):
+        i = self._indice(ano, mes) - self.inicio
+        selecionadas = np.nonzero((i >= 0) & (i < self.num_parcelas))[0]
+        parcelas = []
+        for k in selecionadas:
+            compra, parcela = self.compras[k], int(i[k])
+            parcelas.append(Transacao(
+                "despesa", f"{compra.descricao} ({parcela+1}/{compra.num_parcelas})",
+                compra.valor_total / compra.num_parcelas, compra.categoria, "crédito", compra.cartao,
+                None, somar_meses(compra.inicio, parcela).isoformat(), is_deletable=False
+            ))
+        return parcelas
+
+    def previsao_faturas(self, cartoes, ano, mes, meses=12):
+        primeiro = self._indice(ano, mes)
+        nomes = [nome_mes((ano * 12 + mes - 1) + k) for k in range(meses)]
+        grelha = np.zeros((len(cartoes), meses))
+        if len(self.compras):
+            colunas = primeiro + np.arange(meses)
+            fim = self.inicio + self.num_parcelas - 1
+            ativas = (self.inicio[:, None] <= colunas) & (fim[:, None] >= colunas)
+            linhas = np.array([_codigo(cartoes, c) for c in self.cartoes], dtype=np.int64)[self.cartao]
+            validas = linhas >= 0
+            np.add.at(grelha, linhas[validas], ativas[validas] * self.valor_parcela[validas, None])
+        previsao = {cartao: {nome: float(v) for nome, v in zip(nomes, grelha[i])} for i, cartao in enumerate(cartoes)}
+        return previsao, nomes
+
+
+def montar_dados_dashboard(user_id, dados, hoje=None):
+    """
+    Calcula o dicionário do dashboard a partir dos dados carregados por
+    _carregar_dados_usuario, mais o histórico completo em dados['transacoes_normais'].
+    """
+    hoje = hoje or datetime.now()
+    contas_conhecidas, metas = dados['contas_conhecidas'], dados['metas']
+
+    parcelas = ParcelasColunares(dados['compras_parceladas'], dados['regras_cartoes'])
+    parcelas_do_mes = parcelas.parcelas_do_mes(hoje.year, hoje.month)
+
+    todas = dados['transacoes_normais'] + parcelas_do_mes
+    colunas = TransacoesColunares(todas)
+    ordem = colunas.ordem_decrescente()
+    *transacoes_pagina, proximo_cursor = pagina_extrato((todas[i] for i in ordem), TAMANHO_PAGINA)
+
+    receita, despesa = colunas.mascara('tipo', 'receita'), colunas.mascara('tipo', 'despesa')
+    debito, credito = colunas.mascara('metodo', 'débito'), colunas.mascara('metodo', 'crédito')
+    despesas_debito_mask, despesas_credito_mask = despesa & debito, despesa & credito
+
+    total_receitas = float(colunas.valor[receita].sum())
+    total_despesas = float(colunas.valor[despesa].sum())
+
+    # Saldos por conta: receitas e despesas no débito, só das contas conhecidas.
+    contas = contas_conhecidas.get('contas', [])
+    conta_para_linha = np.array([_codigo(contas, c) for c in colunas.contas], dtype=np.int64)[colunas.conta]
+    conhecida = conta_para_linha >= 0
+    receitas_conta = _somar_por_codigo(conta_para_linha, colunas.valor, conhecida & receita, len(contas))
+    despesas_conta = _somar_por_codigo(conta_para_linha, colunas.valor, conhecida & despesas_debito_mask, len(contas))
+    saldos_por_conta = {
+        conta: {'receitas': float(receitas_conta[i]), 'despesas': float(despesas_conta[i]),
+                'saldo': float(receitas_conta[i] - despesas_conta[i])}
+        for i, conta in enumerate(contas)
+    }
+
+    # Faturas atuais: despesas no crédito por cartão.
+    por_cartao = _somar_por_codigo(colunas.cartao, colunas.valor, despesas_credito_mask, len(colunas.cartoes))
+    usos_cartao = np.bincount(colunas.cartao[despesas_credito_mask], minlength=len(colunas.cartoes))
+    faturas_atuais = {c: float(por_cartao[i]) for i, c in enumerate(colunas.cartoes) if c and usos_cartao[i]}
+
+    # Progresso das metas e gráficos: despesas por categoria.
+    por_categoria = _somar_por_codigo(colunas.categoria, colunas.valor, despesa, len(colunas.categorias))
+    gastos_por_categoria = {}
+    for nome, mascara in (('debito', despesas_debito_mask), ('credito', despesas_credito_mask),
+                          ('total', despesas_debito_mask | despesas_credito_mask)):
+        somas = _somar_por_codigo(colunas.categoria, colunas.valor, mascara, len(colunas.categorias))
+        usos = np.bincount(colunas.categoria[mascara], minlength=len(colunas.categorias))
+        gastos_por_categoria[nome] = {c: float(somas[i]) for i, c in enumerate(colunas.categorias) if usos[i]}
+    progresso_metas = {}
+    for categoria, valor_meta in metas.items():
+        i = _codigo(colunas.categorias, categoria)
+        gasto_atual = float(por_categoria[i]) if i >= 0 else 0
+        progresso = (gasto_atual / valor_meta) * 100 if valor_meta > 0 else 0
+        progresso_metas[categoria] = {'gasto': gasto_atual, 'meta': valor_meta, 'percentual': min(progresso, 100)}
+
+    previsao_faturas, meses_previsao_nomes = parcelas.previsao_faturas(contas_conhecidas.get('cartoes', []), hoje.year, hoje.month)
+
+    return {
+        'user_id': user_id, 'transacoes': transacoes_pagina, 'proximo_cursor': proximo_cursor,
+        'total_receitas': total_receitas, 'total_despesas': total_despesas,
+        'balanco': total_receitas - total_despesas, 'gastos_por_categoria': gastos_por_categoria,
+        'total_gastos_debito': float(colunas.valor[despesas_debito_mask].sum()),
+        'total_gastos_credito': float(colunas.valor[despesas_credito_mask].sum()),
+        'saldos_por_conta': saldos_por_conta, 'faturas': faturas_atuais,
+        'previsao_faturas': previsao_faturas, 'meses_previsao': meses_previsao_nomes,
+        'progresso_metas': progresso_metas, 'categorias_disponiveis': dados['categorias_usuario'],
+        'contas_disponiveis': contas_conhecidas, 'metas': metas, 'lembretes': dados['lembretes'],
+        'regras_cartoes': dados['regras_cartoes']
+    }
+
+def calcular_dados_dashboard_numpy(user_id):
+    from dashboard_calculations import _carregar_dados_usuario
+    from database import get_transacoes_db
+    dados = _carregar_dados_usuario(user_id)
+    dados['transacoes_normais'] = get_transacoes_db(user_id)
+    return montar_dados_dashboard(user_id, dados)
@@ -1,122 +1,277 @@
-from replit import db
+import copy
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from armazenamento import get_armazenamento
+from cache import CHAVES_CONFIGURACAO, ler_configuracao, gravar_configuracao
+from agregados import atualizar_agregados
+from agenda_lembretes import indexar_lembrete, desindexar_lembretes
+from faturas import invalidar_faturas, invalidar_faturas_parcelada
+from metricas import cronometrado
+from registos import Transacao, CompraParcelada, Lembrete, como_dict
 
 # --- Funções Genéricas ---
+# Todo o acesso a dados passa pelo backend configurado em armazenamento.py
+# (KV do Replit por padrão, ou SQLite local). As configurações (categorias,
+# contas, regras dos cartões e metas) passam também pelo cache de cache.py,
+# que é atualizado aqui em cada gravação; as falhas do cache são lidas dentro
+# do bloqueio do utilizador (ver cache.ler_configuracao).
+#
+# As alterações (ler -> alterar -> gravar) passam por atualizar_user_data, que
+# lê o valor atual do armazenamento, e não do cache, dentro do bloqueio do
+# utilizador: duas mensagens do mesmo utilizador tratadas ao mesmo tempo (em
+# threads ou, com SQLite, em workers diferentes) não perdem escritas.
 def get_user_data(user_id, key, default_value):
-    return db.get(f"{key}_{user_id}", default_value)
+    armazenamento = get_armazenamento()
+    if key in CHAVES_CONFIGURACAO:
+        return ler_configuracao(user_id, key, lambda: armazenamento.ler(user_id, key, default_value),
+                                lambda: armazenamento.bloqueio(user_id))
+    return armazenamento.ler(user_id, key, default_value)
 
 def set_user_data(user_id, key, value):
-    db[f"{key}_{user_id}"] = value
+    armazenamento = get_armazenamento()
+    with armazenamento.bloqueio(user_id):
+        armazenamento.gravar(user_id, key, value)
+        _depois_de_gravar(user_id, key, value)
+
+# Devolvido pela função de atualizar_user_data quando não há nada a gravar.
+INALTERADO = object()
+
+def atualizar_user_data(user_id, key, default_value, alterar):
+    """
+    Aplica alterar(valor_atual) -> novo valor de forma atómica e devolve o valor final.
+    alterar pode mudar o valor recebido e devolvê-lo, ou devolver INALTERADO.
+    """
+    armazenamento = get_armazenamento()
+    with armazenamento.bloqueio(user_id):
+        atual = armazenamento.ler(user_id, key, copy.deepcopy(default_value))
+        novo = alterar(atual)
+        if novo is INALTERADO:
+            return atual
+        armazenamento.gravar(user_id, key, novo)
+        _depois_de_gravar(user_id, key, novo)
+        return novo
+
+def _depois_de_gravar(user_id, key, value):
+    # Chamado dentro do bloqueio, para que o cache fique com a última escrita deste processo.
+    if key in CHAVES_CONFIGURACAO:
+        gravar_configuracao(user_id, key, value)
+    if key not in CHAVES_SEM_VERSAO:
+        incrementar_versao(user_id)
+    if key in CHAVES_CLASSIFICADORES:
+        incrementar_versao_configuracao(user_id)
+
+# --- Versão dos dados ---
+# Cada gravação que altera o que o dashboard mostra incrementa um contador por
+# utilizador; o main.py usa-o na chave do cache do dashboard e no ETag.
+CHAVES_SEM_VERSAO = {'ultima_pergunta', 'mensagens_recebidas', 'versao', 'versao_configuracao'}
+
+def get_versao_usuario(user_id):
+    return get_armazenamento().ler(user_id, "versao", 0)
+
+def incrementar_versao(user_id):
+    atualizar_user_data(user_id, "versao", 0, lambda versao: versao + 1)
+
+# A versão da configuração só muda quando mudam as chaves de que os
+# classificadores dependem: o categorizador.py e o analisador.py guardam-nos
+# por versão e, em cada mensagem, confirmam que ainda valem com a leitura de
+# um inteiro (do cache das configurações), em vez de comparar todas as
+# palavras-chave, contas e cartões.
+CHAVES_CLASSIFICADORES = {'categorias', 'contas'}
+
+def get_versao_configuracao(user_id):
+    return get_user_data(user_id, "versao_configuracao", 0)
+
+def incrementar_versao_configuracao(user_id):
+    atualizar_user_data(user_id, "versao_configuracao", 0, lambda versao: versao + 1)
 
 # --- Transações ---
+# No KV do Replit, transações, parceladas e lembretes são guardados em segmentos
+# mensais: inserir não reescreve o histórico e apagar só regista um tombstone,
+# que é aplicado depois pela compactação. No SQLite são linhas indexadas.
+# As leituras devolvem registos (registos.py); as gravações aceitam registos ou
+# dicionários no formato guardado.
+@cronometrado('db_ler_transacoes')
 def get_transacoes_db(user_id):
-    return get_user_data(user_id, "transacoes", [])
+    return [Transacao.de_dict(t) for t in get_armazenamento().listar(user_id, "transacoes")]
+
+def get_transacoes_periodo_db(user_id, inicio, fim):
+    """Transações com timestamp em [inicio, fim), ex.: ('2024-05', '2024-06')."""
+    return [Transacao.de_dict(t) for t in get_armazenamento().listar(user_id, "transacoes", inicio, fim)]
+
+def iterar_transacoes_db(user_id, antes=None, inicio=None, fim=None):
+    """Gera as transações da mais recente para a mais antiga, com timestamp < antes e em [inicio, fim)."""
+    return map(Transacao.de_dict, get_armazenamento().iterar(user_id, "transacoes", antes, inicio, fim))
 
 def salvar_transacao_db(user_id, data):
-    transacoes = get_transacoes_db(user_id)
-    transacoes.append(data)
-    set_user_data(user_id, "transacoes", transacoes)
+    lote = getattr(_escrita_agrupada, 'lote', None)
+    if lote is not None and lote[0] == user_id:
+        lote[1].append(data)
+        return
+    salvar_transacoes_db(user_id, [data])
+
+@cronometrado('db_salvar_transacoes')
+def salvar_transacoes_db(user_id, transacoes):
+    """Grava várias transações numa única atualização do armazenamento e dos agregados."""
+    if transacoes:
+        transacoes = [como_dict(t) for t in transacoes]
+        armazenamento = get_armazenamento()
+        with armazenamento.bloqueio(user_id):
+            armazenamento.anexar_varios(user_id, "transacoes", transacoes)
+            atualizar_agregados(user_id, transacoes)
+            invalidar_faturas(user_id, transacoes, get_regras_cartoes_db(user_id))
+            incrementar_versao(user_id)
+
+_escrita_agrupada = threading.local()
 
+@contextmanager
+def escrita_agrupada(user_id):
+    """
+    Dentro do bloco, salvar_transacao_db(user_id, ...) só acumula as transações
+    desta thread; no fim são todas gravadas de uma vez com salvar_transacoes_db.
+    """
+    pendentes = []
+    _escrita_agrupada.lote = (user_id, pendentes)
+    try:
+        yield
+    finally:
+        _escrita_agrupada.lote = None
+        salvar_transacoes_db(user_id, pendentes)
+
+@cronometrado('db_apagar_transacao')
 def apagar_transacao_db(user_id, timestamp):
-    transacoes = get_transacoes_db(user_id)
-    novas_transacoes = [t for t in transacoes if t.get('timestamp') != timestamp]
-    set_user_data(user_id, "transacoes", novas_transacoes)
+    armazenamento = get_armazenamento()
+    with armazenamento.bloqueio(user_id):
+        removidas = armazenamento.remover(user_id, "transacoes", timestamp)
+        atualizar_agregados(user_id, removidas, -1)
+        if removidas:
+            invalidar_faturas(user_id, removidas, get_regras_cartoes_db(user_id))
+            incrementar_versao(user_id)
 
+@cronometrado('db_ler_parceladas')
 def get_compras_parceladas_db(user_id):
-    return get_user_data(user_id, "parceladas", [])
+    return [CompraParcelada.de_dict(c) for c in get_armazenamento().listar(user_id, "parceladas")]
 
 def salvar_compra_parcelada_db(user_id, data):
-    compras = get_compras_parceladas_db(user_id)
-    compras.append(data)
-    set_user_data(user_id, "parceladas", compras)
+    data = como_dict(data)
+    armazenamento = get_armazenamento()
+    with armazenamento.bloqueio(user_id):
+        armazenamento.anexar(user_id, "parceladas", data)
+        invalidar_faturas_parcelada(user_id, data, get_regras_cartoes_db(user_id))
+        incrementar_versao(user_id)
 
 # --- Configurações (Categorias, Contas, etc.) ---
+CATEGORIAS_PADRAO = {
+    'Pagamentos': ['cartão de crédito', 'fatura', 'pagamento fatura'],
+    'Compras': ['mercado pago', 'mercado livre', 'compras a vista', 'compras parceladas', 'computec'],
+    'Assinaturas': ['assinatura', 'apple', 'netflix'], 'Investimentos': ['poupança', 'investi'],
+    'Cuidados Pessoais': ['barbearia'], 'Educação': ['educação', 'curso', 'livro', 'puc'],
+    'Saúde': ['farmacia', 'médico', 'remédio'],
+    'Alimentação': ['ifood', 'marmitex', 'mercado', 'restaurante', 'dualcoffe', 'café', 'pizza', 'lanche'],
+    'Transporte': ['carro', 'combustivel', 'combustível', 'uber', '99', 'gasolina', 'transporte'],
+    'Salário': ['salário'], 'Outras Receitas': ['recebi', 'ganhei'], 'Outros': []
+}
+CONTAS_PADRAO = {'contas': ['Swile', 'Itaú', 'Nubank', 'Inter'], 'cartoes': ['Mercado Pago', 'Nubank', 'Itaú']}
+REGRAS_CARTOES_PADRAO = {'Mercado Pago': 28, 'Nubank': 25, 'Itaú': 20}
+
 def get_categorias(user_id):
-    default = {
-        'Pagamentos': ['cartão de crédito', 'fatura', 'pagamento fatura'],
-        'Compras': ['mercado pago', 'mercado livre', 'compras a vista', 'compras parceladas', 'computec'],
-        'Assinaturas': ['assinatura', 'apple', 'netflix'], 'Investimentos': ['poupança', 'investi'],
-        'Cuidados Pessoais': ['barbearia'], 'Educação': ['educação', 'curso', 'livro', 'puc'],
-        'Saúde': ['farmacia', 'médico', 'remédio'],
-        'Alimentação': ['ifood', 'marmitex', 'mercado', 'restaurante', 'dualcoffe', 'café', 'pizza', 'lanche'],
-        'Transporte': ['carro', 'combustivel', 'combustível', 'uber', '99', 'gasolina', 'transporte'],
-        'Salário': ['salário'], 'Outras Receitas': ['recebi', 'ganhei'], 'Outros': []
-    }
-    return get_user_data(user_id, "categorias", default)
+    return get_user_data(user_id, "categorias", CATEGORIAS_PADRAO)
 
 def adicionar_categoria_db(user_id, nome, palavras_str):
-    categorias = get_categorias(user_id)
     palavras = [p.strip().lower() for p in palavras_str.split(',')]
-    categorias[nome.capitalize()] = palavras
-    set_user_data(user_id, "categorias", categorias)
+    def alterar(categorias):
+        categorias[nome.capitalize()] = palavras
+        return categorias
+    atualizar_user_data(user_id, "categorias", CATEGORIAS_PADRAO, alterar)
 
 def apagar_categoria_db(user_id, nome):
-    categorias = get_categorias(user_id)
-    if nome in categorias:
+    def alterar(categorias):
+        if nome not in categorias:
+            return INALTERADO
         del categorias[nome]
-        set_user_data(user_id, "categorias", categorias)
+        return categorias
+    atualizar_user_data(user_id, "categorias", CATEGORIAS_PADRAO, alterar)
+
+def _contas_validas(contas):
+    # Auto-correção para formato antigo (lista)
+    return copy.deepcopy(CONTAS_PADRAO) if isinstance(contas, list) else contas
 
 def get_contas_conhecidas(user_id):
-    default = {'contas': ['Swile', 'Itaú', 'Nubank', 'Inter'], 'cartoes': ['Mercado Pago', 'Nubank', 'Itaú']}
-    user_contas = get_user_data(user_id, "contas", default)
-    if isinstance(user_contas, list): # Auto-correção para formato antigo
-        set_user_data(user_id, "contas", default)
-        return default
+    user_contas = get_user_data(user_id, "contas", CONTAS_PADRAO)
+    if isinstance(user_contas, list):
+        return atualizar_user_data(user_id, "contas", CONTAS_PADRAO, _contas_validas)
     return user_contas
 
 def get_cartoes_conhecidos(user_id):
     return get_contas_conhecidas(user_id).get('cartoes', [])
 
 def adicionar_conta_db(user_id, nome):
-    contas = get_contas_conhecidas(user_id)
     nome_cap = nome.capitalize()
-    if nome_cap not in contas['contas']: contas['contas'].append(nome_cap)
-    if nome_cap not in contas['cartoes']: contas['cartoes'].append(nome_cap)
-    set_user_data(user_id, "contas", contas)
+    def alterar(contas):
+        contas = _contas_validas(contas)
+        if nome_cap not in contas['contas']: contas['contas'].append(nome_cap)
+        if nome_cap not in contas['cartoes']: contas['cartoes'].append(nome_cap)
+        return contas
+    atualizar_user_data(user_id, "contas", CONTAS_PADRAO, alterar)
 
 def apagar_conta_db(user_id, nome):
-    contas = get_contas_conhecidas(user_id)
-    if nome in contas.get('contas', []): contas['contas'].remove(nome)
-    if nome in contas.get('cartoes', []): contas['cartoes'].remove(nome)
-    set_user_data(user_id, "contas", contas)
+    def alterar(contas):
+        contas = _contas_validas(contas)
+        if nome in contas.get('contas', []): contas['contas'].remove(nome)
+        if nome in contas.get('cartoes', []): contas['cartoes'].remove(nome)
+        return contas
+    atualizar_user_data(user_id, "contas", CONTAS_PADRAO, alterar)
 
 def get_regras_cartoes_db(user_id):
-    default = {'Mercado Pago': 28, 'Nubank': 25, 'Itaú': 20}
-    return get_user_data(user_id, "regras_cartoes", default)
+    return get_user_data(user_id, "regras_cartoes", REGRAS_CARTOES_PADRAO)
 
 def salvar_regras_cartao_db(user_id, regras):
-    regras_atuais = get_regras_cartoes_db(user_id)
-    for cartao, dia in regras.items():
-        if dia.isdigit():
-            regras_atuais[cartao] = int(dia)
-    set_user_data(user_id, "regras_cartoes", regras_atuais)
+    def alterar(regras_atuais):
+        for cartao, dia in regras.items():
+            if dia.isdigit():
+                regras_atuais[cartao] = int(dia)
+        return regras_atuais
+    atualizar_user_data(user_id, "regras_cartoes", REGRAS_CARTOES_PADRAO, alterar)
 
 # --- Metas ---
 def get_metas_db(user_id):
     return get_user_data(user_id, "metas", {})
 
 def salvar_meta_db(user_id, categoria, valor):
-    metas = get_metas_db(user_id)
-    metas[categoria] = valor
-    set_user_data(user_id, "metas", metas)
+    def alterar(metas):
+        metas[categoria] = valor
+        return metas
+    atualizar_user_data(user_id, "metas", {}, alterar)
 
 def apagar_meta_db(user_id, categoria):
-    metas = get_metas_db(user_id)
-    if categoria in metas:
+    def alterar(metas):
+        if categoria not in metas:
+            return INALTERADO
         del metas[categoria]
-        set_user_data(user_id, "metas", metas)
+        return metas
+    atualizar_user_data(user_id, "metas", {}, alterar)
 
 # --- Lembretes ---
+@cronometrado('db_ler_lembretes')
 def get_lembretes_db(user_id):
-    return get_user_data(user_id, "lembretes", [])
+    return [Lembrete.de_dict(l) for l in get_armazenamento().listar(user_id, "lembretes")]
 
 def salvar_lembrete_db(user_id, data):
-    lembretes = get_lembretes_db(user_id)
-    lembretes.append(data)
-    set_user_data(user_id, "lembretes", lembretes)
+    data = como_dict(data)
+    armazenamento = get_armazenamento()
+    with armazenamento.bloqueio(user_id):
+        armazenamento.anexar(user_id, "lembretes", data)
+        indexar_lembrete(user_id, data)
+        incrementar_versao(user_id)
 
 def apagar_lembrete_db(user_id, timestamp):
-    lembretes = get_lembretes_db(user_id)
-    novos = [l for l in lembretes if l.get('timestamp') != timestamp]
-    set_user_data(user_id, "lembretes", novos)
+    armazenamento = get_armazenamento()
+    with armazenamento.bloqueio(user_id):
+        removidos = armazenamento.remover(user_id, "lembretes", timestamp)
+        desindexar_lembretes(user_id, removidos)
+        if removidos:
+            incrementar_versao(user_id)
+
+def get_usuarios_com_lembretes():
+    return get_armazenamento().usuarios("lembretes")
 
@@ -0,0 +1,64 @@
+import threading
+import time
+from cache import CacheLRU
+from database import atualizar_user_data, INALTERADO
+
+# --- Deduplicação de mensagens recebidas ---
+# A Meta reenvia o mesmo evento quando acha que não respondemos a tempo; sem
+# isto cada reenvio registava a despesa outra vez. Cada mensagem é identificada
+# pelo seu "id" (wamid) e guardada durante JANELA segundos:
+#   1. em memória (LRU com TTL), verificado no próprio webhook, em O(1);
+#   2. no armazenamento, por utilizador ("mensagens_recebidas"), verificado
+#      antes do processamento, para apanhar reenvios depois de um reinício.
+
+JANELA = 24 * 3600
+
+class Deduplicador:
+    def __init__(self, janela=JANELA, capacidade=100000):
+        self.janela = janela
+        self._vistas = CacheLRU(capacidade=capacidade, ttl=janela)
+        self._lock = threading.Lock()
+        self.novas = 0
+        self.duplicadas = 0
+        self.duplicadas_persistentes = 0
+
+    def registrar(self, message_id):
+        """Devolve False se a mensagem já foi vista neste processo; caso contrário regista-a."""
+        with self._lock:
+            if self._vistas.get(message_id) is not None:
+                self.duplicadas += 1
+                return False
+            self._vistas.set(message_id, True)
+            self.novas += 1
+            return True
+
+    def registrar_persistente(self, user_id, message_id):
+        """Como registrar, mas no armazenamento do utilizador; as entradas fora da janela são descartadas."""
+        return message_id in self.registrar_persistente_varios(user_id, [message_id])
+
+    def registrar_persistente_varios(self, user_id, message_ids):
+        """Regista vários ids com uma leitura e uma escrita; devolve o conjunto dos que eram novos."""
+        agora = time.time()
+        novas = set()
+
+        def alterar(recebidas):
+            # Lido e gravado no bloqueio do utilizador: dois workers com o mesmo reenvio não o aceitam ambos.
+            recebidas = {m: t for m, t in recebidas.items() if agora - t < self.janela}
+            novas.update(m for m in message_ids if m not in recebidas)
+            if not novas:
+                return INALTERADO
+            recebidas.update((m, agora) for m in novas)
+            return recebidas
+
+        atualizar_user_data(user_id, "mensagens_recebidas", {}, alterar)
+        with self._lock:
+            self.duplicadas_persistentes += len(set(message_ids) - novas)
+        return novas
+
+    def estatisticas(self):
+        with self._lock:
+            return {'novas': self.novas, 'duplicadas_descartadas': self.duplicadas,
+                    'duplicadas_persistentes': self.duplicadas_persistentes}
+
+
+deduplicador = Deduplicador()
@@ -0,0 +1,80 @@
+import heapq
+import json
+from datetime import datetime
+from itertools import islice
+from database import iterar_transacoes_db, get_compras_parceladas_db, get_regras_cartoes_db
+from parcelas import get_plano_parcelas
+from registos import Transacao
+
+# --- Extrato paginado ---
+# As transações são lidas do armazenamento da mais recente para a mais antiga,
+# sem montar a lista completa, e intercaladas com as parcelas do mês (as mesmas
+# que o dashboard mostra). O cursor é o timestamp da última transação devolvida:
+# a página seguinte começa nas transações anteriores a ele. Uma página nunca
+# termina a meio de um grupo de transações com o mesmo timestamp, para que o
+# cursor não salte nenhuma.
+
+TAMANHO_PAGINA = 50
+TAMANHO_MAXIMO_PAGINA = 500
+
+def _intervalo_do_mes(mes):
+    """'AAAA-MM' -> (inicio, fim) para comparar com timestamps ISO."""
+    ano, numero = (int(p) for p in mes.split('-'))
+    ano_seguinte, mes_seguinte = divmod(ano * 12 + numero, 12)
+    return mes, f"{ano_seguinte:04d}-{mes_seguinte + 1:02d}"
+
+def iterar_extrato(user_id, antes=None, mes=None, categoria=None, metodo=None, hoje=None, plano=None):
+    """
+    Gera as transações do extrato (guardadas + parcelas do mês), da mais recente
+    para a mais antiga. Sem filtro de mês, as parcelas são as do mês atual.
+    """
+    hoje = hoje or datetime.now()
+    inicio, fim = _intervalo_do_mes(mes) if mes else (None, None)
+
+    guardadas = iterar_transacoes_db(user_id, antes, inicio, fim)
+
+    ano, numero = (int(p) for p in mes.split('-')) if mes else (hoje.year, hoje.month)
+    if plano is None:
+        plano = get_plano_parcelas(user_id, get_compras_parceladas_db(user_id), get_regras_cartoes_db(user_id))
+    parcelas_do_mes = [p for p in plano.parcelas_do_mes(ano, numero) if antes is None or p.timestamp < antes]
+    parcelas_do_mes.sort(key=lambda t: t.timestamp, reverse=True)
+
+    # Em empates as guardadas vêm primeiro, como no sorted() do dashboard.
+    for t in heapq.merge(guardadas, parcelas_do_mes, key=lambda t: t.timestamp or '', reverse=True):
+        if categoria and (t.categoria or 'Outros') != categoria:
+            continue
+        if metodo and t.metodo != metodo:
+            continue
+        yield t
+
+def pagina_extrato(transacoes, limite=TAMANHO_PAGINA):
+    """
+    Gera até `limite` transações (mais as que empatam com a última) e, no fim,
+    o cursor da página seguinte (None se não houver mais).
+    """
+    ultima = None
+    for t in islice(transacoes, limite):
+        ultima = t
+        yield t
+    if ultima is None:
+        yield None
+        return
+    for t in transacoes:
+        if t.timestamp != ultima.timestamp:
+            yield ultima.timestamp
+            return
+        yield t
+    yield None
+
+def extrato_json(user_id, cursor=None, limite=TAMANHO_PAGINA, **filtros):
+    """Gera o JSON {"transacoes": [...], "proximo_cursor": ...} aos bocados, uma transação de cada vez."""
+    limite = max(1, min(limite, TAMANHO_MAXIMO_PAGINA))
+    pagina = pagina_extrato(iterar_extrato(user_id, antes=cursor or None, **filtros), limite)
+    yield '{"transacoes": ['
+    separador = ''
+    for item in pagina:
+        if not isinstance(item, Transacao):
+            yield f'], "proximo_cursor": {json.dumps(item)}}}'
+            return
+        yield separador + json.dumps(dict(item.para_dict(), is_deletable=item.is_deletable), ensure_ascii=False)
+        separador = ', '
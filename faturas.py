@@ -0,0 +1,177 @@
+import calendar
+from datetime import date, datetime, timedelta
+from armazenamento import get_armazenamento
+from parcelas import DIA_FECHAMENTO_PADRAO, get_plano_parcelas, indice_fatura, indice_mes, nome_mes
+from metricas import cronometrado
+from registos import CompraParcelada
+
+# --- Faturas dos cartões ---
+# A fatura de um cartão no mês M junta as compras no crédito feitas entre o
+# dia a seguir ao fecho de M-1 e o dia de fecho de M (regras_cartoes, a mesma
+# regra de PlanoParcelas) e as parcelas cuja fatura cai em M.
+#
+# Depois do dia de fecho a fatura já não muda: na primeira leitura é guardado
+# um resumo em "faturas_<AAAA-MM>" ({cartao: resumo}) e as leituras seguintes
+# de meses fechados são uma leitura por mês. Só a fatura aberta e as futuras
+# são calculadas sempre.
+#
+# Um resumo guardado deixa de valer quando:
+#   - o dia de fecho do cartão muda (o resumo guarda o dia com que foi feito);
+#   - é gravada ou apagada uma compra no crédito, ou gravada uma compra
+#     parcelada, com fatura num mês já fechado: o database.py chama
+#     invalidar_faturas / invalidar_faturas_parcelada dentro do bloqueio do
+#     utilizador, junto com a escrita.
+# Um resumo só é guardado se a versão do utilizador não mudou enquanto era
+# calculado, por isso uma escrita simultânea não deixa um resumo desatualizado.
+
+def _depois_do_fecho(indice, dia_fechamento):
+    """Primeiro dia cujas compras já entram na fatura seguinte à do mês indice."""
+    ano, mes = divmod(indice, 12)
+    if dia_fechamento < calendar.monthrange(ano, mes + 1)[1]:
+        return date(ano, mes + 1, dia_fechamento + 1)
+    ano, mes = divmod(indice + 1, 12)
+    return date(ano, mes + 1, 1)
+
+def periodo_fatura(indice, dia_fechamento):
+    """Datas [inicio, fim) das compras que entram na fatura do mês indice."""
+    return _depois_do_fecho(indice - 1, dia_fechamento), _depois_do_fecho(indice, dia_fechamento)
+
+def _fechada(indice, dia_fechamento, hoje):
+    return hoje >= _depois_do_fecho(indice, dia_fechamento)
+
+def _chave(indice):
+    ano, mes = divmod(indice, 12)
+    return f"faturas_{ano:04d}-{mes + 1:02d}"
+
+def _resumo_vazio(indice, dia_fechamento):
+    inicio, fim = periodo_fatura(indice, dia_fechamento)
+    return {
+        'total': 0, 'compras': 0, 'parcelas': 0, 'categorias': {}, 'dia_fechamento': dia_fechamento,
+        'inicio': inicio.isoformat(), 'fim': (fim - timedelta(days=1)).isoformat(),  # datas inclusive
+    }
+
+def _somar(resumo, valor, categoria, contador):
+    resumo['total'] += valor
+    resumo[contador] += 1
+    categoria = categoria or 'Outros'
+    resumo['categorias'][categoria] = resumo['categorias'].get(categoria, 0) + valor
+
+def calcular_faturas(user_id, indice, dias_fechamento, plano):
+    """Resumos das faturas do mês indice, a partir das transações e das parcelas; dias_fechamento: {cartao: dia}."""
+    resumos = {cartao: _resumo_vazio(indice, dia) for cartao, dia in dias_fechamento.items()}
+    # Cartões com o mesmo dia de fecho têm o mesmo período: uma leitura por período.
+    por_periodo = {}
+    for cartao, dia in dias_fechamento.items():
+        por_periodo.setdefault(periodo_fatura(indice, dia), set()).add(cartao)
+    armazenamento = get_armazenamento()
+    for (inicio, fim), cartoes in por_periodo.items():
+        for t in armazenamento.listar(user_id, "transacoes", inicio.isoformat(), fim.isoformat()):
+            if t.get('tipo') == 'despesa' and t.get('metodo') == 'crédito' and t.get('cartao') in cartoes:
+                _somar(resumos[t['cartao']], t.get('valor') or 0, t.get('categoria'), 'compras')
+    ano, mes = divmod(indice, 12)
+    for parcela in plano.parcelas_do_mes(ano, mes + 1):
+        if parcela.cartao in resumos:
+            _somar(resumos[parcela.cartao], parcela.valor, parcela.categoria, 'parcelas')
+    return resumos
+
+def _congelar(user_id, indice, resumos, versao):
+    armazenamento = get_armazenamento()
+    with armazenamento.bloqueio(user_id):
+        if armazenamento.ler(user_id, "versao", 0) != versao:
+            return  # Houve escritas durante o cálculo; fica para a próxima leitura.
+        guardadas = armazenamento.ler(user_id, _chave(indice), {})
+        guardadas.update(resumos)
+        armazenamento.gravar(user_id, _chave(indice), guardadas)
+
+@cronometrado('faturas')
+def faturas_dos_meses(user_id, primeiro, ultimo, hoje=None):
+    """
+    Faturas dos cartões conhecidos nos meses [primeiro, ultimo] (índices de mês):
+    {'AAAA-MM': {cartao: resumo}}, com 'fechada' em cada resumo.
+    """
+    # Importado aqui: o database.py importa este módulo.
+    from database import get_cartoes_conhecidos, get_regras_cartoes_db, get_compras_parceladas_db, get_versao_usuario
+    hoje = (hoje or datetime.now()).date()
+    regras = get_regras_cartoes_db(user_id)
+    dias_fechamento = {cartao: regras.get(cartao, DIA_FECHAMENTO_PADRAO) for cartao in get_cartoes_conhecidos(user_id)}
+    armazenamento = get_armazenamento()
+    plano = versao = None
+    resultado = {}
+
+    for indice in range(primeiro, ultimo + 1):
+        fechados = {cartao for cartao, dia in dias_fechamento.items() if _fechada(indice, dia, hoje)}
+        guardadas = armazenamento.ler(user_id, _chave(indice), {}) if fechados else {}
+        faturas, faltam = {}, {}
+        for cartao, dia in dias_fechamento.items():
+            resumo = guardadas.get(cartao) if cartao in fechados else None
+            if resumo is not None and resumo['dia_fechamento'] == dia:
+                faturas[cartao] = resumo
+            else:
+                faltam[cartao] = dia
+
+        if faltam:
+            if plano is None:
+                versao = get_versao_usuario(user_id)
+                plano = get_plano_parcelas(user_id, get_compras_parceladas_db(user_id), regras)
+            calculadas = calcular_faturas(user_id, indice, faltam, plano)
+            faturas.update(calculadas)
+            congelar = {cartao: resumo for cartao, resumo in calculadas.items() if cartao in fechados}
+            if congelar:
+                _congelar(user_id, indice, congelar, versao)
+
+        resultado[_chave(indice)[len("faturas_"):]] = {
+            cartao: dict(faturas[cartao], fechada=cartao in fechados) for cartao in dias_fechamento
+        }
+    return resultado
+
+def historico_faturas(user_id, ano, mes, meses=12, hoje=None):
+    """
+    Faturas dos `meses` meses que terminam no indicado, do mais recente para o mais antigo.
+    ValueError se os períodos saírem dos anos aceites (relatorios.ANO_MINIMO a ANO_MAXIMO).
+    """
+    # Importado aqui: o relatorios.py importa o database.py, que importa este módulo.
+    from relatorios import ANO_MINIMO, ANO_MAXIMO
+    ultimo = ano * 12 + mes - 1
+    # O período da primeira fatura começa no mês anterior e o da última acaba no seguinte.
+    if (ultimo - meses) // 12 < ANO_MINIMO or (ultimo + 1) // 12 > ANO_MAXIMO:
+        raise ValueError(f"só são aceites anos entre {ANO_MINIMO} e {ANO_MAXIMO}")
+    por_mes = faturas_dos_meses(user_id, ultimo - meses + 1, ultimo, hoje)
+    return [
+        {'mes': chave, 'nome': nome_mes(ultimo - k), 'faturas': por_mes[chave]}
+        for k, chave in enumerate(reversed(list(por_mes)))
+    ]
+
+# --- Invalidação (chamada pelo database.py, dentro do bloqueio do utilizador) ---
+def _descartar(user_id, afetadas):
+    """afetadas: {indice: {cartoes}} cujos resumos guardados deixam de valer."""
+    armazenamento = get_armazenamento()
+    for indice, cartoes in afetadas.items():
+        guardadas = armazenamento.ler(user_id, _chave(indice), None)
+        if guardadas and cartoes & guardadas.keys():
+            armazenamento.gravar(user_id, _chave(indice), {c: r for c, r in guardadas.items() if c not in cartoes})
+
+def invalidar_faturas(user_id, transacoes, regras_cartoes, hoje=None):
+    """Transações (dicionários) gravadas ou apagadas: descarta os resumos das faturas fechadas onde entram."""
+    hoje = (hoje or datetime.now()).date()
+    afetadas = {}
+    for t in transacoes:
+        cartao = t.get('cartao')
+        if t.get('tipo') != 'despesa' or t.get('metodo') != 'crédito' or not cartao or not t.get('timestamp'):
+            continue
+        dia = regras_cartoes.get(cartao, DIA_FECHAMENTO_PADRAO)
+        indice = indice_fatura(datetime.fromisoformat(t['timestamp']), dia)
+        # Uma compra com a data de hoje cai sempre numa fatura aberta: sem leituras.
+        if _fechada(indice, dia, hoje):
+            afetadas.setdefault(indice, set()).add(cartao)
+    _descartar(user_id, afetadas)
+
+def invalidar_faturas_parcelada(user_id, compra, regras_cartoes, hoje=None):
+    """Compra parcelada (dicionário) gravada: descarta os resumos das faturas fechadas com parcelas dela."""
+    compra = CompraParcelada.de_dict(compra)
+    hoje = (hoje or datetime.now()).date()
+    if not compra.cartao:
+        return
+    dia = regras_cartoes.get(compra.cartao, DIA_FECHAMENTO_PADRAO)
+    primeiro = indice_fatura(compra.inicio, dia)
+    ultimo = min(primeiro + compra.num_parcelas - 1, indice_mes(hoje))
+    _descartar(user_id, {indice: {compra.cartao} for indice in range(primeiro, ultimo + 1) if _fechada(indice, dia, hoje)})
@@ -0,0 +1,152 @@
+import os
+import queue
+import threading
+import time
+import zlib
+from collections import deque
+
+# --- Fila de processamento de mensagens ---
+# O webhook só valida e enfileira; um conjunto de threads trabalhadoras faz o
+# processamento e o envio das respostas. Cada utilizador é sempre atribuído à
+# mesma thread (pelo hash do número), por isso as mensagens de um utilizador
+# são processadas pela ordem de chegada e o estado "ultima_pergunta" não é
+# disputado por duas threads.
+
+AMOSTRAS_LATENCIA = 1000
+
+class FilaMensagens:
+    def __init__(self, processar, num_trabalhadores=4):
+        self.processar = processar
+        self._filas = [queue.Queue() for _ in range(num_trabalhadores)]
+        self._lock = threading.Lock()
+        self._latencias = deque(maxlen=AMOSTRAS_LATENCIA)
+        self.enfileiradas = 0
+        self.processadas = 0
+        self.erros = 0
+        for i, fila in enumerate(self._filas):
+            threading.Thread(target=self._trabalhar, args=(fila,), name=f"trabalhador-{i}", daemon=True).start()
+
+    def _fila_do_usuario(self, user_id):
+        return self._filas[zlib.crc32(str(user_id).encode()) % len(self._filas)]
+
+    def enfileirar(self, user_id, *args):
+        """Agenda processar(user_id, *args) na thread do utilizador e retorna de imediato."""
+        with self._lock:
+            self.enfileiradas += 1
+        self._fila_do_usuario(user_id).put((time.monotonic(), user_id, args))
+
+    def _trabalhar(self, fila):
+        while True:
+            enfileirada_em, user_id, args = fila.get()
+            try:
+                self.processar(user_id, *args)
+            except Exception as e:
+                with self._lock:
+                    self.erros += 1
+                print(f"❌ Erro ao processar mensagem de {user_id}: {e}")
+            finally:
+                with self._lock:
+                    self.processadas += 1
+                    self._latencias.append(time.monotonic() - enfileirada_em)
+                fila.task_done()
+
+    def aguardar(self):
+        """Bloqueia até todas as mensagens enfileiradas terem sido processadas."""
+        for fila in self._filas:
+            fila.join()
+
+    def profundidade(self):
+        return sum(fila.qsize() for fila in self._filas)
+
+    def estatisticas(self):
+        with self._lock:
+            return resumo_fila(self.profundidade(), self.enfileiradas, self.processadas, self.erros, self._latencias)
+
+
+def resumo_fila(profundidade, enfileiradas, processadas, erros, latencias):
+    latencias = sorted(latencias)
+
+    def percentil(p):
+        return latencias[min(len(latencias) - 1, int(p * len(latencias)))] if latencias else 0
+
+    return {
+        'profundidade': profundidade, 'enfileiradas': enfileiradas,
+        'processadas': processadas, 'erros': erros,
+        'latencia_p50_ms': percentil(0.5) * 1000, 'latencia_p95_ms': percentil(0.95) * 1000,
+        'latencia_max_ms': (latencias[-1] if latencias else 0) * 1000,
+    }
+
+
+class FilaAssincrona:
+    """
+    A mesma fila para asyncio (assincrono.py): processar é uma corrotina e cada
+    utilizador com mensagens pendentes tem uma tarefa que as processa pela ordem
+    de chegada. Sem número fixo de trabalhadores: utilizadores à espera da rede
+    não atrasam os outros. Só deve ser usada a partir do event loop.
+    """
+
+    def __init__(self, processar):
+        self.processar = processar
+        self._pendentes = {}  # user_id -> deque[(enfileirada_em, args)]
+        self._tarefas = set()
+        self._latencias = deque(maxlen=AMOSTRAS_LATENCIA)
+        self.enfileiradas = 0
+        self.processadas = 0
+        self.erros = 0
+
+    def enfileirar(self, user_id, *args):
+        """Agenda processar(user_id, *args) depois das mensagens pendentes do utilizador e retorna de imediato."""
+        import asyncio
+        self.enfileiradas += 1
+        pendentes = self._pendentes.get(user_id)
+        if pendentes is not None:
+            pendentes.append((time.monotonic(), args))
+            return
+        self._pendentes[user_id] = deque([(time.monotonic(), args)])
+        tarefa = asyncio.get_running_loop().create_task(self._trabalhar(user_id))
+        self._tarefas.add(tarefa)
+        tarefa.add_done_callback(self._tarefas.discard)
+
+    async def _trabalhar(self, user_id):
+        pendentes = self._pendentes[user_id]
+        try:
+            while pendentes:
+                enfileirada_em, args = pendentes.popleft()
+                try:
+                    await self.processar(user_id, *args)
+                except Exception as e:
+                    self.erros += 1
+                    print(f"❌ Erro ao processar mensagem de {user_id}: {e}")
+                finally:
+                    self.processadas += 1
+                    self._latencias.append(time.monotonic() - enfileirada_em)
+        finally:
+            del self._pendentes[user_id]
+
+    async def aguardar(self):
+        """Espera até todas as mensagens enfileiradas terem sido processadas."""
+        import asyncio
+        while self._tarefas:
+            await asyncio.gather(*self._tarefas, return_exceptions=True)
+
+    def profundidade(self):
+        return sum(len(pendentes) for pendentes in self._pendentes.values())
+
+    def estatisticas(self):
+        return resumo_fila(self.profundidade(), self.enfileiradas, self.processadas, self.erros, self._latencias)
+
+_fila = None
+_fila_lock = threading.Lock()
+
+def get_fila(processar):
+    """Cria (na primeira chamada) a fila global, com LALABANK_TRABALHADORES threads."""
+    global _fila
+    with _fila_lock:
+        if _fila is None:
+            _fila = FilaMensagens(processar, int(os.environ.get("LALABANK_TRABALHADORES", 4)))
+    return _fila
+
+def esvaziar_fila():
+    """Espera que a fila, se já existir, processe as mensagens pendentes (ex.: antes de um worker terminar)."""
+    if _fila is not None:
+        _fila.aguardar()
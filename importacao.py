@@ -0,0 +1,254 @@
+import argparse
+import csv
+import io
+import json
+import math
+import re
+import secrets
+import unicodedata
+from datetime import datetime, timedelta
+from database import salvar_transacoes_db, iterar_transacoes_db, get_categorias, get_versao_configuracao
+from analisador import converter_valor, CATEGORIAS_RECEITA, CATEGORIAS_SO_RECEITA
+from categorizador import ClassificadorPalavras, get_classificador
+from registos import Transacao
+from metricas import cronometrado
+
+# --- Importação e exportação em massa ---
+# Importa extratos em CSV (incluindo os exportados pelos bancos: ";" como
+# separador, datas dd/mm/aaaa e valores "1.234,56") ou JSONL (um objeto por
+# linha, no formato guardado). O ficheiro é lido linha a linha e as transações
+# são gravadas em lotes de TAMANHO_LOTE com salvar_transacoes_db, por isso a
+# memória usada não depende do tamanho do ficheiro e cada lote atualiza os
+# agregados uma vez. As transações sem categoria são categorizadas por lote,
+# com as regras de categorizar_transacao. Se o ficheiro deixar de poder ser
+# lido a meio (codificação, cabeçalho), os lotes anteriores ficam gravados e o
+# resumo diz porquê.
+#
+# O timestamp identifica a transação (é a chave das remoções), por isso as
+# linhas só com data recebem uma hora única: um desvio aleatório por
+# importação, na primeira hora do dia, mais um microssegundo por linha do
+# mesmo dia. Duas importações com lançamentos no mesmo dia não geram o mesmo
+# timestamp (a probabilidade de se sobreporem é desprezável).
+#
+# A exportação percorre o histórico com iterar_transacoes_db (um segmento
+# mensal de cada vez) e gera o CSV/JSONL aos bocados.
+#
+# Linha de comandos:
+#   python importacao.py importar <user_id> <ficheiro> [--conta Itaú | --cartao Nubank]
+#   python importacao.py exportar <user_id> [--formato jsonl] > extrato.csv
+
+TAMANHO_LOTE = 2000
+MAXIMO_ERROS = 100
+FORMATOS = ('csv', 'jsonl')
+COLUNAS_EXPORTACAO = Transacao.CAMPOS
+
+# Nomes de colunas aceites (sem acentos, em minúsculas) -> campo da transação
+SINONIMOS_COLUNAS = {
+    'timestamp': 'timestamp', 'data': 'timestamp', 'date': 'timestamp', 'data lancamento': 'timestamp',
+    'descricao': 'descricao', 'historico': 'descricao', 'lancamento': 'descricao', 'memo': 'descricao',
+    'description': 'descricao', 'valor': 'valor', 'valor (r$)': 'valor', 'amount': 'valor',
+    'tipo': 'tipo', 'categoria': 'categoria', 'metodo': 'metodo', 'conta': 'conta', 'cartao': 'cartao',
+}
+
+METODOS = {'credito': 'crédito', 'debito': 'débito'}
+
+_classificador_receitas = ClassificadorPalavras(CATEGORIAS_RECEITA)
+
+class ErroLinha(ValueError):
+    pass
+
+def _normalizar(texto):
+    sem_acentos = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode()
+    return sem_acentos.strip().lower()
+
+def _ler_valor(texto):
+    numero = re.sub(r"[^\d,.\-]", "", texto or "")
+    valor = converter_valor(numero.lstrip('-')) if re.search(r"\d", numero) else None
+    if valor is None:
+        raise ErroLinha(f"valor inválido: {texto!r}")
+    return -valor if numero.startswith('-') else valor
+
+class _TimestampsDoDia:
+    """Timestamps das linhas só com data: o dia, mais o desvio desta importação e um microssegundo por linha."""
+
+    def __init__(self):
+        self._desvio = secrets.randbelow(3600 * 10**6)
+        self._linhas = {}
+
+    def gerar(self, data):
+        dia = data.date()
+        n = self._linhas[dia] = self._linhas.get(dia, 0) + 1
+        return (data + timedelta(microseconds=self._desvio + n)).isoformat()
+
+def _ler_data(texto, timestamps):
+    """ISO ou dd/mm/aaaa; as datas sem hora recebem uma hora única (timestamps.gerar)."""
+    texto = texto.strip()
+    try:
+        if re.fullmatch(r"\d{1,2}/\d{1,2}/\d{2,4}", texto):
+            dia, mes, ano = (int(p) for p in texto.split('/'))
+            data, so_data = datetime(ano + 2000 if ano < 100 else ano, mes, dia), True
+        else:
+            data, so_data = datetime.fromisoformat(texto), len(texto) <= 10
+    except ValueError:
+        raise ErroLinha(f"data inválida: {texto!r}") from None
+    return timestamps.gerar(data) if so_data else data.isoformat()
+
+def _texto(campos, campo):
+    """Campo de texto da linha ('' se faltar); no JSONL pode vir com outro tipo."""
+    valor = campos.get(campo)
+    if valor is None:
+        return ''
+    if not isinstance(valor, str):
+        raise ErroLinha(f"campo {campo} inválido: {valor!r}")
+    return valor
+
+def _transacao(campos, conta, cartao, timestamps):
+    """Converte os campos de uma linha (já com os nomes da transação) numa Transacao."""
+    valor = campos.get('valor')
+    valor = _ler_valor(valor) if isinstance(valor, str) else valor
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)) or not math.isfinite(valor):
+        raise ErroLinha(f"valor inválido: {valor!r}")
+    tipo = _texto(campos, 'tipo').strip().lower()
+    if tipo not in ('despesa', 'receita'):
+        # Extratos bancários: saídas com sinal negativo
+        tipo = 'despesa' if valor < 0 else 'receita'
+
+    metodo = _normalizar(_texto(campos, 'metodo'))
+    metodo = METODOS.get(metodo, metodo) or None
+    conta_linha, cartao_linha = _texto(campos, 'conta') or conta, _texto(campos, 'cartao') or cartao
+    if metodo is None:
+        metodo = 'crédito' if cartao_linha and tipo == 'despesa' else 'débito' if conta_linha else 'outro'
+
+    return Transacao(
+        tipo, _texto(campos, 'descricao').strip(), abs(valor), _texto(campos, 'categoria') or None, metodo,
+        cartao_linha if metodo == 'crédito' else None, conta_linha if metodo != 'crédito' else None,
+        _ler_data(_texto(campos, 'timestamp'), timestamps)
+    )
+
+def _linhas_csv(linhas):
+    """Gera (número da linha, {campo: texto}) de um CSV com cabeçalho; o separador é detetado no cabeçalho."""
+    linhas = iter(linhas)
+    cabecalho = next(linhas, '')
+    separador = max(';,\t', key=cabecalho.count)
+    nomes = [SINONIMOS_COLUNAS.get(_normalizar(n)) for n in next(csv.reader([cabecalho], delimiter=separador))]
+    if 'valor' not in nomes or 'timestamp' not in nomes:
+        raise ValueError("O CSV precisa de colunas de data e valor.")
+    for numero, valores in enumerate(csv.reader(linhas, delimiter=separador), start=2):
+        if any(v.strip() for v in valores):
+            yield numero, {nome: v for nome, v in zip(nomes, valores) if nome}
+
+def _linhas_jsonl(linhas):
+    for numero, linha in enumerate(linhas, start=1):
+        if linha.strip():
+            try:
+                yield numero, json.loads(linha)
+            except json.JSONDecodeError as erro:
+                yield numero, ErroLinha(f"JSON inválido: {erro.msg}")
+
+def _ate_ao_erro(leitor, resumo):
+    """Gera as linhas do leitor; se o ficheiro deixar de poder ser lido, regista o motivo em resumo['erro'] e pára."""
+    try:
+        yield from leitor
+    except ValueError as erro:  # inclui UnicodeDecodeError
+        resumo['erro'] = str(erro)
+
+def _categorizar_lote(user_id, lote):
+    """Categoriza as transações sem categoria com as regras de categorizar_transacao."""
+    despesas = get_classificador(
+        user_id, get_versao_configuracao(user_id), lambda: get_categorias(user_id), ignorar=CATEGORIAS_SO_RECEITA
+    )
+    for t in lote:
+        if t.categoria:
+            continue
+        descricao = t.descricao.lower()
+        if t.tipo == 'receita':
+            t.categoria = _classificador_receitas.classificar(descricao) or 'Outras Receitas'
+        else:
+            t.categoria = despesas.classificar(descricao) or 'Outros'
+
+@cronometrado('importar_transacoes')
+def importar_transacoes(user_id, linhas, formato='csv', conta=None, cartao=None):
+    """
+    Importa as transações de um iterável de linhas de texto (ex.: um ficheiro aberto).
+    conta/cartao aplicam-se às linhas que não os indicam. Linhas inválidas são
+    ignoradas e reportadas; devolve {'importadas', 'ignoradas', 'erros': [(linha, motivo)]}.
+    Se o ficheiro deixar de poder ser lido, as linhas anteriores são gravadas e o
+    resumo inclui 'erro' com o motivo.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconhecido: {formato}")
+    resumo = {'importadas': 0, 'ignoradas': 0, 'erros': []}
+    leitor = _ate_ao_erro(_linhas_csv(linhas) if formato == 'csv' else _linhas_jsonl(linhas), resumo)
+    timestamps = _TimestampsDoDia()
+    lote = []
+
+    def gravar():
+        _categorizar_lote(user_id, lote)
+        salvar_transacoes_db(user_id, lote)
+        resumo['importadas'] += len(lote)
+        lote.clear()
+
+    for numero, campos in leitor:
+        try:
+            if isinstance(campos, ErroLinha):
+                raise campos
+            if not isinstance(campos, dict):
+                raise ErroLinha("a linha não é um objeto")
+            lote.append(_transacao(campos, conta, cartao, timestamps))
+        except ErroLinha as erro:
+            resumo['ignoradas'] += 1
+            if len(resumo['erros']) < MAXIMO_ERROS:
+                resumo['erros'].append((numero, str(erro)))
+            continue
+        if len(lote) >= TAMANHO_LOTE:
+            gravar()
+    if lote:
+        gravar()
+    return resumo
+
+def exportar_transacoes(user_id, formato='csv', tamanho_bloco=500):
+    """Gera o histórico do utilizador (da transação mais recente para a mais antiga) em CSV ou JSONL, aos bocados."""
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconhecido: {formato}")
+    transacoes = iterar_transacoes_db(user_id)
+    if formato == 'jsonl':
+        for t in transacoes:
+            yield json.dumps(t.para_dict(), ensure_ascii=False) + '\n'
+        return
+
+    bloco = io.StringIO()
+    escritor = csv.writer(bloco, lineterminator='\n')
+    escritor.writerow(COLUNAS_EXPORTACAO)
+    for n, t in enumerate(transacoes, start=1):
+        escritor.writerow(['' if v is None else v for v in (getattr(t, c) for c in COLUNAS_EXPORTACAO)])
+        if n % tamanho_bloco == 0:
+            yield bloco.getvalue()
+            bloco.seek(0)
+            bloco.truncate()
+    yield bloco.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa ou exporta transações em CSV ou JSONL.")
+    parser.add_argument('comando', choices=['importar', 'exportar'])
+    parser.add_argument('user_id')
+    parser.add_argument('ficheiro', nargs='?')
+    parser.add_argument('--formato', choices=FORMATOS)
+    parser.add_argument('--conta')
+    parser.add_argument('--cartao')
+    args = parser.parse_args()
+
+    if args.comando == 'exportar':
+        for bocado in exportar_transacoes(args.user_id, args.formato or 'csv'):
+            print(bocado, end='')
+        return
+    formato = args.formato or ('jsonl' if args.ficheiro.endswith('.jsonl') else 'csv')
+    with open(args.ficheiro, encoding='utf-8-sig', newline='') as f:
+        resumo = importar_transacoes(args.user_id, f, formato, args.conta, args.cartao)
+    print(f"{resumo['importadas']} transações importadas, {resumo['ignoradas']} linhas ignoradas")
+    for numero, motivo in resumo['erros']:
+        print(f"  linha {numero}: {motivo}")
+    if 'erro' in resumo:
+        print(f"Importação interrompida: {resumo['erro']}")
+
+if __name__ == '__main__':
+    main()
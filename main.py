@@ -1,42 +1,173 @@
-from flask import Flask, request, make_response, render_template
+import io
+import os
+import re
+from datetime import datetime
+from flask import Flask, request, make_response, render_template, jsonify, Response, stream_with_context
+from jinja2 import FileSystemBytecodeCache
 
 # Importa as funções dos nossos novos arquivos
-from utils import processar_mensagem, send_whatsapp_message, verificar_e_enviar_lembretes
+from utilis import processar_mensagem, send_whatsapp_message, send_whatsapp_messages, verificar_e_enviar_lembretes
 from database import (
-    salvar_meta_db, apagar_categoria_db, apagar_conta_db, 
+    escrita_agrupada, salvar_meta_db, apagar_categoria_db, apagar_conta_db, 
     adicionar_conta_db, adicionar_categoria_db, apagar_meta_db,
-    salvar_regras_cartao_db, apagar_lembrete_db
+    salvar_regras_cartao_db, apagar_lembrete_db, get_versao_usuario
 )
-from dashboard_calculations import calcular_dados_dashboard
+from fila import get_fila
+from deduplicacao import deduplicador
+from cache import criar_cache, estatisticas_cache
+import metricas
+from metricas import pedido, cronometro
+
+# --- Arranque ---
+# No Replit a app arranca a frio muitas vezes, e o primeiro pedido costuma ser
+# do webhook. Por isso só o que o webhook usa é importado aqui: o dashboard,
+# o extrato, os relatórios e a importação são importados na primeira vez que
+# a sua rota é usada, e o cliente HTTP do WhatsApp no primeiro envio
+# (whatsapp.py). Os templates compilados ficam em disco
+# (LALABANK_CACHE_TEMPLATES), para que os processos seguintes não os voltem a
+# compilar. Ver benchmarks/bench_arranque.py.
 
 app = Flask(__name__)
+# Sem LALABANK_CACHE_TEMPLATES, o Jinja usa uma pasta própria na pasta temporária do sistema.
+app.jinja_options = dict(app.jinja_options, bytecode_cache=FileSystemBytecodeCache(
+    os.environ.get("LALABANK_CACHE_TEMPLATES"), 'lalabank_%s.jinja'
+))
 
-@app.route("/webhook", methods=['GET', 'POST'])
-def webhook():
-    if request.method == 'POST':
-        data = request.get_json()
-        try:
-            message_data = data['entry'][0]['changes'][0]['value']['messages'][0]
-            if message_data['type'] == 'text':
-                phone_number = message_data['from']
-                message_body = message_data['text']['body']
+def precompilar_templates():
+    """Compila (ou carrega do cache em disco) os templates de templates/; usado no arranque dos workers. Devolve os nomes."""
+    nomes = app.jinja_env.list_templates(extensions=['html'])
+    for nome in nomes:
+        app.jinja_env.get_template(nome)
+    return nomes
+
+# Dashboards já calculados e renderizados, por (user_id, versão dos dados, mês atual).
+# O mês entra na chave porque as parcelas e a previsão de faturas dependem dele.
+# Partilhado entre os workers com LALABANK_CACHE=sqlite (ver cache.py e servidor.py).
+_dashboards = criar_cache('dashboards', capacidade=256, ttl=3600)
+
+# --- Métricas por pedido e perfil opcional (ver metricas.py) ---
+
+@app.before_request
+def _iniciar_metricas():
+    request.environ['lalabank.pedido'] = pedido(request.endpoint or 'desconhecido').__enter__()
+    if metricas.PERFIL_ATIVO and request.args.get('perfil') == '1':
+        request.environ['lalabank.perfil'] = metricas.AmostradorPerfil().__enter__()
+
+@app.after_request
+def _devolver_perfil(resposta):
+    amostrador = request.environ.pop('lalabank.perfil', None)
+    if amostrador is None:
+        return resposta
+    amostrador.__exit__(None, None, None)
+    return Response(amostrador.relatorio(), mimetype='text/plain')
 
+@app.teardown_request
+def _terminar_metricas(erro=None):
+    contexto = request.environ.pop('lalabank.pedido', None)
+    if contexto is not None:
+        contexto.__exit__(None, None, None)
+
+# --- Processamento das mensagens ---
+# Comum a esta app (fila de threads, fila.py) e à app ASGI (assincrono.py):
+# lotes_do_payload corre no webhook e responder_lote numa thread; só a forma
+# de enfileirar e de enviar as respostas muda entre as duas.
+
+def responder_lote(phone_number, mensagens):
+    """
+    Processa as mensagens [(texto, id), ...] de um utilizador pela ordem e devolve as respostas, sem as enviar.
+    As transações do lote são gravadas de uma só vez.
+    """
+    ids = [message_id for _, message_id in mensagens if message_id]
+    # Reenvios de mensagens já processadas antes de um reinício
+    with cronometro('deduplicar'):
+        novas = deduplicador.registrar_persistente_varios(phone_number, ids) if ids else set()
+
+    respostas = []
+    with escrita_agrupada(phone_number):
+        for message_body, message_id in mensagens:
+            if message_id and message_id not in novas:
+                continue
+            try:
                 resposta_bot = processar_mensagem(phone_number, message_body)
+            except Exception as e:
+                print(f"❌ Erro ao processar mensagem de {phone_number}: {e}")
+                continue
+            if resposta_bot:
+                respostas.extend(resposta_bot if isinstance(resposta_bot, tuple) else [resposta_bot])
+    return respostas
+
+def _estatisticas_fila():
+    return get_fila(processar_lote).estatisticas()
 
-                if resposta_bot:
-                    if isinstance(resposta_bot, tuple):
-                        for msg in resposta_bot:
-                            send_whatsapp_message(phone_number, msg)
-                    else:
-                        send_whatsapp_message(phone_number, resposta_bot)
+def set_estatisticas_fila(funcao):
+    """Usado pela app ASGI (assincrono.py): as mensagens passam pela fila assíncrona e é essa que o /metrics exporta."""
+    global _estatisticas_fila
+    _estatisticas_fila = funcao
 
-        except (KeyError, IndexError):
-            pass 
+def processar_lote(phone_number, mensagens):
+    """Processa um lote de um utilizador e envia as respostas juntas, pela mesma ordem; corre nas threads da fila."""
+    with pedido('processar_lote'):
+        respostas = responder_lote(phone_number, mensagens)
+        with cronometro('enviar_respostas'):
+            if len(respostas) == 1:
+                send_whatsapp_message(phone_number, respostas[0])
+            elif respostas:
+                send_whatsapp_messages(phone_number, respostas)
+
+def _partes(objeto, chave):
+    """objeto[chave], se for uma lista; um payload mal formado nesse ponto é registado e ignorado."""
+    partes = objeto.get(chave, []) if isinstance(objeto, dict) else None
+    if not isinstance(partes, list):
+        print(f"⚠️ Webhook: '{chave}' mal formado, ignorado: {objeto!r:.200}")
+        return []
+    return partes
+
+def _mensagens_do_payload(data):
+    """Percorre todas as mensagens de todas as entries/changes, pela ordem em que vieram."""
+    for entry in _partes(data, 'entry'):
+        for change in _partes(entry, 'changes'):
+            yield from _partes(change.get('value', {}) if isinstance(change, dict) else None, 'messages')
+
+def lotes_do_payload(data):
+    """
+    Mensagens de texto novas do payload, por utilizador: {phone_number: [(texto, id), ...]}.
+    Uma mensagem mal formada é registada e ignorada sozinha, sem afetar as outras.
+    """
+    lotes = {}
+    for message_data in _mensagens_do_payload(data):
+        try:
+            if message_data['type'] != 'text':
+                continue
+            message_id = message_data.get('id')
+            phone_number = message_data['from']
+            message_body = message_data['text']['body']
+            if not isinstance(phone_number, str) or not isinstance(message_body, str):
+                raise TypeError("'from' e 'text.body' têm de ser texto")
+        except (KeyError, TypeError, AttributeError) as erro:
+            print(f"⚠️ Webhook: mensagem mal formada ignorada ({erro!r}): {message_data!r:.200}")
+            continue
+
+        # Reenvios da Meta com o mesmo id são descartados antes de qualquer outro trabalho;
+        # só depois de validada, para que uma mensagem mal formada não fique marcada como vista.
+        if message_id and not deduplicador.registrar(message_id):
+            continue
+        lotes.setdefault(phone_number, []).append((message_body, message_id))
+    return lotes
+
+@app.route("/webhook", methods=['GET', 'POST'])
+def webhook():
+    if request.method == 'POST':
+        lotes = lotes_do_payload(request.get_json())
+
+        # Responde 200 de imediato; cada utilizador tem um lote na fila, processado por ordem
+        fila = get_fila(processar_lote)
+        for phone_number, mensagens in lotes.items():
+            fila.enfileirar(phone_number, mensagens)
 
         return make_response("EVENT_RECEIVED", 200)
 
     elif request.method == 'GET':
-        from utils import VERIFY_TOKEN
+        from utilis import VERIFY_TOKEN
         token_sent = request.args.get("hub.verify_token")
         if token_sent == VERIFY_TOKEN:
             challenge = request.args.get("hub.challenge")
@@ -51,8 +182,144 @@ def dashboard_home():
 
 @app.route("/dashboard/<user_id>")
 def dashboard(user_id):
-    dados_dashboard = calcular_dados_dashboard(user_id)
-    return render_template('dashboard.html', **dados_dashboard)
+    chave = (user_id, get_versao_usuario(user_id), datetime.now().strftime('%Y-%m'))
+    etag = f"{chave[1]}-{chave[2]}"
+    if request.if_none_match.contains(etag):
+        resposta = make_response("", 304)
+    else:
+        # Só o HTML: é o que se serve, e é o que passa pelo cache partilhado entre processos.
+        html = _dashboards.get(chave)
+        if html is None:
+            from dashboard_calculations import calcular_dados_dashboard
+            dados_dashboard = calcular_dados_dashboard(user_id)
+            with cronometro('dashboard_render'):
+                html = render_template('dashboard.html', **dados_dashboard)
+            _dashboards.set(chave, html)
+        resposta = make_response(html)
+    # O browser guarda a página mas confirma sempre com If-None-Match
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = 'private, no-cache'
+    return resposta
+
+@app.route("/api/transacoes/<user_id>")
+def api_transacoes(user_id):
+    """
+    Extrato paginado em JSON, gerado aos bocados.
+    Parâmetros: cursor (proximo_cursor da página anterior), limite, mes (AAAA-MM), categoria, metodo.
+    """
+    from extrato import extrato_json, TAMANHO_PAGINA
+    try:
+        limite = int(request.args.get('limite', TAMANHO_PAGINA))
+    except ValueError:
+        return make_response("Parâmetro 'limite' inválido", 400)
+    filtros = {campo: request.args.get(campo) for campo in ('mes', 'categoria', 'metodo')}
+    if filtros['mes'] and not re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", filtros['mes']):
+        return make_response("Parâmetro 'mes' inválido (AAAA-MM)", 400)
+    cursor = request.args.get('cursor')
+
+    def gerar():
+        # O corpo é gerado depois de o pedido terminar, por isso é medido à parte
+        with pedido('api_transacoes_corpo'):
+            yield from extrato_json(user_id, cursor, limite, **filtros)
+    return Response(stream_with_context(gerar()), mimetype='application/json')
+
+@app.route("/api/relatorio/<user_id>")
+def api_relatorio(user_id):
+    """
+    Totais de um período, em JSON (ver relatorios.py).
+    Parâmetros: periodo (AAAA, AAAA-Tn, AAAA-MM ou AAAA-MM-DD) ou inicio e fim (AAAA-MM-DD);
+    serie=1 acrescenta os totais de cada mês.
+    """
+    from relatorios import calcular_relatorio, intervalo_periodo, intervalo_datas
+    try:
+        if request.args.get('inicio') or request.args.get('fim'):
+            inicio, fim = intervalo_datas(request.args.get('inicio', ''), request.args.get('fim', ''))
+        else:
+            inicio, fim = intervalo_periodo(request.args.get('periodo') or datetime.now().strftime('%Y-%m'))
+    except ValueError as erro:
+        return make_response(f"Período inválido: {erro}", 400)
+    return jsonify(calcular_relatorio(user_id, inicio, fim, serie=request.args.get('serie') == '1'))
+
+@app.route("/api/faturas/<user_id>")
+def api_faturas(user_id):
+    """
+    Faturas dos cartões por mês, em JSON (ver faturas.py), do mais recente para o mais antigo.
+    Parâmetros: mes (AAAA-MM, padrão: o atual) e meses (quantos meses até ao indicado, 1 a 60, padrão 12).
+    """
+    from faturas import historico_faturas
+    try:
+        mes = datetime.strptime(request.args.get('mes') or datetime.now().strftime('%Y-%m'), '%Y-%m')
+        meses = int(request.args.get('meses', 12))
+        if not 1 <= meses <= 60:
+            raise ValueError("meses tem de estar entre 1 e 60")
+        faturas = historico_faturas(user_id, mes.year, mes.month, meses)
+    except ValueError as erro:
+        return make_response(f"Parâmetros inválidos: {erro}", 400)
+    return jsonify(faturas)
+
+@app.route("/api/importar/<user_id>", methods=['POST'])
+def api_importar(user_id):
+    """
+    Importa um extrato em CSV ou JSONL (ver importacao.py), enviado como ficheiro ('arquivo')
+    ou no corpo do pedido. Parâmetros: formato (csv ou jsonl), conta ou cartao.
+    Se o ficheiro deixar de poder ser lido depois de já haver linhas gravadas, responde 422
+    com o resumo do que foi importado e o motivo em 'erro'.
+    """
+    from importacao import importar_transacoes, FORMATOS
+    formato = request.args.get('formato', 'csv')
+    if formato not in FORMATOS:
+        return make_response("Parâmetro 'formato' inválido (csv ou jsonl)", 400)
+    arquivo = request.files.get('arquivo')
+    corpo = arquivo.stream if arquivo is not None else request.stream
+    linhas = io.TextIOWrapper(corpo, encoding='utf-8-sig', newline='')
+    resumo = importar_transacoes(user_id, linhas, formato, request.args.get('conta'), request.args.get('cartao'))
+    if 'erro' in resumo:
+        if not resumo['importadas']:
+            return make_response(f"Ficheiro inválido: {resumo['erro']}", 400)
+        # Parte do ficheiro já foi gravada: o resumo diz quanto, porque repetir o pedido duplicaria essas linhas.
+        return jsonify(resumo), 422
+    return jsonify(resumo)
+
+@app.route("/api/exportar/<user_id>")
+def api_exportar(user_id):
+    """Exporta todas as transações em CSV ou JSONL (parâmetro formato), geradas aos bocados."""
+    from importacao import exportar_transacoes, FORMATOS
+    formato = request.args.get('formato', 'csv')
+    if formato not in FORMATOS:
+        return make_response("Parâmetro 'formato' inválido (csv ou jsonl)", 400)
+
+    def gerar():
+        with pedido('api_exportar_corpo'):
+            yield from exportar_transacoes(user_id, formato)
+    mimetype = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+    resposta = Response(stream_with_context(gerar()), mimetype=mimetype)
+    resposta.headers['Content-Disposition'] = f'attachment; filename="transacoes_{user_id}.{formato}"'
+    return resposta
+
+@app.route("/metrics")
+def metrics():
+    # Contadores (_total) separados dos valores instantâneos e das latências.
+    estatisticas = _estatisticas_fila()
+    metricas.definir('lalabank_fila_profundidade', estatisticas['profundidade'])
+    for nome in ('enfileiradas', 'processadas', 'erros'):
+        metricas.definir_contador(f'lalabank_fila_{nome}_total', estatisticas[nome])
+    for estatistica in ('p50', 'p95', 'max'):
+        metricas.definir('lalabank_fila_latencia_ms', estatisticas[f'latencia_{estatistica}_ms'], estatistica=estatistica)
+    for nome, valor in deduplicador.estatisticas().items():
+        metricas.definir_contador('lalabank_deduplicacao_total', valor, resultado=nome)
+    for cache, estatisticas in (('configuracoes', estatisticas_cache()), ('dashboards', _dashboards.estatisticas())):
+        metricas.definir('lalabank_cache_tamanho', estatisticas.pop('tamanho'), cache=cache)
+        for nome, valor in estatisticas.items():
+            metricas.definir_contador('lalabank_cache_total', valor, cache=cache, resultado=nome)
+    return Response(metricas.texto_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route("/queue_stats")
+def queue_stats():
+    return jsonify(get_fila(processar_lote).estatisticas())
+
+@app.route("/dedup_stats")
+def dedup_stats():
+    return jsonify(deduplicador.estatisticas())
 
 @app.route("/check_reminders")
 def check_reminders():
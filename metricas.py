@@ -0,0 +1,219 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+# --- Métricas em memória, expostas em /metrics no formato de texto do Prometheus ---
+# Contadores, valores instantâneos e histogramas, com etiquetas. Usado para saber
+# onde vai o tempo de um pedido: etapas (cronometro), operações e bytes no
+# armazenamento (contar_kv) e latência dos envios para a API do WhatsApp.
+#
+# Cada pedido HTTP e cada lote da fila corre dentro de pedido(nome), que soma as
+# operações no armazenamento feitas pela thread e as regista por pedido.
+#
+# Perfil por amostragem: com LALABANK_PERFIL=1, um pedido com ?perfil=1 é
+# amostrado (pilha da thread a cada milissegundo) e a resposta é o perfil em
+# formato "collapsed stacks", pronto para flamegraph.pl / speedscope.
+
+PERFIL_ATIVO = os.environ.get("LALABANK_PERFIL") == "1"
+
+BALDES_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BALDES_CONTAGEM = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BALDES_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+DESCRICOES = {
+    'lalabank_etapa_segundos': ('histogram', 'Duração de cada etapa do processamento.'),
+    'lalabank_pedido_segundos': ('histogram', 'Duração de cada pedido HTTP ou lote da fila.'),
+    'lalabank_kv_operacoes_total': ('counter', 'Operações no armazenamento.'),
+    'lalabank_kv_bytes_total': ('counter', 'Bytes lidos e gravados no armazenamento.'),
+    'lalabank_kv_operacoes_por_pedido': ('histogram', 'Operações no armazenamento por pedido.'),
+    'lalabank_kv_bytes_por_pedido': ('histogram', 'Bytes no armazenamento por pedido.'),
+    'lalabank_whatsapp_segundos': ('histogram', 'Latência de cada chamada à API do WhatsApp.'),
+    'lalabank_whatsapp_respostas_total': ('counter', 'Respostas da API do WhatsApp por estado.'),
+    'lalabank_fila_profundidade': ('gauge', 'Mensagens à espera na fila.'),
+    'lalabank_fila_enfileiradas_total': ('counter', 'Lotes de mensagens enfileirados.'),
+    'lalabank_fila_processadas_total': ('counter', 'Lotes de mensagens processados (com ou sem erro).'),
+    'lalabank_fila_erros_total': ('counter', 'Lotes de mensagens cujo processamento falhou.'),
+    'lalabank_fila_latencia_ms': ('gauge', 'Tempo na fila até ao fim do processamento, nos últimos lotes.'),
+    'lalabank_deduplicacao_total': ('counter', 'Mensagens vistas pelo deduplicador, por resultado.'),
+    'lalabank_cache_total': ('counter', 'Consultas e descartes dos caches.'),
+    'lalabank_cache_tamanho': ('gauge', 'Itens em cada cache.'),
+}
+BALDES = {
+    'lalabank_kv_operacoes_por_pedido': BALDES_CONTAGEM,
+    'lalabank_kv_bytes_por_pedido': BALDES_BYTES,
+}
+
+_lock = threading.Lock()
+_contadores = {}
+_valores = {}
+_histogramas = {}
+_local = threading.local()
+
+def _chave(nome, etiquetas):
+    return nome, tuple(sorted(etiquetas.items()))
+
+def incrementar(nome, valor=1, **etiquetas):
+    chave = _chave(nome, etiquetas)
+    with _lock:
+        _contadores[chave] = _contadores.get(chave, 0) + valor
+
+def definir(nome, valor, **etiquetas):
+    """Valor instantâneo (gauge), ex.: profundidade da fila no momento da leitura."""
+    with _lock:
+        _valores[_chave(nome, etiquetas)] = valor
+
+def definir_contador(nome, valor, **etiquetas):
+    """Contador mantido por outro objeto (ex.: a fila), exportado com o total atual."""
+    with _lock:
+        _contadores[_chave(nome, etiquetas)] = valor
+
+def observar(nome, valor, **etiquetas):
+    chave = _chave(nome, etiquetas)
+    baldes = BALDES.get(nome, BALDES_SEGUNDOS)
+    with _lock:
+        histograma = _histogramas.get(chave)
+        if histograma is None:
+            histograma = _histogramas[chave] = [[0] * len(baldes), 0.0, 0]
+        for i, limite in enumerate(baldes):
+            if valor <= limite:
+                histograma[0][i] += 1
+        histograma[1] += valor
+        histograma[2] += 1
+
+@contextmanager
+def cronometro(etapa):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        observar('lalabank_etapa_segundos', time.perf_counter() - inicio, etapa=etapa)
+
+def cronometrado(etapa):
+    """Decorador: regista a duração de cada chamada da função como uma etapa."""
+    def decorador(funcao):
+        @wraps(funcao)
+        def envolvida(*args, **kwargs):
+            with cronometro(etapa):
+                return funcao(*args, **kwargs)
+        return envolvida
+    return decorador
+
+# --- Armazenamento por pedido ---
+
+def contar_kv(tipo, num_bytes=0):
+    """Chamado pelos backends em cada leitura/escrita ('leitura' ou 'escrita')."""
+    incrementar('lalabank_kv_operacoes_total', tipo=tipo)
+    if num_bytes:
+        incrementar('lalabank_kv_bytes_total', num_bytes, tipo=tipo)
+    atual = getattr(_local, 'pedido', None)
+    if atual is not None:
+        atual[tipo] += 1
+        atual[f"bytes_{tipo}"] += num_bytes
+
+class ContextoPedido:
+    """Mede a duração de um pedido e as operações no armazenamento feitas pela thread durante ele."""
+
+    def __init__(self, nome):
+        self.nome = nome
+
+    def __enter__(self):
+        self._anterior = getattr(_local, 'pedido', None)
+        self.contagens = _local.pedido = Counter()
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *excecao):
+        observar('lalabank_pedido_segundos', time.perf_counter() - self._inicio, pedido=self.nome)
+        for tipo in ('leitura', 'escrita'):
+            observar('lalabank_kv_operacoes_por_pedido', self.contagens[tipo], pedido=self.nome, tipo=tipo)
+            observar('lalabank_kv_bytes_por_pedido', self.contagens[f"bytes_{tipo}"], pedido=self.nome, tipo=tipo)
+        _local.pedido = self._anterior
+        return False
+
+def pedido(nome):
+    return ContextoPedido(nome)
+
+# --- Exportação ---
+
+def _formatar_etiquetas(etiquetas, extra=()):
+    pares = list(etiquetas) + list(extra)
+    if not pares:
+        return ''
+    def escapar(valor):
+        return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escapar(v)}"' for k, v in pares) + '}'
+
+def texto_prometheus():
+    with _lock:
+        contadores, valores = dict(_contadores), dict(_valores)
+        histogramas = {k: ([*v[0]], v[1], v[2]) for k, v in _histogramas.items()}
+
+    linhas, vistos = [], set()
+
+    def cabecalho(nome, tipo_padrao):
+        if nome not in vistos:
+            vistos.add(nome)
+            tipo, ajuda = DESCRICOES.get(nome, (tipo_padrao, nome))
+            linhas.append(f"# HELP {nome} {ajuda}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+
+    for (nome, etiquetas), valor in sorted(contadores.items()):
+        cabecalho(nome, 'counter')
+        linhas.append(f"{nome}{_formatar_etiquetas(etiquetas)} {valor}")
+    for (nome, etiquetas), valor in sorted(valores.items()):
+        cabecalho(nome, 'gauge')
+        linhas.append(f"{nome}{_formatar_etiquetas(etiquetas)} {valor}")
+    for (nome, etiquetas), (contagens, soma, n) in sorted(histogramas.items()):
+        cabecalho(nome, 'histogram')
+        for limite, contagem in zip(BALDES.get(nome, BALDES_SEGUNDOS), contagens):
+            linhas.append(f"{nome}_bucket{_formatar_etiquetas(etiquetas, [('le', limite)])} {contagem}")
+        linhas.append(f"{nome}_bucket{_formatar_etiquetas(etiquetas, [('le', '+Inf')])} {n}")
+        linhas.append(f"{nome}_sum{_formatar_etiquetas(etiquetas)} {soma}")
+        linhas.append(f"{nome}_count{_formatar_etiquetas(etiquetas)} {n}")
+    return '\n'.join(linhas) + '\n'
+
+def limpar():
+    with _lock:
+        _contadores.clear()
+        _valores.clear()
+        _histogramas.clear()
+
+# --- Perfil por amostragem ---
+
+class AmostradorPerfil:
+    """Regista a pilha de uma thread a intervalos regulares, noutra thread."""
+
+    def __init__(self, thread_id=None, intervalo=0.001):
+        self.thread_id = thread_id or threading.get_ident()
+        self.intervalo = intervalo
+        self.amostras = Counter()
+        self._parar = threading.Event()
+
+    def _amostrar(self):
+        while not self._parar.wait(self.intervalo):
+            frame = sys._current_frames().get(self.thread_id)
+            pilha = []
+            while frame is not None:
+                codigo = frame.f_code
+                pilha.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)})")
+                frame = frame.f_back
+            if pilha:
+                self.amostras[';'.join(reversed(pilha))] += 1
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._amostrar, name="perfil", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *excecao):
+        self._parar.set()
+        self._thread.join()
+        return False
+
+    def relatorio(self):
+        """Pilhas no formato "collapsed" (uma por linha: pilha;...;função contagem)."""
+        return ''.join(f"{pilha} {n}\n" for pilha, n in self.amostras.most_common())
@@ -0,0 +1,122 @@
+import calendar
+from bisect import bisect_left
+from datetime import datetime
+from cache import CacheLRU
+from registos import Transacao
+
+# --- Motor de parcelas ---
+# Cada compra parcelada é reduzida a um intervalo de meses de fatura
+# [inicio, fim], em "índices de mês" (ano * 12 + mês - 1): a primeira fatura
+# é o mês da compra, ou o seguinte se a compra foi feita depois do dia de
+# fecho do cartão. A parcela i cai no mês inicio + i, por isso "que parcela
+# cai no mês M" é uma subtração e a previsão de N meses é O(N) por compra.
+# As compras ficam ordenadas pelo mês da última parcela, o que permite
+# saltar de uma vez todas as que já foram pagas.
+
+DIA_FECHAMENTO_PADRAO = 30
+
+def indice_mes(data):
+    return data.year * 12 + data.month - 1
+
+def indice_fatura(data, dia_fechamento):
+    """Mês da fatura (índice) de uma compra no crédito: o da compra, ou o seguinte se foi depois do fecho."""
+    return indice_mes(data) + (0 if data.day <= dia_fechamento else 1)
+
+def somar_meses(data, meses):
+    """Equivalente a data + relativedelta(months=meses): o dia é limitado ao fim do mês."""
+    ano, mes = divmod(data.month - 1 + meses, 12)
+    ano += data.year
+    dia = min(data.day, calendar.monthrange(ano, mes + 1)[1])
+    return data.replace(year=ano, month=mes + 1, day=dia)
+
+def nome_mes(indice):
+    ano, mes = divmod(indice, 12)
+    return datetime(ano, mes + 1, 1).strftime('%b/%y')
+
+
+class PlanoParcelas:
+    """compras_parceladas: registos CompraParcelada (registos.py), como devolve get_compras_parceladas_db."""
+
+    def __init__(self, compras_parceladas, regras_cartoes):
+        entradas = []
+        for ordem, compra in enumerate(compras_parceladas):
+            num_parcelas = compra.num_parcelas
+            if num_parcelas <= 0:
+                continue
+            data_inicio = compra.inicio
+            dia_fechamento = regras_cartoes.get(compra.cartao or "", DIA_FECHAMENTO_PADRAO)
+            inicio = indice_fatura(data_inicio, dia_fechamento)
+            fim = inicio + num_parcelas - 1
+            entradas.append((fim, ordem, inicio, compra.valor_total / num_parcelas, data_inicio, compra))
+        entradas.sort(key=lambda e: (e[0], e[1]))
+        self._entradas = entradas
+        self._fins = [e[0] for e in entradas]
+
+    def _ativas(self, indice):
+        """Compras com alguma parcela a partir do mês indicado (as já pagas são saltadas)."""
+        return self._entradas[bisect_left(self._fins, indice):]
+
+    @staticmethod
+    def _parcela(compra, i, valor_parcela, data_inicio):
+        return Transacao(
+            "despesa", f"{compra.descricao} ({i+1}/{compra.num_parcelas})", valor_parcela,
+            compra.categoria, "crédito", compra.cartao, None, somar_meses(data_inicio, i).isoformat(),
+            is_deletable=False
+        )
+
+    def parcelas_do_mes(self, ano, mes):
+        """Gera transações virtuais para as parcelas cuja fatura cai no mês indicado."""
+        indice = ano * 12 + mes - 1
+        encontradas = []
+        for fim, ordem, inicio, valor_parcela, data_inicio, compra in self._ativas(indice):
+            if inicio <= indice:
+                encontradas.append((ordem, self._parcela(compra, indice - inicio, valor_parcela, data_inicio)))
+        encontradas.sort(key=lambda e: e[0])
+        return [p for _, p in encontradas]
+
+    def parcelas_no_intervalo(self, inicio, fim):
+        """
+        Parcelas com data (timestamp) em [inicio, fim), strings ISO, pela ordem das compras.
+        Ao contrário de parcelas_do_mes, conta a data da parcela e não o mês da fatura.
+        """
+        primeiro, ultimo = indice_mes(datetime.fromisoformat(inicio)), indice_mes(datetime.fromisoformat(fim))
+        encontradas = []
+        # A fatura de uma parcela nunca é anterior à sua data, por isso _ativas não salta nenhuma.
+        for _, ordem, _, valor_parcela, data_inicio, compra in self._ativas(primeiro):
+            base = indice_mes(data_inicio)
+            for i in range(max(0, primeiro - base), min(compra.num_parcelas - 1, ultimo - base) + 1):
+                parcela = self._parcela(compra, i, valor_parcela, data_inicio)
+                if inicio <= parcela.timestamp < fim:
+                    encontradas.append((ordem, parcela))
+        encontradas.sort(key=lambda e: e[0])
+        return [p for _, p in encontradas]
+
+    def previsao_faturas(self, cartoes, ano, mes, meses=12):
+        """Soma das parcelas por cartão para os próximos `meses` meses a partir do indicado."""
+        primeiro = ano * 12 + mes - 1
+        ultimo = primeiro + meses - 1
+        nomes = [nome_mes(primeiro + k) for k in range(meses)]
+        previsao = {cartao: [0] * meses for cartao in cartoes}
+
+        for fim, _, inicio, valor_parcela, _, compra in self._ativas(primeiro):
+            linha = previsao.get(compra.cartao)
+            if linha is None or inicio > ultimo:
+                continue  # Cartão que já não está na lista de cartões, ou compra que ainda não começou.
+            for indice in range(max(inicio, primeiro), min(fim, ultimo) + 1):
+                linha[indice - primeiro] += valor_parcela
+
+        return {cartao: dict(zip(nomes, valores)) for cartao, valores in previsao.items()}, nomes
+
+
+# As compras parceladas só são acrescentadas, por isso o número de compras mais
+# as regras dos cartões identificam um plano já construído.
+_planos = CacheLRU(capacidade=1024, ttl=3600)
+
+def get_plano_parcelas(user_id, compras_parceladas, regras_cartoes):
+    assinatura = (len(compras_parceladas), tuple(sorted(regras_cartoes.items())))
+    guardado = _planos.get(user_id)
+    if guardado is not None and guardado[0] == assinatura:
+        return guardado[1]
+    plano = PlanoParcelas(compras_parceladas, regras_cartoes)
+    _planos.set(user_id, (assinatura, plano))
+    return plano
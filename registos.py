@@ -0,0 +1,143 @@
+from datetime import datetime
+
+# --- Registos em memória ---
+# Transações, compras parceladas e lembretes são guardados como dicionários
+# JSON, mas em memória passam a objetos com __slots__: sem o dicionário por
+# instância, cada registo ocupa uma fração do espaço. Os campos com poucos
+# valores distintos (tipo, método, categoria, conta, cartão) são internados,
+# por isso milhares de transações partilham as mesmas strings em vez de cada
+# uma ter a sua cópia vinda do json.loads.
+#
+# Os timestamps continuam em ISO: comparados como strings ficam por ordem
+# cronológica, e são a chave das remoções e do cursor do extrato. Só a data de
+# início das compras parceladas é convertida para datetime, uma vez, aqui.
+#
+# get(campo, padrao) e registo[campo] existem para o código e o template que
+# também leem dicionários (agregados.somar_transacao, templates/dashboard.html).
+#
+# Chaves guardadas que não são campos do registo (escritas por código mais
+# antigo ou mais recente) ficam em `extras` e voltam a ser gravadas por
+# para_dict, por isso ler e regravar um registo não as perde.
+
+# Strings partilhadas dos campos com poucos valores distintos. Os nomes de
+# categorias, contas e cartões são dos utilizadores, por isso a tabela é
+# esvaziada quando chega a LIMITE_PARTILHADOS: um worker de longa duração não
+# guarda todos os nomes que já leu. Os registos já criados continuam a
+# partilhar as suas strings.
+LIMITE_PARTILHADOS = 4096
+_partilhados = {}
+
+def _internar(valor):
+    partilhado = _partilhados.get(valor)
+    if partilhado is None:
+        if valor is None:
+            return None
+        if len(_partilhados) >= LIMITE_PARTILHADOS:
+            _partilhados.clear()
+        partilhado = _partilhados[valor] = valor
+    return partilhado
+
+def como_dict(item):
+    """Formato de armazenamento de um registo (os dicionários passam sem alteração)."""
+    return item.para_dict() if isinstance(item, Registo) else item
+
+
+class Registo:
+    # extras só é atribuído por de_dict, quando o dicionário tem chaves desconhecidas.
+    __slots__ = ('extras',)
+    CAMPOS = ()
+    # Chaves que de_dict não guarda em extras: os campos e o que só existe em memória.
+    CONHECIDAS = frozenset()
+
+    def get(self, campo, padrao=None):
+        """Como dict.get: campos em falta ou a None devolvem o padrão."""
+        valor = getattr(self, campo, None)
+        return padrao if valor is None else valor
+
+    def __getitem__(self, campo):
+        try:
+            return getattr(self, campo)
+        except AttributeError:
+            raise KeyError(campo) from None
+
+    def para_dict(self):
+        dados = {campo: getattr(self, campo) for campo in self.CAMPOS}
+        extras = getattr(self, 'extras', None)
+        if extras:
+            dados.update(extras)
+        return dados
+
+    def _guardar_extras(self, d):
+        if d.keys() - self.CONHECIDAS:
+            self.extras = {chave: valor for chave, valor in d.items() if chave not in self.CONHECIDAS}
+        return self
+
+    def __eq__(self, outro):
+        if type(outro) is not type(self):
+            return NotImplemented
+        return (all(getattr(self, c) == getattr(outro, c) for c in self.__slots__)
+                and getattr(self, 'extras', None) == getattr(outro, 'extras', None))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{c}={getattr(self, c)!r}' for c in self.CAMPOS)})"
+
+
+class Transacao(Registo):
+    __slots__ = ('tipo', 'descricao', 'valor', 'categoria', 'metodo', 'cartao', 'conta', 'timestamp', 'is_deletable')
+    CAMPOS = __slots__[:-1]
+    CONHECIDAS = frozenset(__slots__)
+
+    def __init__(self, tipo, descricao, valor, categoria=None, metodo=None, cartao=None, conta=None,
+                 timestamp=None, is_deletable=True):
+        self.tipo = _internar(tipo)
+        self.descricao = descricao
+        self.valor = valor
+        self.categoria = _internar(categoria)
+        self.metodo = _internar(metodo)
+        self.cartao = _internar(cartao)
+        self.conta = _internar(conta)
+        self.timestamp = timestamp
+        # As parcelas do mês são transações virtuais e não podem ser apagadas.
+        self.is_deletable = is_deletable
+
+    @classmethod
+    def de_dict(cls, d, is_deletable=True):
+        g = d.get
+        return cls(g('tipo'), g('descricao'), g('valor'), g('categoria'), g('metodo'), g('cartao'), g('conta'),
+                   g('timestamp'), is_deletable)._guardar_extras(d)
+
+
+class CompraParcelada(Registo):
+    __slots__ = ('descricao', 'valor_total', 'num_parcelas', 'cartao', 'categoria', 'data_inicio', 'inicio')
+    CAMPOS = __slots__[:-1]
+    CONHECIDAS = frozenset(CAMPOS)
+
+    def __init__(self, descricao, valor_total, num_parcelas, cartao, categoria, data_inicio):
+        self.descricao = descricao
+        self.valor_total = valor_total
+        self.num_parcelas = num_parcelas
+        self.cartao = _internar(cartao)
+        self.categoria = _internar(categoria)
+        self.data_inicio = data_inicio
+        self.inicio = datetime.fromisoformat(data_inicio)
+
+    @classmethod
+    def de_dict(cls, d):
+        return cls(d['descricao'], d['valor_total'], d['num_parcelas'], d.get('cartao'), d.get('categoria'),
+                   d['data_inicio'])._guardar_extras(d)
+
+
+class Lembrete(Registo):
+    __slots__ = ('descricao', 'valor', 'dia_vencimento', 'timestamp')
+    CAMPOS = __slots__
+    CONHECIDAS = frozenset(CAMPOS)
+
+    def __init__(self, descricao, valor, dia_vencimento, timestamp=None):
+        self.descricao = descricao
+        self.valor = valor
+        self.dia_vencimento = dia_vencimento
+        self.timestamp = timestamp
+
+    @classmethod
+    def de_dict(cls, d):
+        return cls(d['descricao'], d['valor'], d['dia_vencimento'], d.get('timestamp'))._guardar_extras(d)
@@ -0,0 +1,100 @@
+import re
+from datetime import date, timedelta
+from agregados import agregado_do_intervalo, agregados_por_mes, somar_transacao
+from database import get_compras_parceladas_db, get_regras_cartoes_db, get_contas_conhecidas
+from dashboard_calculations import _calcular_saldos_por_conta, _calcular_gastos_por_categoria
+from parcelas import get_plano_parcelas, nome_mes
+from metricas import cronometrado
+
+# --- Relatórios por período ---
+# Totais por categoria, conta e cartão para qualquer intervalo de datas (mês,
+# trimestre, ano ou datas à escolha), calculados a partir dos agregados
+# diários, mensais e anuais de agregados.py: um relatório anual é uma leitura,
+# um trimestre são três, e só os meses incompletos leem os agregados diários.
+#
+# As parcelas das compras parceladas não estão nos agregados: são somadas pela
+# data de cada parcela (PlanoParcelas.parcelas_no_intervalo). O dashboard, pelo
+# contrário, mostra as parcelas pelo mês da fatura.
+
+# Anos aceites nos intervalos; fora deles as contas com datas (ex.: o dia a
+# seguir a 31/12/9999) falhariam.
+ANO_MINIMO, ANO_MAXIMO = 1900, 2100
+
+def _verificar_anos(inicio, fim):
+    if inicio.year < ANO_MINIMO or fim.year > ANO_MAXIMO:
+        raise ValueError(f"só são aceites anos entre {ANO_MINIMO} e {ANO_MAXIMO}")
+    return inicio, fim
+
+def intervalo_periodo(periodo):
+    """'AAAA', 'AAAA-Tn' (trimestre), 'AAAA-MM' ou 'AAAA-MM-DD' -> (inicio, fim), datas inclusive."""
+    if re.fullmatch(r"\d{4}", periodo):
+        ano = int(periodo)
+        return _verificar_anos(date(ano, 1, 1), date(ano, 12, 31))
+    trimestre = re.fullmatch(r"(\d{4})-[TtQq]([1-4])", periodo)
+    if trimestre:
+        ano, numero = int(trimestre.group(1)), int(trimestre.group(2))
+        inicio = date(ano, 3 * numero - 2, 1)
+        return _verificar_anos(inicio, _fim_do_mes(date(ano, 3 * numero, 1)))
+    if re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", periodo):
+        inicio = date.fromisoformat(periodo + "-01")
+        return _verificar_anos(inicio, _fim_do_mes(inicio))
+    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", periodo):
+        dia = date.fromisoformat(periodo)
+        return _verificar_anos(dia, dia)
+    raise ValueError(f"use AAAA, AAAA-Tn, AAAA-MM ou AAAA-MM-DD, não {periodo!r}")
+
+def intervalo_datas(inicio, fim):
+    """Datas 'AAAA-MM-DD' (inclusive) -> (inicio, fim)."""
+    inicio, fim = date.fromisoformat(inicio), date.fromisoformat(fim)
+    if fim < inicio:
+        raise ValueError("o fim é anterior ao início")
+    return _verificar_anos(inicio, fim)
+
+def _fim_do_mes(d):
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+def _parcelas(user_id, inicio, fim):
+    plano = get_plano_parcelas(user_id, get_compras_parceladas_db(user_id), get_regras_cartoes_db(user_id))
+    return plano.parcelas_no_intervalo(inicio.isoformat(), (fim + timedelta(days=1)).isoformat())
+
+def _serie_mensal(user_id, inicio, fim, parcelas):
+    por_mes = agregados_por_mes(user_id, inicio, fim)
+    for p in parcelas:
+        somar_transacao(por_mes[p.timestamp[:7]], p)
+    serie = []
+    for mes, agregado in por_mes.items():
+        ano, numero = (int(x) for x in mes.split('-'))
+        serie.append({
+            'mes': mes, 'nome': nome_mes(ano * 12 + numero - 1), 'receitas': agregado['receitas'],
+            'despesas': agregado['despesas'], 'balanco': agregado['receitas'] - agregado['despesas'],
+            'categorias': agregado['categorias']
+        })
+    return serie
+
+@cronometrado('relatorio')
+def calcular_relatorio(user_id, inicio, fim, serie=False):
+    """
+    Relatório das transações e parcelas com data em [inicio, fim] (datas, inclusive).
+    Com serie=True inclui os totais de cada mês do intervalo em 'meses'.
+    """
+    agregado = agregado_do_intervalo(user_id, inicio, fim)
+    num_lancamentos = agregado['n']  # antes de somar as parcelas, que têm contagem própria
+    parcelas = _parcelas(user_id, inicio, fim)
+    for p in parcelas:
+        somar_transacao(agregado, p)
+    contas_conhecidas = get_contas_conhecidas(user_id)
+
+    relatorio = {
+        'user_id': user_id, 'inicio': inicio.isoformat(), 'fim': fim.isoformat(),
+        'num_lancamentos': num_lancamentos, 'num_parcelas': len(parcelas),
+        'total_receitas': agregado['receitas'], 'total_despesas': agregado['despesas'],
+        'balanco': agregado['receitas'] - agregado['despesas'],
+        'total_gastos_debito': agregado['despesas_metodo'].get('débito', 0),
+        'total_gastos_credito': agregado['despesas_metodo'].get('crédito', 0),
+        'gastos_por_categoria': _calcular_gastos_por_categoria(agregado['categorias_metodo']),
+        'saldos_por_conta': _calcular_saldos_por_conta(agregado, contas_conhecidas),
+        'faturas': dict(agregado['cartoes']),
+    }
+    if serie:
+        relatorio['meses'] = _serie_mensal(user_id, inicio, fim, parcelas)
+    return relatorio
@@ -0,0 +1,111 @@
+import importlib.util
+import multiprocessing
+import os
+import sys
+import threading
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    sys.exit("O servidor.py precisa do gunicorn (e do uvicorn com LALABANK_ASGI=1): pip install -r requirements.txt")
+
+# --- Servidor de produção ---
+# Corre a app do main.py no gunicorn, com vários processos (pre-fork), cada um
+# com várias threads, em vez do servidor de desenvolvimento do Flask (app.run):
+# um envio lento para a Graph API ou um dashboard pesado deixam de atrasar os
+# outros pedidos.
+#
+# Configuração por variáveis de ambiente:
+#   LALABANK_WORKERS      processos (padrão: número de CPUs)
+#   LALABANK_THREADS      threads por processo (padrão 8); os pedidos passam a
+#                         maior parte do tempo à espera do armazenamento ou da rede
+#   LALABANK_PORTA        porta (padrão 8080)
+#   LALABANK_TIMEOUT      segundos sem resposta até o worker ser reiniciado (padrão 60)
+#   LALABANK_MAX_PEDIDOS  pedidos até o worker ser reciclado (padrão 0: nunca)
+#   LALABANK_ASGI=1       workers do uvicorn com a app ASGI (assincrono.py) em vez
+#                         das threads do gthread: os envios à Graph API correm
+#                         em asyncio; o processamento das mensagens e as
+#                         restantes rotas continuam síncronos, em threads
+#
+# Com mais de um worker:
+#   - os caches de configurações e dashboards passam a ser partilhados
+#     (LALABANK_CACHE=sqlite, ver cache.py), se não for indicado outro;
+#   - o armazenamento deve ser o SQLite (LALABANK_ARMAZENAMENTO=sqlite): no KV
+#     do Replit os bloqueios por utilizador só valem dentro de cada processo.
+#
+# Escalar sem parar o serviço, com sinais ao processo principal do gunicorn:
+#   kill -TTIN <pid>   mais um worker
+#   kill -TTOU <pid>   menos um worker
+#   kill -HUP <pid>    workers novos (com o código e a configuração atuais) no
+#                      lugar dos antigos, que terminam os pedidos em curso
+# Um worker que termina espera primeiro que a sua fila de mensagens
+# (fila.py, ou a fila assíncrona no fim do lifespan do ASGI) fique vazia, até
+# GRACEFUL_TIMEOUT segundos. Um worker novo começa logo a aceitar pedidos e
+# compila os templates numa thread à parte.
+#
+# Uso: python servidor.py   (dependências em requirements.txt)
+
+GRACEFUL_TIMEOUT = 30
+
+def _worker_exit(servidor, worker):
+    from fila import esvaziar_fila
+    esvaziar_fila()
+
+def _post_worker_init(worker):
+    from main import precompilar_templates
+    threading.Thread(target=precompilar_templates, name="precompilar-templates", daemon=True).start()
+
+def assincrono():
+    return os.environ.get("LALABANK_ASGI") == "1"
+
+def opcoes():
+    workers = int(os.environ.get("LALABANK_WORKERS", multiprocessing.cpu_count()))
+    max_pedidos = int(os.environ.get("LALABANK_MAX_PEDIDOS", 0))
+    return {
+        'bind': f"0.0.0.0:{os.environ.get('LALABANK_PORTA', 8080)}",
+        'workers': workers,
+        'worker_class': 'uvicorn.workers.UvicornWorker' if assincrono() else 'gthread',
+        'threads': int(os.environ.get("LALABANK_THREADS", 8)),
+        'timeout': int(os.environ.get("LALABANK_TIMEOUT", 60)),
+        'graceful_timeout': GRACEFUL_TIMEOUT,
+        'max_requests': max_pedidos,
+        # Variação aleatória, para que os workers não sejam reciclados todos ao mesmo tempo
+        'max_requests_jitter': max_pedidos // 10,
+        'post_worker_init': _post_worker_init,
+        'worker_exit': _worker_exit,
+    }
+
+
+class Servidor(BaseApplication):
+    def __init__(self, opcoes):
+        self.opcoes = opcoes
+        super().__init__()
+
+    def load_config(self):
+        for nome, valor in self.opcoes.items():
+            self.cfg.set(nome, valor)
+
+    def load(self):
+        # Importado em cada worker, depois do fork: conexões, threads e caches não são partilhados por engano.
+        if assincrono():
+            from assincrono import app
+        else:
+            from main import app
+        return app
+
+
+def main():
+    if assincrono():
+        em_falta = [modulo for modulo in ('uvicorn', 'aiohttp') if importlib.util.find_spec(modulo) is None]
+        if em_falta:
+            sys.exit(f"LALABANK_ASGI=1 precisa de {', '.join(em_falta)}: pip install -r requirements.txt")
+    configuracao = opcoes()
+    if configuracao['workers'] > 1:
+        os.environ.setdefault("LALABANK_CACHE", "sqlite")
+        if os.environ.get("LALABANK_ARMAZENAMENTO", "replit") != "sqlite":
+            print("⚠️ Vários workers sobre o KV do Replit: as escritas simultâneas do mesmo "
+                  "utilizador em workers diferentes não são atómicas. Use LALABANK_ARMAZENAMENTO=sqlite.")
+    Servidor(configuracao).run()
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,19 @@
 import re
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
 import os
-import requests
-from replit import db
 
 from database import (
     get_user_data, set_user_data,
     salvar_transacao_db, salvar_compra_parcelada_db,
-    get_categorias, get_contas_conhecidas, get_cartoes_conhecidos,
-    salvar_lembrete_db, get_lembretes_db, adicionar_conta_db
+    get_categorias, get_contas_conhecidas, get_cartoes_conhecidos, get_versao_configuracao,
+    salvar_lembrete_db, adicionar_conta_db
 )
+from categorizador import ClassificadorPalavras, get_classificador
+from analisador import get_analisador, analisar_transacao, CATEGORIAS_RECEITA, CATEGORIAS_SO_RECEITA
+from whatsapp import get_cliente
+from registos import Transacao, CompraParcelada, Lembrete
+from agenda_lembretes import executar_agenda
+from metricas import cronometrado
 
 VERIFY_TOKEN = "teste"
 ACCESS_TOKEN = os.environ.get("ACCESS_TOKEN")
@@ -20,27 +23,19 @@ def send_whatsapp_message(phone_number, message):
     """
     Função para enviar uma mensagem de texto simples de volta para o utilizador.
     """
-    url = f"https://graph.facebook.com/v18.0/{PHONE_NUMBER_ID}/messages"
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    data = {"messaging_product": "whatsapp", "to": phone_number, "text": {"body": message}}
-
     print(f"Tentando enviar para {phone_number}: '{message}'")
-    try:
-        response = requests.post(url, json=data, headers=headers)
-        response.raise_for_status()
-        print(f"Resposta da API da Meta ao enviar: {response.status_code}")
-        # print(response.json()) # Descomente para depuração detalhada
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Erro ao enviar mensagem: {e}")
-        print(f"Resposta recebida: {e.response.text if e.response else 'Nenhuma resposta'}")
+    get_cliente().enviar(phone_number, message)
+    return None
 
+def send_whatsapp_messages(phone_number, messages):
+    """Envia uma resposta em várias partes, pela ordem, pela mesma conexão."""
+    print(f"Tentando enviar {len(messages)} mensagens para {phone_number}")
+    get_cliente().enviar_varias(phone_number, messages)
     return None
 
 # --- Funções de Processamento de Mensagens ---
 
+@cronometrado('processar_mensagem')
 def processar_mensagem(user_id, texto):
     """
     Função principal que decide o que fazer com a mensagem do utilizador.
@@ -90,11 +85,7 @@ def processar_comando_lembrete(user_id, texto):
         if not (1 <= dia_vencimento <= 31):
             return "❌ O dia do vencimento deve ser um número entre 1 e 31."
 
-        lembrete_data = {
-            "descricao": descricao, "valor": valor, 
-            "dia_vencimento": dia_vencimento, "timestamp": datetime.now().isoformat()
-        }
-        salvar_lembrete_db(user_id, lembrete_data)
+        salvar_lembrete_db(user_id, Lembrete(descricao, valor, dia_vencimento, datetime.now().isoformat()))
         return f"✅ Lembrete registado: '{descricao}' no valor de R$ {valor:.2f}, com vencimento todo dia {dia_vencimento}."
     except (ValueError, KeyError, IndexError):
         return "❌ Formato do lembrete inválido. Por favor, use o modelo exato que eu enviei."
@@ -174,12 +165,8 @@ def processar_compra_parcelada(user_id, texto):
         valor_parcela = valor_total / num_parcelas
         categoria = categorizar_transacao(descricao, 'despesa', user_id)
 
-        compra_data = {
-            "descricao": descricao, "valor_total": valor_total,
-            "num_parcelas": num_parcelas, "cartao": cartao,
-            "categoria": categoria, "data_inicio": datetime.now().isoformat()
-        }
-        salvar_compra_parcelada_db(user_id, compra_data)
+        compra = CompraParcelada(descricao, valor_total, num_parcelas, cartao, categoria, datetime.now().isoformat())
+        salvar_compra_parcelada_db(user_id, compra)
 
         return (f"✅ Compra parcelada registada: '{descricao}'\n"
                 f"Valor: R$ {valor_total:.2f} em {num_parcelas}x de R$ {valor_parcela:.2f}\n"
@@ -190,7 +177,7 @@ def processar_compra_parcelada(user_id, texto):
 
 def processar_transacao_normal(user_id, texto):
     """Processa uma mensagem de transação normal (receita ou despesa)."""
-    tipo, valor, descricao_original, metodo, cartao, conta = extrair_dados_transacao_normal(user_id, texto)
+    tipo, valor, descricao_original, metodo, cartao, conta, categoria = extrair_dados_transacao_normal(user_id, texto)
 
     if valor is None:
         # CORREÇÃO DO BUG: Verifica se o valor foi encontrado antes de prosseguir
@@ -199,122 +186,54 @@ def processar_transacao_normal(user_id, texto):
             return "Não entendi sua mensagem. Para registar, diga algo como 'Gastei 10 reais com pão'."
         return "Não consegui identificar um valor na sua mensagem. Tente novamente."
 
-    categoria = categorizar_transacao(descricao_original, tipo, user_id)
-
     # Lógica para perguntar sobre contas/categorias desconhecidas...
     if tipo == 'receita' and conta is None:
         # Lógica para perguntar sobre nova conta
         pass # Implementação futura
 
-    transacao_data = {
-        "tipo": tipo, "descricao": descricao_original, "valor": valor,
-        "categoria": categoria, "metodo": metodo, "cartao": cartao,
-        "conta": conta, "timestamp": datetime.now().isoformat()
-    }
-    salvar_transacao_db(user_id, transacao_data)
+    transacao = Transacao(tipo, descricao_original, valor, categoria, metodo, cartao, conta, datetime.now().isoformat())
+    salvar_transacao_db(user_id, transacao)
 
     if tipo == 'despesa':
         return f"✅ Despesa registada: '{descricao_original}' (R$ {valor:.2f})."
     elif tipo == 'receita':
         return f"✅ Receita registada: '{descricao_original}' (R$ {valor:.2f})."
 
+@cronometrado('extrair_dados_transacao')
 def extrair_dados_transacao_normal(user_id, texto):
-    tipo, valor, metodo, cartao, conta = 'desconhecido', None, 'outro', None, None
-    texto_lower = texto.lower()
-
-    palavras_despesa = ['comprei', 'gastei', 'paguei']
-    palavras_receita = ['recebi', 'ganhei', 'salário']
+    """Tipo, valor, método, cartão, conta e categoria da mensagem, numa só passagem (ver analisador.py)."""
+    def carregar():
+        contas = get_contas_conhecidas(user_id)
+        return get_categorias(user_id), contas.get('contas', []), contas.get('cartoes', [])
+    analisador = get_analisador(user_id, get_versao_configuracao(user_id), carregar)
+    tipo, valor, metodo, cartao, conta, categoria = analisar_transacao(texto, analisador)
+    return tipo, valor, texto, metodo, cartao, conta, categoria
 
-    if any(p in texto_lower for p in palavras_despesa): tipo = 'despesa'
-    elif any(p in texto_lower for p in palavras_receita): tipo = 'receita'
-
-    # Expressão regular mais robusta para encontrar valores monetários
-    match_valor = re.search(r'[\d,.]+', texto)
-    if match_valor and match_valor.group(0) not in ['.', ',']:
-        try:
-            valor = float(match_valor.group(0).replace(',', '.'))
-        except ValueError:
-            valor = None # Se a conversão falhar, o valor continua nulo
-
-    if tipo == 'receita':
-        metodo = 'débito'
-        contas = get_contas_conhecidas(user_id).get('contas', [])
-        for c in contas:
-            if c.lower() in texto_lower:
-                conta = c
-                break
-    elif tipo == 'despesa':
-        if 'crédito' in texto_lower or 'cartao' in texto_lower or 'cartão' in texto_lower:
-            metodo = 'crédito'
-            cartoes = get_cartoes_conhecidos(user_id)
-            for c in cartoes:
-                if c.lower() in texto_lower:
-                    cartao = c
-                    break
-        elif 'débito' in texto_lower or 'pix' in texto_lower or 'swile' in texto_lower:
-            metodo = 'débito'
-            contas = get_contas_conhecidas(user_id).get('contas', [])
-            for c in contas:
-                if c.lower() in texto_lower:
-                    conta = c
-                    break
-
-    if categorizar_transacao(texto, 'despesa', user_id) == 'Pagamentos': metodo = 'débito'
-    return tipo, valor, texto, metodo, cartao, conta
+_classificador_receitas = ClassificadorPalavras(CATEGORIAS_RECEITA)
 
+@cronometrado('categorizar_transacao')
 def categorizar_transacao(descricao, tipo, user_id):
     """Categoriza uma transação com base no tipo (receita ou despesa)."""
-    categorias = get_categorias(user_id)
     descricao_lower = descricao.lower()
 
-    # Define categorias específicas para receitas
-    categorias_receita = {
-        'Salário': ['salário'],
-        'Outras Receitas': ['recebi', 'ganhei', 'investimentos']
-    }
-
     if tipo == 'receita':
-        for categoria, palavras in categorias_receita.items():
-            if any(palavra in descricao_lower for palavra in palavras):
-                return categoria
-        return 'Outras Receitas' # Padrão para receitas não categorizadas
+        return _classificador_receitas.classificar(descricao_lower) or 'Outras Receitas' # Padrão para receitas não categorizadas
 
     elif tipo == 'despesa':
-        for categoria, palavras in categorias.items():
-            if categoria not in ['Salário', 'Outras Receitas']:
-                if any(palavra in descricao_lower for palavra in palavras):
-                    return categoria
+        # O classificador é compilado uma vez por conjunto de categorias e mantém a prioridade pela ordem
+        classificador = get_classificador(
+            user_id, get_versao_configuracao(user_id), lambda: get_categorias(user_id), ignorar=CATEGORIAS_SO_RECEITA
+        )
+        categoria = classificador.classificar(descricao_lower)
+        if categoria:
+            return categoria
     return 'Outros'
 
+@cronometrado('verificar_lembretes')
 def verificar_e_enviar_lembretes():
     """
-    Verifica todos os lembretes de todos os utilizadores e envia notificações
-    para aqueles que estão próximos do vencimento.
+    Envia as notificações dos lembretes que vencem daqui a 2 dias.
+    Só lê os lembretes agendados para hoje (ver agenda_lembretes.py).
     """
-    hoje = datetime.now()
-    chaves_lembretes = db.prefix("lembretes_") 
-
-    for chave in chaves_lembretes:
-        user_id = chave.split("_")[-1]
-        lembretes = get_lembretes_db(user_id)
-
-        for lembrete in lembretes:
-            dia_vencimento = lembrete.get('dia_vencimento')
-
-            # Lógica para avisar 2 dias antes
-            dia_para_avisar = dia_vencimento - 2
-            if dia_para_avisar <= 0:
-                data_vencimento_mes_atual = datetime(hoje.year, hoje.month, dia_vencimento)
-                data_aviso = data_vencimento_mes_atual - relativedelta(days=2)
-                dia_para_avisar = data_aviso.day
-
-            if hoje.day == dia_para_avisar:
-                mensagem = (
-                    f"🔔 Lembrete de Pagamento!\n\n"
-                    f"Conta: {lembrete['descricao']}\n"
-                    f"Valor: R$ {lembrete['valor']:.2f}\n"
-                    f"Vence no dia: {dia_vencimento}"
-                )
-                send_whatsapp_message(user_id, mensagem)
-                print(f"Enviando lembrete para {user_id} sobre '{lembrete['descricao']}'")
+    return executar_agenda(get_cliente().enviar)
 
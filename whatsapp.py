@@ -0,0 +1,239 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metricas import observar, incrementar
+
+# --- Cliente de envio para a API do WhatsApp (Graph API) ---
+# Uma única sessão HTTP com pool de conexões keep-alive, timeouts, novas
+# tentativas com backoff exponencial para 429/5xx (respeitando Retry-After)
+# e envio concorrente entre números diferentes. As mensagens para o mesmo
+# número são enviadas uma de cada vez, pela ordem, por isso as respostas em
+# várias partes chegam na ordem certa.
+#
+# O requests só é importado quando o cliente é criado (no primeiro envio):
+# custa mais do que o resto da app e o arranque não precisa dele.
+#
+# ClienteWhatsAppAssincrono faz o mesmo em asyncio (aiohttp), para a app ASGI
+# (assincrono.py): um envio à espera da Meta não ocupa uma thread, por isso o
+# limite de envios em curso é só o de conexões. O aiohttp e o asyncio também
+# só são importados quando é usado.
+#
+# Configuração por variáveis de ambiente:
+#   WHATSAPP_API_URL        (padrão https://graph.facebook.com/v18.0; ex.: o servidor falso dos benchmarks)
+#   WHATSAPP_TIMEOUT        segundos de leitura (padrão 10)
+#   WHATSAPP_TENTATIVAS     tentativas por mensagem (padrão 4)
+#   WHATSAPP_CONCORRENCIA   envios simultâneos para números diferentes (padrão 8)
+#   WHATSAPP_CONCORRENCIA_ASSINCRONA  conexões simultâneas do cliente assíncrono (padrão 256)
+
+STATUS_REPETIR = {429, 500, 502, 503, 504}
+
+# Travas de envio por número, repartidas por phone_number (como as travas do
+# armazenamento.py), nos dois clientes: a memória não cresce com o número de
+# destinatários.
+NUM_TRAVAS_NUMEROS = 64
+
+class _ClienteBase:
+    def __init__(self, access_token, phone_number_id, url_base, timeout, tentativas, backoff, backoff_maximo):
+        self.url = f"{url_base.rstrip('/')}/{phone_number_id}/messages"
+        self.headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+        self.timeout = (3.05, timeout)
+        self.tentativas = tentativas
+        self.backoff = backoff
+        self.backoff_maximo = backoff_maximo
+
+    def _espera(self, tentativa, response):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_maximo)
+        return min(self.backoff * (2 ** tentativa), self.backoff_maximo) * random.uniform(0.5, 1)
+
+    @staticmethod
+    def _corpo(phone_number, message):
+        return {"messaging_product": "whatsapp", "to": phone_number, "text": {"body": message}}
+
+
+class ClienteWhatsApp(_ClienteBase):
+    def __init__(self, access_token, phone_number_id, url_base="https://graph.facebook.com/v18.0",
+                 timeout=10, tentativas=4, backoff=0.5, backoff_maximo=8, concorrencia=8):
+        super().__init__(access_token, phone_number_id, url_base, timeout, tentativas, backoff, backoff_maximo)
+
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=concorrencia, pool_maxsize=concorrencia)
+        self.sessao.mount("https://", adaptador)
+        self.sessao.mount("http://", adaptador)
+
+        self._executor = ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix="envio")
+        self._travas_numeros = [threading.Lock() for _ in range(NUM_TRAVAS_NUMEROS)]
+
+    def _lock_do_numero(self, phone_number):
+        return self._travas_numeros[hash(phone_number) % NUM_TRAVAS_NUMEROS]
+
+    def enviar(self, phone_number, message):
+        """Envia uma mensagem de texto, repetindo em 429/5xx e falhas de rede. Devolve True se foi aceite."""
+        import requests
+        data = self._corpo(phone_number, message)
+        for tentativa in range(self.tentativas):
+            response = None
+            inicio = time.perf_counter()
+            try:
+                response = self.sessao.post(self.url, json=data, headers=self.headers, timeout=self.timeout)
+                observar('lalabank_whatsapp_segundos', time.perf_counter() - inicio)
+                incrementar('lalabank_whatsapp_respostas_total', estado=response.status_code)
+                if response.status_code not in STATUS_REPETIR:
+                    response.raise_for_status()
+                    return True
+                erro = f"HTTP {response.status_code}"
+            except requests.exceptions.HTTPError as e:
+                # 4xx que não vale a pena repetir (token inválido, número errado...)
+                print(f"❌ Erro ao enviar mensagem: {e}")
+                print(f"Resposta recebida: {e.response.text if e.response is not None else 'Nenhuma resposta'}")
+                return False
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                observar('lalabank_whatsapp_segundos', time.perf_counter() - inicio)
+                incrementar('lalabank_whatsapp_respostas_total', estado='erro_rede')
+                erro = str(e)
+            except requests.exceptions.RequestException as e:
+                # URL inválido, redirecionamentos a mais...: repetir não resolve
+                incrementar('lalabank_whatsapp_respostas_total', estado='erro_pedido')
+                print(f"❌ Erro ao enviar mensagem para {phone_number}: {e}")
+                return False
+
+            if tentativa < self.tentativas - 1:
+                time.sleep(self._espera(tentativa, response))
+        print(f"❌ Erro ao enviar mensagem para {phone_number} após {self.tentativas} tentativas: {erro}")
+        return False
+
+    def enviar_varias(self, phone_number, mensagens):
+        """Envia as mensagens pela ordem; pára na primeira que falhar para não chegarem fora de ordem."""
+        with self._lock_do_numero(phone_number):
+            for message in mensagens:
+                if not self.enviar(phone_number, message):
+                    return False
+        return True
+
+    def enviar_lote(self, envios):
+        """
+        Envia [(phone_number, [mensagens]), ...] em paralelo entre números diferentes.
+        Devolve a lista de resultados (True/False) na mesma ordem.
+        """
+        agrupados = {}
+        for phone_number, mensagens in envios:
+            agrupados.setdefault(phone_number, []).extend(mensagens)
+        futuros = {phone: self._executor.submit(self.enviar_varias, phone, msgs) for phone, msgs in agrupados.items()}
+        return [futuros[phone_number].result() for phone_number, _ in envios]
+
+
+class ClienteWhatsAppAssincrono(_ClienteBase):
+    """Como ClienteWhatsApp, com corrotinas; deve ser usado sempre no mesmo event loop (ver get_cliente_assincrono)."""
+
+    def __init__(self, access_token, phone_number_id, url_base="https://graph.facebook.com/v18.0",
+                 timeout=10, tentativas=4, backoff=0.5, backoff_maximo=8, concorrencia=256):
+        super().__init__(access_token, phone_number_id, url_base, timeout, tentativas, backoff, backoff_maximo)
+        import asyncio
+        self.loop = asyncio.get_running_loop()
+        self.concorrencia = concorrencia
+        self._sessao = None
+        self._travas_numeros = [asyncio.Lock() for _ in range(NUM_TRAVAS_NUMEROS)]
+
+    def _get_sessao(self):
+        # Criada no primeiro envio, já dentro do loop. Os pedidos à espera de uma
+        # conexão livre não contam para os timeouts, só a ligação e a leitura.
+        if self._sessao is None:
+            import aiohttp
+            self._sessao = aiohttp.ClientSession(
+                headers=self.headers, connector=aiohttp.TCPConnector(limit=self.concorrencia),
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout[0], sock_read=self.timeout[1]),
+            )
+        return self._sessao
+
+    async def enviar(self, phone_number, message):
+        """Envia uma mensagem de texto, repetindo em 429/5xx e falhas de rede. Devolve True se foi aceite."""
+        import asyncio
+        import aiohttp
+        sessao = self._get_sessao()
+        data = self._corpo(phone_number, message)
+        for tentativa in range(self.tentativas):
+            response = None
+            inicio = time.perf_counter()
+            try:
+                async with sessao.post(self.url, json=data) as response:
+                    observar('lalabank_whatsapp_segundos', time.perf_counter() - inicio)
+                    incrementar('lalabank_whatsapp_respostas_total', estado=response.status)
+                    if response.status not in STATUS_REPETIR:
+                        if response.status < 400:
+                            return True
+                        # 4xx que não vale a pena repetir (token inválido, número errado...)
+                        print(f"❌ Erro ao enviar mensagem: HTTP {response.status}")
+                        print(f"Resposta recebida: {await response.text()}")
+                        return False
+                    erro = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                observar('lalabank_whatsapp_segundos', time.perf_counter() - inicio)
+                incrementar('lalabank_whatsapp_respostas_total', estado='erro_rede')
+                erro = str(e) or type(e).__name__
+
+            if tentativa < self.tentativas - 1:
+                await asyncio.sleep(self._espera(tentativa, response))
+        print(f"❌ Erro ao enviar mensagem para {phone_number} após {self.tentativas} tentativas: {erro}")
+        return False
+
+    async def enviar_varias(self, phone_number, mensagens):
+        """Envia as mensagens pela ordem; pára na primeira que falhar para não chegarem fora de ordem."""
+        async with self._travas_numeros[hash(phone_number) % NUM_TRAVAS_NUMEROS]:
+            for message in mensagens:
+                if not await self.enviar(phone_number, message):
+                    return False
+        return True
+
+    async def enviar_lote(self, envios):
+        """Envia [(phone_number, [mensagens]), ...] em simultâneo entre números diferentes; resultados pela mesma ordem."""
+        import asyncio
+        agrupados = {}
+        for phone_number, mensagens in envios:
+            agrupados.setdefault(phone_number, []).extend(mensagens)
+        resultados = dict(zip(agrupados, await asyncio.gather(
+            *(self.enviar_varias(phone, msgs) for phone, msgs in agrupados.items())
+        )))
+        return [resultados[phone_number] for phone_number, _ in envios]
+
+    async def fechar(self):
+        if self._sessao is not None:
+            await self._sessao.close()
+            self._sessao = None
+
+
+_cliente = None
+_cliente_lock = threading.Lock()
+
+def _configuracao():
+    return dict(
+        access_token=os.environ.get("ACCESS_TOKEN"), phone_number_id=os.environ.get("PHONE_NUMBER_ID"),
+        url_base=os.environ.get("WHATSAPP_API_URL", "https://graph.facebook.com/v18.0"),
+        timeout=float(os.environ.get("WHATSAPP_TIMEOUT", 10)),
+        tentativas=int(os.environ.get("WHATSAPP_TENTATIVAS", 4)),
+    )
+
+def get_cliente():
+    global _cliente
+    with _cliente_lock:
+        if _cliente is None:
+            _cliente = ClienteWhatsApp(**_configuracao(), concorrencia=int(os.environ.get("WHATSAPP_CONCORRENCIA", 8)))
+    return _cliente
+
+_cliente_assincrono = None
+
+def get_cliente_assincrono():
+    """Cliente assíncrono do event loop atual; chamado dentro de uma corrotina."""
+    global _cliente_assincrono
+    import asyncio
+    if _cliente_assincrono is None or _cliente_assincrono.loop is not asyncio.get_running_loop():
+        _cliente_assincrono = ClienteWhatsAppAssincrono(
+            **_configuracao(), concorrencia=int(os.environ.get("WHATSAPP_CONCORRENCIA_ASSINCRONA", 256))
+        )
+    return _cliente_assincrono